@@ -333,8 +333,12 @@ def app(environ, start_response):
 	resp = webob.Response()
 	handler = request.BrowseHandler(req, resp)
 	request.current.setRequest(handler)
-	handler.processRequest()
-	request.current.setRequest(None)
+	try:
+		handler.processRequest()
+	finally:
+		# Don't leave this request or its session behind for the next one handled by this thread
+		request.current.setRequest(None)
+		session.current.unload()
 	return resp(environ, start_response)
 
 
@@ -5,6 +5,8 @@ from viur.core import db
 import logging
 import hashlib
 import copy
+import threading
+import weakref
 from enum import Enum
 from dataclasses import dataclass
 from typing import Union, List
@@ -25,6 +27,37 @@ def getSystemInitialized():
 	return __systemIsIntitialized_
 
 
+_skelViews = threading.local()  # Per thread: WeakKeyDictionary template skeleton -> this thread's instance
+
+
+def getSkelView(template):
+	"""
+		Returns this thread's instance of the given (ref- or using-) skeleton.
+
+		Bones like relationalBone re-bind one skeleton instance to each value they're working on. These
+		instances must not be shared across threads, so each thread gets its own, lightweight one: it shares
+		the boneMap with *template* and only holds its own valuesCache. Instances are created once per
+		thread and released together with their template.
+
+		:param template: The skeleton instance created by that bone
+		:type template: server.skeleton.BaseSkeleton
+		:returns: An instance of the same class and bones, used only by the current thread
+		:rtype: server.skeleton.BaseSkeleton
+	"""
+	if template is None:
+		return None
+	try:
+		views = _skelViews.views
+	except AttributeError:
+		views = _skelViews.views = weakref.WeakKeyDictionary()
+	view = views.get(template)
+	if view is None:
+		view = type(template)()
+		view.boneMap = template.boneMap
+		views[template] = view
+	return view
+
+
 class ReadFromClientErrorSeverity(Enum):
 	NotSet = 0
 	InvalidatesOther = 1
@@ -373,6 +406,38 @@ class baseBone(object):  # One Bone:
 		"""
 		pass
 
+	def postSavedHandlerMulti(self, skels, boneName, keys):
+		"""
+			Called by :func:`server.skeleton.Skeleton.toDBMulti` once all entities of that batch have been
+			written. By default, postSavedHandler is called for each of them; can be overridden to handle
+			the whole batch at once.
+
+			:param skels: The skeletons that have been written
+			:type skels: list of Skeleton
+			:param boneName: Name of this bone
+			:type boneName: str
+			:param keys: The Database Keys we've written to (in the same order as *skels*)
+			:type keys: list of db.Key
+		"""
+		for skel, key in zip(skels, keys):
+			self.postSavedHandler(skel, boneName, key)
+
+	def postDeletedHandlerMulti(self, skels, boneName, keys):
+		"""
+			Called by :func:`server.skeleton.Skeleton.deleteMulti` once all entities of that batch have been
+			deleted. By default, postDeletedHandler is called for each of them; can be overridden to handle
+			the whole batch at once.
+
+			:param skels: The skeletons that have been deleted
+			:type skels: list of Skeleton
+			:param boneName: Name of this bone
+			:type boneName: str
+			:param keys: The old Database Keys of the deleted entities (in the same order as *skels*)
+			:type keys: list of db.Key
+		"""
+		for skel, key in zip(skels, keys):
+			self.postDeletedHandler(skel, boneName, key)
+
 	def refresh(self, skeletonValues, boneName, skel) -> None:
 		"""
 			Refresh all values we might have cached from other entities.
@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from viur.core.bones.bone import baseBone, getSystemInitialized
+from viur.core.bones.bone import baseBone, getSystemInitialized, getSkelView
 from viur.core.bones.bone import ReadFromClientError, ReadFromClientErrorSeverity
 from typing import List
 import copy
@@ -17,13 +17,20 @@ class recordBone(baseBone):
 			raise NotImplementedError("A recordBone must not be indexed, must be multiple and must have a format set")
 
 		if getSystemInitialized():
-			self._usingSkelCache = using()
+			self._usingSkelTemplate = using()
 		else:
-			self._usingSkelCache = None
+			self._usingSkelTemplate = None
 
 	def setSystemInitialized(self):
 		super(recordBone, self).setSystemInitialized()
-		self._usingSkelCache = self.using()
+		self._usingSkelTemplate = self.using()
+
+	@property
+	def _usingSkelCache(self):
+		"""
+			This thread's instance of our using-skeleton, see :func:`server.bones.bone.getSkelView`.
+		"""
+		return getSkelView(self._usingSkelTemplate)
 
 	def _restoreValueFromDatastore(self, val):
 		"""
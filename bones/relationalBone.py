@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 from viur.core.bones import baseBone
-from viur.core.bones.bone import getSystemInitialized
+from viur.core.bones.bone import getSystemInitialized, getSkelView
 from viur.core import db
 from viur.core.errors import ReadFromClientError
 # from google.appengine.api import search
@@ -25,6 +25,12 @@ class RelationalConsistency(Enum):
 	CascadeDeletion = 4  # Delete this object also if the referenced entry is deleted (Dangerous!)
 
 
+class RelationalRefresh(Enum):
+	Never = 1  # Keep the values copied from the referenced entry (unless they're updated by updateRelations)
+	OnSave = 2  # Refresh the copied values each time the referencing entry is saved
+	OnRead = 3  # Also refresh them when the referencing entry is read, if they're older than refreshTTL seconds
+
+
 class relationalBone(baseBone):
 	"""
 		This is our magic class implementing relations.
@@ -59,7 +65,8 @@ class relationalBone(baseBone):
 	kind = None
 
 	def __init__(self, kind=None, module=None, refKeys=None, parentKeys=None, multiple=False, format="$(dest.name)",
-				 using=None, updateLevel=0, consistency=RelationalConsistency.Ignore, *args, **kwargs):
+				 using=None, updateLevel=0, consistency=RelationalConsistency.Ignore,
+				 refreshPolicy=RelationalRefresh.Never, refreshTTL=300, indexRefKeys=False, paged=False, *args, **kwargs):
 		"""
 			Initialize a new relationalBone.
 
@@ -85,6 +92,24 @@ class relationalBone(baseBone):
 			:param updateLevel: level 0==always update refkeys (old behavior), 1==update refKeys only on
 				rebuildSearchIndex, 2==update only if explicitly set
 			:type updateLevel: int
+			:param refreshPolicy: Defines when the values copied from the referenced entities are refreshed
+				(in addition to updates made by updateRelations and rebuildSearchIndex)
+			:type refreshPolicy: RelationalRefresh
+			:param refreshTTL: Maximum age (in seconds) of the values when using RelationalRefresh.OnRead.
+				Older values are refreshed when read and written back by a deferred task
+				(see :func:`server.skeleton.refreshRelations`).
+			:type refreshTTL: int
+			:param indexRefKeys: If True (and multiple is set), the refKeys of all referenced entities are also
+				written as indexed list-properties (name_dest_property) onto the referencing entity. Filtering by
+				one of these properties will then run as a native query on our own kind instead of being rewritten
+				to viur-relations. Queries filtering by more than one of them (or combined with other relational
+				filters or sort orders) still use viur-relations, so all filters match the same referenced entity.
+			:type indexRefKeys: bool
+			:param paged: If True (and multiple is set), the references are only stored as entries in viur-relations
+				instead of being inlined into the referencing entity. Use getReferences, addReferences and
+				removeReferences to access them; values submitted by the client or assigned to that bone are
+				ignored. Intended for bones holding thousands of references.
+			:type paged: bool
 		"""
 		baseBone.__init__(self, *args, **kwargs)
 		self.multiple = multiple
@@ -115,20 +140,41 @@ class relationalBone(baseBone):
 		self.using = using
 		self.updateLevel = updateLevel
 		self.consistency = consistency
+		self.refreshPolicy = refreshPolicy
+		self.refreshTTL = refreshTTL
+		self.indexRefKeys = indexRefKeys
+		if paged and (not multiple or indexRefKeys or consistency == RelationalConsistency.PreventDeletion):
+			raise AttributeError("paged requires multiple=True and can't be used together with indexRefKeys or "
+								 "RelationalConsistency.PreventDeletion")
+		self.paged = paged
 
 		if getSystemInitialized():
 			from viur.core.skeleton import RefSkel, skeletonByKind
-			self._refSkelCache = RefSkel.fromSkel(skeletonByKind(self.kind), *self.refKeys)
-			self._usingSkelCache = using() if using else None
+			self._refSkelTemplate = RefSkel.fromSkel(skeletonByKind(self.kind), *self.refKeys)
+			self._usingSkelTemplate = using() if using else None
 		else:
-			self._refSkelCache = None
-			self._usingSkelCache = None
+			self._refSkelTemplate = None
+			self._usingSkelTemplate = None
 
 	def setSystemInitialized(self):
 		super(relationalBone, self).setSystemInitialized()
 		from viur.core.skeleton import RefSkel, skeletonByKind
-		self._refSkelCache = RefSkel.fromSkel(skeletonByKind(self.kind), *self.refKeys)
-		self._usingSkelCache = self.using() if self.using else None
+		self._refSkelTemplate = RefSkel.fromSkel(skeletonByKind(self.kind), *self.refKeys)
+		self._usingSkelTemplate = self.using() if self.using else None
+
+	@property
+	def _refSkelCache(self):
+		"""
+			This thread's instance of our RefSkel, see :func:`server.bones.bone.getSkelView`.
+		"""
+		return getSkelView(self._refSkelTemplate)
+
+	@property
+	def _usingSkelCache(self):
+		"""
+			This thread's instance of our using-skeleton (if any), see :func:`server.bones.bone.getSkelView`.
+		"""
+		return getSkelView(self._usingSkelTemplate)
 
 	def _restoreValueFromDatastore(self, val):
 		"""
@@ -158,6 +204,8 @@ class relationalBone(baseBone):
 		return {"dest": relSkel.getValuesCache(), "rel": usingData}
 
 	def unserialize(self, skeletonValues, name):
+		if self.paged:  # Our values are not stored in that entity
+			return False
 		if name in skeletonValues.entity:
 			val = skeletonValues.entity[name]
 			if self.multiple:
@@ -199,11 +247,14 @@ class relationalBone(baseBone):
 			return False
 
 	def serialize(self, skeletonValues, name):
-		oldRelationalLocks = set(skeletonValues.entity.get("%s_outgoingRelationalLocks" % name) or [])
+		if self.paged:  # Our values are written to viur-relations by postSavedHandlerMulti
+			if name in skeletonValues.entity:
+				del skeletonValues.entity[name]
+			return True
 		newRelationalLocks = set()
 		# Clean old properties from entry (prevent name collision)
 		for k in list(skeletonValues.entity.keys()):
-			if k.startswith("%s." % name):
+			if k.startswith("%s." % name) or (self.indexRefKeys and k.startswith("%s_dest_" % name)):
 				del skeletonValues.entity[k]
 		if name not in skeletonValues.accessedValues or not skeletonValues.accessedValues[name]:
 			skeletonValues.entity[name] = None
@@ -216,7 +267,7 @@ class relationalBone(baseBone):
 					if val["dest"]:
 						refSkel.setValuesCache(val["dest"])
 						refData = refSkel.serialize()
-						newRelationalLocks.add(refData["key"])
+						newRelationalLocks.add(refSkel["key"])
 					else:
 						refData = None
 					if usingSkel and val["rel"]:
@@ -227,6 +278,8 @@ class relationalBone(baseBone):
 					r = {"rel": usingData, "dest": refData}
 					res.append(r)
 				skeletonValues.entity[name] = res
+				if self.indexRefKeys:
+					skeletonValues.entity.update(self._buildRefKeyIndex(name, res))
 			else:
 				refSkel = self._refSkelCache
 				usingSkel = self._usingSkelCache
@@ -257,114 +310,280 @@ class relationalBone(baseBone):
 		if self.consistency != RelationalConsistency.PreventDeletion:
 			# We don't need to lock anything, but may delete old locks held
 			newRelationalLocks = set()
-		# We should always run inside a transaction so we can safely get+put
+		# The lock-objects itself are created and released by Skeleton.toDB
 		skeletonValues.entity["%s_outgoingRelationalLocks" % name] = list(newRelationalLocks)
-		for newLock in newRelationalLocks - oldRelationalLocks:
-			# Lock new Entry
-			referencedObj = db.Get(db.Key(self.kind, newLock))
-			assert referencedObj, "Programming error detected?"
-			if not referencedObj.get("viur_incomming_relational_locks"):
-				referencedObj["viur_incomming_relational_locks"] = []
-			assert skeletonValues.entity.name not in referencedObj["viur_incomming_relational_locks"]
-			referencedObj["viur_incomming_relational_locks"].append(skeletonValues.entity.name)
-			db.Put(referencedObj)
-		for oldLock in oldRelationalLocks - newRelationalLocks:
-			# Remove Lock
-			referencedObj = db.Get(db.Key(self.kind, oldLock))
-			assert referencedObj, "Programming error detected?"
-			assert isinstance(referencedObj.get("viur_incomming_relational_locks"), list), "Programming error detected?"
-			assert skeletonValues.entity.name in referencedObj["viur_incomming_relational_locks"], "Programming error detected?"
-			referencedObj["viur_incomming_relational_locks"].remove(skeletonValues.entity.name)
-			db.Put(referencedObj)
 		return True
 
-	def postSavedHandler(self, skel, boneName, key):
-		if not skel[boneName]:
-			values = []
-		elif isinstance(skel[boneName], dict):
-			values = [dict((k, v) for k, v in skel[boneName].items())]
-		else:
-			values = [dict((k, v) for k, v in x.items()) for x in skel[boneName]]
+	def _buildRefKeyIndex(self, name, values):
+		"""
+			Builds the denormalized properties written if indexRefKeys is set.
+			For each refKey, the values of all referenced entities are collected into one list-property,
+			so the datastore can match any of them in a native equality filter.
 
-		parentValues = db.Entity()
-		srcEntity = skel.getValuesCache().entity
-		parentValues.key = srcEntity.key
-		for boneKey in (self.parentKeys or []):
-			parentValues[boneKey] = srcEntity.get(boneKey)
+			:param name: Name of this bone in its skeleton
+			:param values: The serialized values of this bone (list of {"dest": ..., "rel": ...})
+			:returns: Dict of property name -> list of values
+		"""
+		res = {"%s_dest_key" % name: []}
+		for val in values:
+			refData = val["dest"]
+			if not refData:
+				continue
+			if getattr(refData, "key", None) is not None:
+				res["%s_dest_key" % name].append(refData.key)
+			for k, v in refData.items():
+				propName = "%s_dest_%s" % (name, k)
+				if propName not in res:
+					res[propName] = []
+				for x in (v if isinstance(v, list) else [v]):
+					if isinstance(x, dict) and not isinstance(x, db.Entity):
+						e = db.Entity()
+						e.update(x)
+						x = e
+					res[propName].append(x)
+		return res
+
+	def _relationPayload(self, value):
+		"""
+			Converts a value stored in viur-relations into something hashable that can be compared
+			with the payload we're about to write.
+		"""
+		if isinstance(value, db.Entity):
+			return value.key, tuple(sorted(((k, self._relationPayload(v)) for k, v in value.items()), key=lambda x: x[0]))
+		elif isinstance(value, dict):
+			return tuple(sorted(((k, self._relationPayload(v)) for k, v in value.items()), key=lambda x: x[0]))
+		elif isinstance(value, list):
+			return tuple([self._relationPayload(x) for x in value])
+		return value
 
-		dbVals = db.Query("viur-relations")  # skel.kindName+"_"+self.kind+"_"+key
-		dbVals.filter("viur_src_kind =", skel.kindName)
-		dbVals.filter("viur_dest_kind =", self.kind)
-		dbVals.filter("viur_src_property =", boneName)
-		dbVals.filter("src.__key__ =", key)
+	def postSavedHandler(self, skel, boneName, key):
+		self.postSavedHandlerMulti([skel], boneName, [key])
 
-		for dbObj in dbVals.iter():
-			try:
-				if not dbObj["dest"].key in [x["dest"].entity.key for x in values]:  # Relation has been removed
-					db.Delete(dbObj.key)
+	def postSavedHandlerMulti(self, skels, boneName, keys):
+		"""
+			Synchronizes the viur-relations entries of the given skeletons with their current values.
+
+			The entries we should have are indexed by the key they're referencing and matched against
+			the existing ones. Entries whose payload did not change are left untouched; all new, updated and
+			removed entries of that batch are written with one Put and one Delete.
+		"""
+		refSkel = self._refSkelCache
+		usingSkel = self._usingSkelCache
+		putList = []
+		deleteList = []
+		if self.paged:  # Our references are only changed by addReferences and removeReferences
+			return
+		for skel, key in zip(skels, keys):
+			if not skel[boneName]:
+				values = []
+			elif isinstance(skel[boneName], dict):
+				values = [skel[boneName]]
+			else:
+				values = skel[boneName]
+
+			parentValues = db.Entity()
+			srcEntity = skel.getValuesCache().entity
+			parentValues.key = srcEntity.key
+			for boneKey in (self.parentKeys or []):
+				parentValues[boneKey] = srcEntity.get(boneKey)
+
+			# Build the payload of each entry, indexed by the referenced key
+			requestedEntries = {}
+			for val in values:
+				if not val["dest"]:
 					continue
-			except:  # This entry is corrupt
-				db.Delete(dbObj.key)
-			else:  # Relation: Updated
-				data = [x for x in values if x["dest"].entity.key == dbObj["dest"].key][0]
-				# Write our (updated) values in
-				refSkel = self._refSkelCache
-				refSkel.setValuesCache(data["dest"])
-				dbObj["dest"] = refSkel.serialize()
-				# for k, v in refSkel.serialize().items():
-				#	dbObj["dest_" + k] = v
-				# for k, v in parentValues.items():
-				#	dbObj["src_" + k] = v
-				dbObj["src"] = parentValues
+				refSkel.setValuesCache(val["dest"])
+				entry = {
+					"dest": refSkel.serialize(),
+					"src": parentValues,
+					"viur_relational_updateLevel": self.updateLevel,
+					"viur_relational_consistency": self.consistency.value,
+					"viur_foreign_keys": self.refKeys
+				}
 				if self.using is not None:
-					usingSkel = self._usingSkelCache
-					usingSkel.setValuesCache(data["rel"])
-					# for k, v in usingSkel.serialize().items():
-					#	dbObj["rel." + k] = v
-					dbObj["rel"] = usingSkel.serialize()
+					usingSkel.setValuesCache(val["rel"])
+					entry["rel"] = usingSkel.serialize()
+				requestedEntries[refSkel["key"]] = entry
+
+			dbVals = db.Query("viur-relations")  # skel.kindName+"_"+self.kind+"_"+key
+			dbVals.filter("viur_src_kind =", skel.kindName)
+			dbVals.filter("viur_dest_kind =", self.kind)
+			dbVals.filter("viur_src_property =", boneName)
+			dbVals.filter("src.__key__ =", key)
+			for dbObj in dbVals.iter():
+				destKey = dbObj["dest"].key if isinstance(dbObj.get("dest"), db.Entity) else None
+				if destKey not in requestedEntries:  # Relation has been removed (or this entry is corrupt/a duplicate)
+					deleteList.append(dbObj.key)
+					continue
+				entry = requestedEntries.pop(destKey)
+				if all([self._relationPayload(dbObj.get(k)) == self._relationPayload(v) for k, v in entry.items()]):
+					continue  # Nothing changed
+				dbObj.update(entry)
+				dbObj["viur_delayed_update_tag"] = time()
+				putList.append(dbObj)
+
+			# Add any new Relation
+			for destKey, entry in requestedEntries.items():
+				dbObj = db.Entity(db.Key("viur-relations"))  # skel.kindName+"_"+self.kind+"_"+key
+				dbObj.update(entry)
 				dbObj["viur_delayed_update_tag"] = time()
-				dbObj["viur_relational_updateLevel"] = self.updateLevel
-				dbObj["viur_relational_consistency"] = self.consistency.value
-				dbObj["viur_foreign_keys"] = self.refKeys
-				db.Put(dbObj)
-				values.remove(data)
+				dbObj["viur_src_kind"] = skel.kindName  # The kind of the entry referencing
+				dbObj["viur_src_property"] = boneName  # The key of the bone referencing
+				dbObj["viur_dest_kind"] = self.kind
+				putList.append(dbObj)
+		for idx in range(0, len(putList), 500):  # The datastore accepts up to 500 entities per request
+			db.Put(putList[idx: idx + 500])
+		for idx in range(0, len(deleteList), 500):
+			db.Delete(deleteList[idx: idx + 500])
+
+	def postDeletedHandler(self, skel, boneName, key):
+		self.postDeletedHandlerMulti([skel], boneName, [key])
+
+	def postDeletedHandlerMulti(self, skels, boneName, keys):
+		deleteList = []
+		for skel, key in zip(skels, keys):
+			dbVals = db.Query("viur-relations").setKeysOnly()  # skel.kindName+"_"+self.kind+"_"+key
+			dbVals.filter("viur_src_kind =", skel.kindName)
+			dbVals.filter("viur_dest_kind =", self.kind)
+			dbVals.filter("viur_src_property =", boneName)
+			dbVals.filter("src.__key__ =", key)
+			deleteList.extend([x.key for x in dbVals.iter()])
+		for idx in range(0, len(deleteList), 500):
+			db.Delete(deleteList[idx: idx + 500])
+
+	def _pagedEntryKey(self, srcKey, boneName, destKey):
+		"""
+			Returns the key of the viur-relations entry a paged bone uses to store the reference from
+			*srcKey* to *destKey*, so it can be added or removed without looking it up first.
+		"""
+		return db.Key("viur-relations", "%s_%s_%s" % (srcKey.to_legacy_urlsafe().decode("ASCII"), boneName,
+													   destKey.to_legacy_urlsafe().decode("ASCII")))
+
+	def getReferences(self, srcKey, boneName, cursor=None, amount=100):
+		"""
+			Returns one page of the references of a paged bone, ordered by the key of their viur-relations entry.
+
+			:param srcKey: Key of the entity holding that bone
+			:type srcKey: db.Key
+			:param boneName: Our name in its skeleton
+			:type boneName: str
+			:param cursor: Cursor returned for the previous page
+			:type cursor: str
+			:param amount: Maximum number of references to return
+			:type amount: int
+			:returns: Tuple of (list of values in the format used by skel[boneName], cursor for the next page or None)
+		"""
+		assert self.paged, "getReferences is only available for bones using paged=True"
+		query = db.Query("viur-relations")
+		query.filter("viur_src_kind =", srcKey.kind)
+		query.filter("viur_dest_kind =", self.kind)
+		query.filter("viur_src_property =", boneName)
+		query.filter("src.__key__ =", srcKey)
+		query.setCursor(cursor)
+		entries = query.run(limit=amount)
+		res = [self._restoreValueFromDatastore({"dest": x["dest"], "rel": x.get("rel")}) for x in entries]
+		newCursor = query.getCursor() if len(entries) == amount else None
+		if isinstance(newCursor, bytes):
+			newCursor = newCursor.decode("ASCII")
+		return res, newCursor
+
+	def addReferences(self, srcKey, boneName, values):
+		"""
+			Adds references to a paged bone. Existing references are left untouched (or updated, if they
+			reference the same entity again).
 
-		# Add any new Relation
+			:param srcKey: Key of the entity holding that bone
+			:type srcKey: db.Key
+			:param boneName: Our name in its skeleton
+			:type boneName: str
+			:param values: Keys of the entities to reference. If this bone has a using-skeleton,
+				(key, dict of using-values) tuples can be passed instead.
+			:type values: list
+		"""
+		assert self.paged, "addReferences is only available for bones using paged=True"
+		srcEntity = db.Get(srcKey)
+		if not srcEntity:
+			raise ValueError("The entity %s is not in the database (anymore?)!" % str(srcKey))
+		parentValues = db.Entity()
+		parentValues.key = srcKey
+		for boneKey in (self.parentKeys or []):
+			parentValues[boneKey] = srcEntity.get(boneKey)
+		destKeys = []
+		usingValues = {}
 		for val in values:
-			dbObj = db.Entity(db.Key("viur-relations"))  # skel.kindName+"_"+self.kind+"_"+key
-			refSkel = self._refSkelCache
-			refSkel.setValuesCache(val["dest"])
-			dbObj["dest"] = refSkel.serialize()
-			# for k, v in refSkel.serialize().items():
-			#	dbObj["dest_" + k] = v
-			# for k, v in parentValues.items():
-			#	dbObj["src_" + k] = v
-			dbObj["src"] = parentValues
-			if self.using is not None:
-				usingSkel = self._usingSkelCache
-				usingSkel.setValuesCache(val["rel"])
-				# for k, v in usingSkel.serialize().items():
-				#	dbObj["rel_" + k] = v
+			if isinstance(val, tuple):
+				destKey = db.keyHelper(val[0], self.kind)
+				usingValues[destKey] = val[1]
+			else:
+				destKey = db.keyHelper(val, self.kind)
+			destKeys.append(destKey)
+		refSkel = self._refSkelCache
+		usingSkel = self._usingSkelCache
+		putList = []
+		for destKey, destEntity in zip(destKeys, db.Get(destKeys)):
+			if not destEntity:
+				logging.warning("Not adding a reference to %s as it does not exist" % str(destKey))
+				continue
+			refSkel.unserialize(destEntity)
+			for key in refSkel.keys():
+				refSkel[key]  # Load each value, we'll drop all other properties of that entity below
+			refSkel.getValuesCache().entity = db.Entity(destKey)
+			dbObj = db.Entity(self._pagedEntryKey(srcKey, boneName, destKey))
+			dbObj.update({
+				"dest": refSkel.serialize(),
+				"src": parentValues,
+				"viur_relational_updateLevel": self.updateLevel,
+				"viur_relational_consistency": self.consistency.value,
+				"viur_foreign_keys": self.refKeys,
+				"viur_delayed_update_tag": time(),
+				"viur_src_kind": srcKey.kind,
+				"viur_src_property": boneName,
+				"viur_dest_kind": self.kind
+			})
+			if usingSkel:
+				usingSkel.unserialize(dict(usingValues.get(destKey) or {}))
+				for key in usingSkel.keys():
+					usingSkel[key]
 				dbObj["rel"] = usingSkel.serialize()
+			putList.append(dbObj)
+		for idx in range(0, len(putList), 500):
+			db.Put(putList[idx: idx + 500])
 
-			dbObj["viur_delayed_update_tag"] = time()
-			dbObj["viur_src_kind"] = skel.kindName  # The kind of the entry referencing
-			# dbObj[ "viur_src_key" ] = str( key ) #The key of the entry referencing
-			dbObj["viur_src_property"] = boneName  # The key of the bone referencing
-			# dbObj[ "viur_dest_key" ] = val["key"]
-			dbObj["viur_dest_kind"] = self.kind
-			dbObj["viur_relational_updateLevel"] = self.updateLevel
-			dbObj["viur_relational_consistency"] = self.consistency.value
-			dbObj["viur_foreign_keys"] = self.refKeys
-			db.Put(dbObj)
+	def removeReferences(self, srcKey, boneName, destKeys):
+		"""
+			Removes references from a paged bone without touching the remaining ones.
 
-	def postDeletedHandler(self, skel, boneName, key):
-		dbVals = db.Query("viur-relations")  # skel.kindName+"_"+self.kind+"_"+key
-		dbVals.filter("viur_src_kind =", skel.kindName)
-		dbVals.filter("viur_dest_kind =", self.kind)
-		dbVals.filter("viur_src_property =", boneName)
-		dbVals.filter("src.key =", key)
-		db.Delete([x for x in dbVals.run(keysOnly=True)])
+			:param srcKey: Key of the entity holding that bone
+			:type srcKey: db.Key
+			:param boneName: Our name in its skeleton
+			:type boneName: str
+			:param destKeys: Keys of the referenced entities to remove
+			:type destKeys: list of db.Key
+		"""
+		assert self.paged, "removeReferences is only available for bones using paged=True"
+		deleteList = [self._pagedEntryKey(srcKey, boneName, db.keyHelper(x, self.kind)) for x in destKeys]
+		for idx in range(0, len(deleteList), 500):
+			db.Delete(deleteList[idx: idx + 500])
+
+	def refreshPagedReferences(self, entries, destEntity):
+		"""
+			Updates the values copied from *destEntity* into the given viur-relations entries of a paged bone.
+
+			:param entries: The viur-relations entries referencing *destEntity*
+			:type entries: list of db.Entity
+			:param destEntity: The current version of the referenced entity
+			:type destEntity: db.Entity
+		"""
+		refSkel = self._refSkelCache
+		refSkel.unserialize(destEntity)
+		for key in refSkel.keys():
+			refSkel[key]
+		refSkel.getValuesCache().entity = db.Entity(destEntity.key)
+		refData = refSkel.serialize()
+		for entry in entries:
+			entry["dest"] = refData
+			entry["viur_delayed_update_tag"] = time()
+		db.Put(entries)
 
 	def isInvalid(self, key):
 		return False
@@ -385,6 +604,8 @@ class relationalBone(baseBone):
 			:returns: None or String
 		"""
 		# return [ReadFromClientError(ReadFromClientErrorSeverity.Invalid, name, "Not yet fixed")]
+		if self.paged:  # Our references can only be changed by addReferences and removeReferences
+			return None
 		if not name in data and not any(x.startswith("%s." % name) for x in data):
 			return [ReadFromClientError(ReadFromClientErrorSeverity.NotSet, name, "Field not submitted")]
 
@@ -436,13 +657,21 @@ class relationalBone(baseBone):
 		forceFail = False
 		if not tmpList and self.required:
 			return "No value selected!"
+		# Fetch all referenced entities using one batched request
+		requestedKeys = {}
+		for r in tmpList:
+			try:
+				requestedKeys[r["dest"]["key"]] = db.keyHelper(r["dest"]["key"], self.kind)
+			except:  # Invalid key or something like that; handled below
+				continue
+		fetchedEntries = dict(zip(requestedKeys.keys(), db.Get(list(requestedKeys.values()))))
 		for r in tmpList[:]:
 			# Rebuild the referenced entity data
 			isEntryFromBackup = False  # If the referenced entry has been deleted, restore information from
 			entry = None
 
 			try:
-				entry = db.Get(db.keyHelper(r["dest"]["key"], self.kind))
+				entry = fetchedEntries[r["dest"]["key"]]
 				assert entry
 			except:  # Invalid key or something like that
 				logging.info("Invalid reference key >%s< detected on bone '%s'",
@@ -591,6 +820,19 @@ class relationalBone(baseBone):
 			dbFilter.order(*orderList)
 		return name, skel, dbFilter, rawFilter
 
+	def _hasOtherRelationalQuery(self, name, skel, rawFilter):
+		"""
+			Checks if *rawFilter* filters by another multiple relationalBone of *skel*, or is sorted by
+			any multiple relationalBone (both rewrite the query to viur-relations).
+		"""
+		def isRelational(boneName):
+			return isinstance(skel.boneMap.get(boneName), relationalBone) and skel.boneMap[boneName].multiple
+
+		orderby = rawFilter.get("orderby")
+		if isinstance(orderby, str) and "." in orderby and isRelational(orderby.split(".")[0]):
+			return True
+		return any([isRelational(x.split(".")[0]) for x in rawFilter.keys() if "." in x and x.split(".")[0] != name])
+
 	def buildDBFilter(self, name, skel, dbFilter, rawFilter, prefix=None):
 		from viur.core.skeleton import RefSkel, skeletonByKind
 		origFilter = dbFilter.filters
@@ -601,7 +843,14 @@ class relationalBone(baseBone):
 		myKeys = [x for x in rawFilter.keys() if x.startswith("%s." % name)]
 
 		if len(myKeys) > 0:  # We filter by some properties
-			if dbFilter.getKind() != "viur-relations" and self.multiple:
+			# With indexRefKeys, a dest-filter can be applied to the denormalized properties on our own kind.
+			# As each of these lists holds the values of all referenced entities, this only works for one filter
+			# (two of them could match different entities); and not if the query is rewritten to viur-relations
+			# by another relationalBone (or a relational sort order) anyway.
+			useRefKeyIndex = self.multiple and self.indexRefKeys and dbFilter.getKind() != "viur-relations" \
+							 and len(myKeys) == 1 and myKeys[0].split(".")[1] != "rel" \
+							 and not self._hasOtherRelationalQuery(name, skel, rawFilter)
+			if dbFilter.getKind() != "viur-relations" and self.multiple and not useRefKeyIndex:
 				name, skel, dbFilter, rawFilter = self._rewriteQuery(name, skel, dbFilter, rawFilter)
 
 			relSkel = RefSkel.fromSkel(skeletonByKind(self.kind), *self.refKeys)
@@ -639,11 +888,23 @@ class relationalBone(baseBone):
 						logging.warning("Invalid filtering! %s is not in refKeys of RelationalBone %s!" % (key, name))
 						raise RuntimeError()
 
+					if useRefKeyIndex and checkKey == "key":
+						# keyBone filters on __key__, but here we have to match the list of referenced keys
+						if isinstance(value, list):
+							dbFilter.filter("%s%s_dest_key IN" % (prefix or "", name),
+											[db.keyHelper(x, self.kind) for x in value])
+						else:
+							dbFilter.filter("%s%s_dest_key =" % (prefix or "", name), db.keyHelper(value, self.kind))
+						continue
+
 					# Iterate our relSkel and let these bones write their filters in
 					for bname, bone in relSkel.items():
 						if checkKey == bname:
 							newFilter = {key: value}
-							if self.multiple:
+							if useRefKeyIndex:
+								bone.buildDBFilter(bname, relSkel, dbFilter, newFilter,
+												   prefix=(prefix or "") + name + "_dest_")
+							elif self.multiple:
 								bone.buildDBFilter(bname, relSkel, dbFilter, newFilter, prefix=(prefix or "") + "dest.")
 							else:
 								bone.buildDBFilter(bname, relSkel, dbFilter, newFilter,
@@ -666,7 +927,7 @@ class relationalBone(baseBone):
 								bone.buildDBFilter(bname, relSkel, dbFilter, newFilter,
 												   prefix=(prefix or "") + name + ".rel.")
 
-			if self.multiple:
+			if self.multiple and not useRefKeyIndex:
 				dbFilter.setFilterHook(lambda s, filter, value: self.filterHook(name, s, filter, value))
 				dbFilter.setOrderHook(lambda s, orderings: self.orderHook(name, s, orderings))
 
@@ -798,68 +1059,75 @@ class relationalBone(baseBone):
 						res.append("src.%s" % orderKey)
 		return (res)
 
-	def refresh(self, valuesCache, boneName, skel):
-		"""
-			Refresh all values we might have cached from other entities.
+	def refreshReferencedValues(self, skel, boneName, entities):
 		"""
-		import logging
-		logging.error("REFRESH CURRENTLY DISABLED")
-		return
-
-		def updateInplace(relDict):
-			"""
-				Fetches the entity referenced by valDict["dest.key"] and updates all dest.* keys
-				accordingly
-			"""
-			if isinstance(relDict, dict) and "dest" in relDict:
-				valDict = relDict["dest"]
-			else:
-				logging.error("Invalid dictionary in updateInplace: %s" % relDict)
-				return
-
-			if "key" in valDict and valDict["key"]:
-				originalKey = valDict["key"]
-			else:
-				logging.error("Invalid dictionary in updateInplace: %s" % valDict)
-				return
-
-			entityKey = originalKey
-			if originalKey != entityKey:
-				logging.info("Rewriting %s to %s" % (originalKey, entityKey))
-				valDict["key"] = entityKey
-
-			# Try to update referenced values;
-			# If the entity does not exist with this key, ignore
-			# (key was overidden above to have a new appid when transferred).
-			newValues = None
-
-			try:
-				newValues = db.Get((self.kind, entityKey))
-				assert newValues is not None
-			except db.EntityNotFoundError:
-				# This entity has been deleted
-				logging.info("The key %s does not exist" % entityKey)
-			except:
-				raise
+			Replaces the values we've copied from the referenced entities with their current ones.
 
-			if newValues:
-				for key in self._refSkelCache.keys():
-					if key == "key":
-						continue
+			:param skel: The skeleton this bone belongs to
+			:type skel: server.skeleton.Skeleton
+			:param boneName: Our name in that skeleton
+			:type boneName: str
+			:param entities: Mapping of keys to the current (raw) entities referenced by them.
+				References to entities not included here are left unchanged.
+			:type entities: dict
+			:returns: True if at least one of our values has been updated
+			:rtype: bool
+		"""
+		value = skel[boneName]
+		if not value:
+			return False
+		refSkel = self._refSkelCache
+		updated = False
+		for val in (value if isinstance(value, list) else [value]):
+			if not val["dest"]:
+				continue
+			refSkel.setValuesCache(val["dest"])
+			entity = entities.get(refSkel["key"])
+			if entity is None:
+				continue
+			refSkel.unserialize(entity)
+			for key in refSkel.keys():
+				refSkel[key]  # Load each value, we'll drop all other properties of that entity below
+			refSkel.getValuesCache().entity = db.Entity(entity.key)
+			val["dest"] = refSkel.getValuesCache()
+			updated = True
+		return updated
+
+	def getReferencedKeys(self, skel, boneName):
+		"""
+			Returns the keys of all entities referenced by this bone.
 
-					getattr(self._refSkelCache, key).unserialize(valDict, key, newValues)
+			:param skel: The skeleton this bone belongs to
+			:type skel: server.skeleton.Skeleton
+			:param boneName: Our name in that skeleton
+			:type boneName: str
+			:rtype: list of db.Key
+		"""
+		value = skel[boneName]
+		if not value:
+			return []
+		refSkel = self._refSkelCache
+		refSkel.renderPreparation = None  # The html render may have left this set
+		res = []
+		for val in (value if isinstance(value, list) else [value]):
+			if val["dest"]:
+				refSkel.setValuesCache(val["dest"])
+				if refSkel["key"]:
+					res.append(refSkel["key"])
+		return res
 
-		if not valuesCache[boneName] or self.updateLevel == 2:
+	def refresh(self, valuesCache, boneName, skel):
+		"""
+			Refresh all values we might have cached from other entities.
+			All referenced entities are fetched using one batched request.
+		"""
+		if self.updateLevel == 2:
+			return
+		keys = self.getReferencedKeys(skel, boneName)
+		if not keys:
 			return
-
 		logging.debug("Refreshing relationalBone %s of %s" % (boneName, skel.kindName))
-
-		if isinstance(valuesCache[boneName], dict):
-			updateInplace(valuesCache[boneName])
-
-		elif isinstance(valuesCache[boneName], list):
-			for k in valuesCache[boneName]:
-				updateInplace(k)
+		self.refreshReferencedValues(skel, boneName, dict(zip(keys, db.Get(keys))))
 
 	def getSearchTags(self, values, key):
 		def getValues(res, skel, valuesCache):
@@ -938,9 +1206,14 @@ class relationalBone(baseBone):
 			:rtype: bool
 		"""
 		from viur.core.skeleton import RefSkel, skeletonByKind
+		if self.paged:
+			logging.error("Cannot set %s as it's paged, use addReferences and removeReferences instead" % boneName)
+			return False
+		fetchedEntities = {}  # Filled below with all referenced entities using one batched request
+
 		def relSkelFromKey(key):
 			key = db.keyHelper(key, self.kind)
-			entity = db.Get(key)
+			entity = fetchedEntities.get(key)
 			if not entity:
 				logging.error("Key %s not found" % str(key))
 				return None
@@ -984,6 +1257,8 @@ class relationalBone(baseBone):
 				realValue = [value]
 			else:
 				realValue = value
+		requestedKeys = [db.keyHelper(x[0], self.kind) for x in (realValue if self.multiple else [realValue])]
+		fetchedEntities.update(zip(requestedKeys, db.Get(requestedKeys)))
 		if not self.multiple:
 			relSkel = relSkelFromKey(realValue[0])
 			if not relSkel:
@@ -3,8 +3,16 @@ from viur.core import db, utils, request, tasks, session
 from viur.core.config import conf
 from hashlib import sha512
 from datetime import datetime, timedelta
-import logging
+from collections import OrderedDict
+from time import sleep
+import logging, threading, gzip
 from functools import wraps
+from typing import Union, Callable, List, Tuple, Any
+
+try:
+	import brotli
+except ImportError:
+	brotli = None
 
 """
 	This module provides a cache, allowing to serve
@@ -14,9 +22,170 @@ from functools import wraps
 	be used to cache the output of custom build functions.
 	Admins can bypass this cache by sending the X-Viur-Disable-Cache http Header
 	along with their requests.
+
+	Entries are kept in two tiers: a small in-process LRU (see :class:`MemoryCache`) in front of the
+	viur-cache kind in the datastore. If an entry is missing or outdated, only one request rebuilds it
+	(guarded by a lease in viur-cache-lease); the others wait for its result or, if allowed, are served
+	the outdated entry in the meantime.
+
+	While an entry is built, all kinds queried and all entities fetched are recorded (see
+	:func:`viur.core.db.startDataAccessLog`) and stored along with it. Writing or deleting an entity
+	through a skeleton removes exactly the entries that fetched that entity or queried its kind
+	(see :func:`invalidateCacheEntries`).
+
+	Entries are stored gzip-compressed (and additionally brotli-compressed if the brotli package is
+	available and viur.cache.brotli is set) and sent as they are to clients accepting that encoding.
 """
 
 viurCacheName = "viur-cache"
+viurCacheLeaseName = "viur-cache-lease"
+viurCacheGenerationName = "viur-cache-generation"
+flushShards = 16  # Amount of tasks flushing the entries below a path in parallel
+maxTrackedKeys = 250  # If an entry fetched more entities, it depends on their kinds instead
+_cacheInUse = False  # Set as soon as a function is decorated with enableCache or a fragment is cached
+
+
+class MemoryCache(object):
+	"""
+		A thread-safe, size-limited LRU cache held in the memory of this instance.
+
+		Entries are dicts; their "data" is used to determine their size. As other instances can't remove
+		entries from here, they're dropped after viur.cache.memoryTTL seconds.
+	"""
+
+	def __init__(self, maxSize: int):
+		self.maxSize = maxSize
+		self.size = 0
+		self.entries = OrderedDict()  # Mapping key -> (time stored, size, entry)
+		self.lock = threading.Lock()
+
+	def get(self, key: str) -> Union[None, dict]:
+		with self.lock:
+			res = self.entries.get(key)
+			if res is None:
+				return None
+			if res[0] < datetime.now() - timedelta(seconds=conf["viur.cache.memoryTTL"]):
+				self._remove(key)
+				return None
+			self.entries.move_to_end(key)
+			return res[2]
+
+	def put(self, key: str, entry: dict) -> None:
+		size = len(entry.get("data") or "") + len(entry.get("data-br") or "")
+		if size > self.maxSize / 10:  # Don't let a single entry evict everything else
+			return
+		with self.lock:
+			self._remove(key)
+			self.entries[key] = (datetime.now(), size, entry)
+			self.size += size
+			while self.size > self.maxSize:
+				self._remove(next(iter(self.entries)))
+
+	def remove(self, key: str) -> None:
+		with self.lock:
+			self._remove(key)
+
+	def removeWhere(self, cond: Callable[[str, dict], bool]) -> None:
+		"""
+			Removes all entries for which cond(key, entry) returns True.
+		"""
+		with self.lock:
+			for key in [k for k, v in self.entries.items() if cond(k, v[2])]:
+				self._remove(key)
+
+	def clear(self) -> None:
+		with self.lock:
+			self.entries.clear()
+			self.size = 0
+
+	def _remove(self, key):
+		res = self.entries.pop(key, None)
+		if res is not None:
+			self.size -= res[1]
+
+
+memoryCache = MemoryCache(conf["viur.cache.memorySize"])
+_generations = {}  # Mapping path-prefix -> (time fetched, generation), see getGenerations
+_generationsLock = threading.Lock()
+_rebuilding = {}  # Mapping cache-key -> threading.Event of entries rebuilt by this instance right now
+_rebuildingLock = threading.Lock()
+
+
+def acquireRebuild(key: str, local: bool = False) -> bool:
+	"""
+		Single-flight protection: Checks whether the caller should rebuild the given entry.
+
+		Only one thread of this instance and (by acquiring a lease in viur-cache-lease) only one instance
+		will get True until :func:`releaseRebuild` is called or the lease expired after
+		viur.cache.rebuildLeaseTime seconds.
+
+		:param key: The cache-key of the entry
+		:param local: Only protect against other threads of this instance (for entries not stored in the datastore)
+		:returns: True if the caller must rebuild that entry and call releaseRebuild afterwards
+	"""
+	with _rebuildingLock:
+		if key in _rebuilding:
+			return False
+		_rebuilding[key] = threading.Event()
+	if local:
+		return True
+	leaseKey = db.Key(viurCacheLeaseName, key)
+
+	def txn():
+		lease = db.Get(leaseKey)
+		if lease and lease["expires"].replace(tzinfo=None) > datetime.now():
+			return False
+		lease = db.Entity(leaseKey)
+		lease["expires"] = datetime.now() + timedelta(seconds=conf["viur.cache.rebuildLeaseTime"])
+		db.Put(lease)
+		return True
+
+	try:
+		acquired = db.RunInTransaction(txn)
+	except Exception as e:  # Most likely a concurrent transaction on the same lease
+		logging.debug("Could not acquire the lease for %s: %s" % (key, e))
+		acquired = False
+	if not acquired:
+		releaseRebuild(key, releaseLease=False)
+	return acquired
+
+
+def releaseRebuild(key: str, releaseLease: bool = True) -> None:
+	"""
+		Releases the lock acquired by :func:`acquireRebuild` and wakes up all threads waiting for that entry.
+	"""
+	with _rebuildingLock:
+		event = _rebuilding.pop(key, None)
+	if event:
+		event.set()
+	if releaseLease:
+		try:
+			db.Delete(db.Key(viurCacheLeaseName, key))
+		except Exception as e:  # It will expire anyway
+			logging.debug("Could not release the lease for %s: %s" % (key, e))
+
+
+def waitForRebuild(key: str, getEntry: Callable[[bool], Union[None, dict]]) -> Union[None, dict]:
+	"""
+		Waits until the entry rebuilt by another thread or instance becomes available.
+
+		:param key: The cache-key of the entry
+		:param getEntry: Returns the entry if it's available. Called with skipMemory=True while waiting for
+			another instance, as the copy in the in-process cache is the one being replaced.
+		:returns: The entry or None if it didn't show up within viur.cache.rebuildLeaseTime seconds
+	"""
+	with _rebuildingLock:
+		event = _rebuilding.get(key)
+	if event:  # Rebuilt by another thread of this instance
+		event.wait(conf["viur.cache.rebuildLeaseTime"])
+		return getEntry()
+	waitUntil = datetime.now() + timedelta(seconds=conf["viur.cache.rebuildLeaseTime"])
+	while datetime.now() < waitUntil:  # Rebuilt by another instance, we have to poll
+		sleep(0.1)
+		entry = getEntry(skipMemory=True)
+		if entry:
+			return entry
+	return None
 
 
 def keyFromArgs(f, userSensitive, languageSensitive, evaluatedArgs, path, args, kwargs):
@@ -46,7 +215,7 @@ def keyFromArgs(f, userSensitive, languageSensitive, evaluatedArgs, path, args,
 	argsOrder = list(f.__code__.co_varnames)[1: f.__code__.co_argcount]
 	# Map default values in
 	reversedArgsOrder = argsOrder[:: -1]
-	for defaultValue in list(f.func_defaults or [])[:: -1]:
+	for defaultValue in list(f.__defaults__ or [])[:: -1]:
 		res[reversedArgsOrder.pop(0)] = defaultValue
 	del reversedArgsOrder
 	# Map args in
@@ -101,7 +270,252 @@ def keyFromArgs(f, userSensitive, languageSensitive, evaluatedArgs, path, args,
 	return (mysha512.hexdigest())
 
 
-def wrapCallable(f, urls, userSensitive, languageSensitive, evaluatedArgs, maxCacheTime):
+def getPathPrefixes(path: str) -> List[str]:
+	"""
+		Returns the prefixes of *path* ending with a slash, f.e. ["/", "/page/"] for "/page/view".
+	"""
+	return [path[: idx + 1] for idx, char in enumerate(path) if char == "/"]
+
+
+def getGenerations(prefixes: List[str]) -> List[int]:
+	"""
+		Returns the current generation of each of the given path-prefixes (see :func:`invalidateCachePrefix`).
+
+		Generations are kept in memory for viur.cache.generationTTL seconds; all unknown ones are
+		fetched using one batched request.
+	"""
+	maxAge = timedelta(seconds=conf["viur.cache.generationTTL"])
+	res = {}
+	with _generationsLock:
+		for prefix in prefixes:
+			cached = _generations.get(prefix)
+			if cached and cached[0] > datetime.now() - maxAge:
+				res[prefix] = cached[1]
+	missing = [x for x in prefixes if x not in res]
+	if missing:
+		for prefix, entity in zip(missing, db.Get([db.Key(viurCacheGenerationName, x) for x in missing])):
+			res[prefix] = entity["generation"] if entity else 0
+		with _generationsLock:
+			for prefix in missing:
+				_generations[prefix] = (datetime.now(), res[prefix])
+	return [res[x] for x in prefixes]
+
+
+def invalidateCachePrefix(prefix: str) -> None:
+	"""
+		Makes all cache-entries below *prefix* invalid at once, without deleting anything.
+
+		Unlike :func:`flushCache`, this increases the generation-counter stored for that prefix; entries
+		created under an older generation won't be served anymore and are overwritten once rebuilt.
+		Other instances will notice within viur.cache.generationTTL seconds.
+
+		:param prefix: Path-prefix ending with "/*", f.e. "/*" or "/page/*"
+	"""
+	if not prefix.endswith("/*"):
+		raise ValueError("Only prefixes ending with /* can be invalidated")
+	prefix = prefix.rstrip("*")
+	generationKey = db.Key(viurCacheGenerationName, prefix)
+
+	def txn():
+		entity = db.Get(generationKey) or db.Entity(generationKey)
+		entity["generation"] = (entity.get("generation") or 0) + 1
+		db.Put(entity)
+		return entity["generation"]
+
+	generation = db.RunInTransaction(txn)
+	with _generationsLock:
+		_generations[prefix] = (datetime.now(), generation)
+	memoryCache.removeWhere(lambda key, entry: (entry.get("path") or "").startswith(prefix))
+
+
+def getCacheEntry(key: str, useDatastore: bool = True, skipMemory: bool = False) -> Union[None, dict]:
+	"""
+		Returns the entry stored under *key*, trying the in-process cache first.
+
+		:param useDatastore: If False, only the in-process cache is searched
+		:param skipMemory: Read the entry from the datastore even if the in-process cache holds a copy (which
+			might be outdated); ignored if useDatastore is False
+		:returns: Dict with data, content-type, creationtime and path; None if there's no such entry
+	"""
+	if not (skipMemory and useDatastore):
+		entry = memoryCache.get(key)
+		if entry is not None or not useDatastore:
+			return entry
+	dbRes = db.Get(db.Key(viurCacheName, key))
+	if not dbRes:
+		return None
+	entry = {k: dbRes.get(k) for k in ["data", "data-br", "content-encoding", "content-type", "creationtime",
+										"path", "accessedKinds", "accessedKeys", "generations", "etag",
+										"last-modified"]}
+	memoryCache.put(key, entry)
+	return entry
+
+
+def putCacheEntry(key: str, entry: dict, useDatastore: bool = True) -> None:
+	"""
+		Stores *entry* under *key* in both tiers.
+
+		:param useDatastore: If False, the entry is only stored in the in-process cache
+	"""
+	memoryCache.put(key, entry)
+	if not useDatastore:
+		return
+	dbEntity = db.Entity(db.Key(viurCacheName, key))
+	dbEntity.update(entry)
+	# Used by flushCache to find all entries below a path in parallel
+	dbEntity["pathPrefixes"] = getPathPrefixes(entry["path"])
+	dbEntity["shard"] = int(key[:4], 16) % flushShards
+	try:
+		db.Put(dbEntity)
+	except Exception as e:  # Most likely too large for the datastore
+		logging.warning("Could not store %s in the cache: %s" % (entry.get("path"), e))
+
+
+def compressEntryData(data: Union[str, bytes]) -> dict:
+	"""
+		Compresses the body of a response for storing it in the cache.
+
+		:returns: The fields data (gzip-compressed), content-encoding and data-br (brotli-compressed, if enabled)
+	"""
+	if isinstance(data, str):
+		data = data.encode("UTF-8")
+	res = {
+		"data": gzip.compress(data, compresslevel=6),
+		"content-encoding": "gzip",
+		"data-br": None
+	}
+	if brotli and conf["viur.cache.brotli"]:
+		res["data-br"] = brotli.compress(data, quality=9)
+	return res
+
+
+def acceptedEncodings() -> List[str]:
+	"""
+		Returns the content-encodings accepted by the client of the current request.
+	"""
+	res = []
+	for encoding in (request.current.get().request.headers.get("Accept-Encoding") or "").split(","):
+		encoding, _, params = encoding.strip().lower().partition(";")
+		if params.replace(" ", "") in {"q=0", "q=0.0", "q=0.00", "q=0.000"}:
+			continue  # Explicitly refused
+		res.append(encoding.strip())
+	return res
+
+
+def buildDependencyTags(kinds: set, keys: set) -> Tuple[List[str], List[str]]:
+	"""
+		Converts the result of :func:`viur.core.db.endDataAccessLog` into the lists stored as accessedKinds
+		and accessedKeys on a cache-entry.
+	"""
+	if len(keys) > maxTrackedKeys:
+		kinds = kinds | {x.kind for x in keys}
+		keys = set()
+	internalKinds = {viurCacheName, viurCacheLeaseName, viurCacheGenerationName}
+	kinds = {x for x in kinds if x not in internalKinds}
+	keys = {x for x in keys if x.kind not in internalKinds}
+	return sorted(kinds), sorted([x.to_legacy_urlsafe().decode("ASCII") for x in keys])
+
+
+def invalidateCacheEntries(keys: List[db.KeyClass]) -> None:
+	"""
+		Removes all cache-entries depending on the given entities, that is all entries which fetched one
+		of them or queried one of their kinds while being built.
+
+		Called by :meth:`viur.core.skeleton.Skeleton.toDBMulti` and
+		:meth:`viur.core.skeleton.Skeleton.deleteMulti`. If called inside a transaction, the entries
+		are removed by a deferred task once the transaction succeeded.
+
+		:param keys: Keys of the entities that have been written or deleted
+	"""
+	if not keys or not (_cacheInUse or conf["viur.cache.fragmentsInDatastore"]):
+		return
+	urlsafeKeys = [x.to_legacy_urlsafe().decode("ASCII") for x in keys]
+	if db.IsInTransaction():
+		_invalidateCacheEntriesDeferred(urlsafeKeys)
+	else:
+		_invalidateCacheEntries(urlsafeKeys)
+
+
+def _invalidateCacheEntries(urlsafeKeys):
+	keys = set(urlsafeKeys)
+	kinds = {db.KeyClass.from_legacy_urlsafe(x).kind for x in urlsafeKeys}
+	memoryCache.removeWhere(lambda key, entry: bool(kinds.intersection(entry.get("accessedKinds") or [])
+												   or keys.intersection(entry.get("accessedKeys") or [])))
+	queries = [db.Query(viurCacheName).filter("accessedKinds =", x) for x in kinds]
+	for idx in range(0, len(urlsafeKeys), 30):  # The datastore allows up to 30 values in IN filters
+		queries.append(db.Query(viurCacheName).filter("accessedKeys IN", urlsafeKeys[idx: idx + 30]))
+	for query in queries:
+		query.setKeysOnly()
+		while True:  # As we're deleting them, each run yields the next batch
+			res = query.run(limit=500)
+			if not res:
+				break
+			db.Delete([x.key for x in res])
+			if len(res) < 500:
+				break
+
+
+@tasks.callDeferred
+def _invalidateCacheEntriesDeferred(urlsafeKeys):
+	_invalidateCacheEntries(urlsafeKeys)
+
+
+def cachedFragment(key: str, path: str, build: Callable[[], Any], maxCacheTime: Union[None, int],
+				   useDatastore: bool = False) -> Any:
+	"""
+		Returns the fragment (a part of a response, f.e. the result of an internal request) stored under *key*.
+		If it's missing or older than *maxCacheTime* seconds, it's built by calling *build* and stored,
+		with the same single-flight protection and dependency tracking as responses cached by :func:`enableCache`.
+		Only strings are stored, other results of *build* are returned uncached.
+
+		:param key: The cache-key of the fragment (a sha512 hexdigest)
+		:param path: Path the fragment belongs to; used by :func:`flushCache` and :func:`invalidateCachePrefix`
+		:param build: Function building the fragment
+		:param maxCacheTime: Seconds the fragment stays valid, None for unlimited
+		:param useDatastore: Store the fragment in the datastore too instead of in the in-process cache only
+	"""
+	global _cacheInUse
+	_cacheInUse = True
+	generations = getGenerations(getPathPrefixes(path))
+
+	def getUsableEntry(skipMemory=False):
+		entry = getCacheEntry(key, useDatastore, skipMemory)
+		if not entry or (entry.get("generations") or [0] * len(generations)) != generations:
+			return None
+		if maxCacheTime and datetime.now() - entry["creationtime"].replace(tzinfo=None) > timedelta(seconds=maxCacheTime):
+			return None
+		if entry.get("accessedKinds") or entry.get("accessedKeys"):
+			db.logDataAccess(entry.get("accessedKinds"),
+							 [db.KeyClass.from_legacy_urlsafe(x) for x in entry.get("accessedKeys") or []])
+		return entry
+
+	entry = getUsableEntry()
+	if entry:
+		return entry["data"]
+	if not acquireRebuild(key, local=not useDatastore):
+		entry = waitForRebuild(key, getUsableEntry)
+		return entry["data"] if entry else build()
+	try:
+		db.startDataAccessLog()
+		try:
+			res = build()
+		finally:
+			accessedKinds, accessedKeys = buildDependencyTags(*db.endDataAccessLog())
+		if isinstance(res, str):
+			putCacheEntry(key, {
+				"data": res,
+				"creationtime": datetime.now(),
+				"path": path,
+				"accessedKinds": accessedKinds,
+				"accessedKeys": accessedKeys,
+				"generations": generations
+			}, useDatastore)
+	finally:
+		releaseRebuild(key, releaseLease=useDatastore)
+	return res
+
+
+def wrapCallable(f, urls, userSensitive, languageSensitive, evaluatedArgs, maxCacheTime, staleWhileRevalidate):
 	"""
 		Does the actual work of wrapping a callable.
 		Use the decorator enableCache instead of calling this directly.
@@ -115,6 +529,8 @@ def wrapCallable(f, urls, userSensitive, languageSensitive, evaluatedArgs, maxCa
 			if conf["viur.disableCache"]:
 				logging.debug("Caching is disabled by config")
 			return (f(self, *args, **kwargs))
+		if currentRequest.isPostRequest:  # Never cache anything that might have modified data
+			return (f(self, *args, **kwargs))
 		# How many arguments are part of the way to the function called (and how many are just *args)
 		offset = -len(currentRequest.args) or len(currentRequest.pathlist)
 		path = "/" + "/".join(currentRequest.pathlist[: offset])
@@ -127,33 +543,90 @@ def wrapCallable(f, urls, userSensitive, languageSensitive, evaluatedArgs, maxCa
 			# Someting is wrong (possibly the parameter-count)
 			# Letz call f, but we knew already that this will clash
 			return (f(self, *args, **kwargs))
-		try:
-			dbRes = db.Get(db.Key.from_path(viurCacheName, key))
-		except db.EntityNotFoundError:
-			dbRes = None
-		if dbRes:
-			if not maxCacheTime or \
-					dbRes["creationtime"] > datetime.now() - timedelta(seconds=maxCacheTime):
-				# We store it unlimited or the cache is fresh enough
-				logging.debug("This request was served from cache.")
-				currentRequest.response.headers['Content-Type'] = dbRes["content-type"].encode("UTF-8")
-				return (dbRes["data"])
+
+		def serve(entry):
+			if entry.get("accessedKinds") or entry.get("accessedKeys"):
+				# Entries containing this one must depend on the same data
+				db.logDataAccess(entry.get("accessedKinds"),
+								 [db.KeyClass.from_legacy_urlsafe(x) for x in entry.get("accessedKeys") or []])
+			currentRequest.response.headers["Content-Type"] = entry["content-type"]
+			if entry.get("etag") and utils.answerConditionalRequest(entry["etag"], entry.get("last-modified")):
+				return ""  # The client's copy is still valid
+			if entry.get("content-encoding") != "gzip":  # Stored uncompressed
+				return entry["data"]
+			if currentRequest.internalRequest:  # The result will be embedded into another response
+				return gzip.decompress(entry["data"]).decode("UTF-8")
+			currentRequest.response.headers["Vary"] = "Accept-Encoding"
+			encodings = acceptedEncodings()
+			if entry.get("data-br") and "br" in encodings:
+				currentRequest.response.headers["Content-Encoding"] = "br"
+				return entry["data-br"]
+			if "gzip" in encodings:
+				currentRequest.response.headers["Content-Encoding"] = "gzip"
+				return entry["data"]
+			return gzip.decompress(entry["data"])
+
+		generations = getGenerations(getPathPrefixes(path))
+
+		def isUsable(entry, maxAge):
+			if not entry or (entry.get("generations") or [0] * len(generations)) != generations:
+				return False  # Missing or invalidated by invalidateCachePrefix
+			age = datetime.now() - entry["creationtime"].replace(tzinfo=None)
+			return not maxAge or age < timedelta(seconds=maxAge)
+
+		def getUsableEntry(skipMemory=False):
+			entry = getCacheEntry(key, skipMemory=skipMemory)
+			return entry if isUsable(entry, maxCacheTime) else None
+
+		entry = getCacheEntry(key)
+		if isUsable(entry, maxCacheTime):
+			# We store it unlimited or the cache is fresh enough
+			logging.debug("This request was served from cache.")
+			return serve(entry)
+		if not (maxCacheTime and staleWhileRevalidate and isUsable(entry, maxCacheTime + staleWhileRevalidate)):
+			entry = None  # Too old to be served at all
 		# If we made it this far, the request wasnt cached or too old; we need to rebuild it
-		res = f(self, *args, **kwargs)
-		dbEntity = db.Entity(viurCacheName, name=key)
-		dbEntity["data"] = res
-		dbEntity["creationtime"] = datetime.now()
-		dbEntity["path"] = path
-		dbEntity["content-type"] = request.current.get().response.headers['Content-Type']
-		dbEntity.set_unindexed_properties(["data", "content-type"])  # We can save 2 DB-Writs :)
-		db.Put(dbEntity)
+		if not acquireRebuild(key):
+			if entry:  # Someone else is rebuilding it, the old one must do for now
+				logging.debug("This request was served from cache (stale while being rebuilt).")
+				return serve(entry)
+			entry = waitForRebuild(key, getUsableEntry)
+			if entry:
+				logging.debug("This request was served from cache (rebuilt by another request).")
+				return serve(entry)
+			return (f(self, *args, **kwargs))  # Whoever rebuilt it took too long
+		try:
+			db.startDataAccessLog()
+			try:
+				res = f(self, *args, **kwargs)
+			finally:
+				accessedKinds, accessedKeys = buildDependencyTags(*db.endDataAccessLog())
+			# Don't store errors, empty 304 responses or results that aren't a response body (f.e. None if the
+			# function wrote to the response directly)
+			if currentRequest.response.status_code == 200 and isinstance(res, (str, bytes)):
+				entry = compressEntryData(res)
+				entry.update({
+					"content-type": currentRequest.response.headers["Content-Type"],
+					"creationtime": datetime.now(),
+					"path": path,
+					"accessedKinds": accessedKinds,
+					"accessedKeys": accessedKeys,
+					"generations": generations,
+					# Validators set by conditionalRequest, so hits can be answered with 304, too
+					"etag": currentRequest.response.etag,
+					"last-modified": currentRequest.response.last_modified
+				})
+				putCacheEntry(key, entry)
+		finally:
+			releaseRebuild(key)
 		logging.debug("This request was a cache-miss. Cache has been updated.")
 		return (res)
 
 	return wrapF
 
 
-def enableCache(urls, userSensitive=0, languageSensitive=False, evaluatedArgs=[], maxCacheTime=None):
+def enableCache(urls, userSensitive=0, languageSensitive=False, evaluatedArgs=[], maxCacheTime=None,
+				staleWhileRevalidate=0):
 	"""
 		Decorator to mark a function cacheable.
 		Only functions decorated with enableCache are considered cacheable;
@@ -184,19 +657,29 @@ def enableCache(urls, userSensitive=0, languageSensitive=False, evaluatedArgs=[]
 			Note: Its not erased from the db after that time, but it won't be served anymore.
 			If None, the cache stays valid forever (until manually erased by calling flushCache.
 		:type maxCacheTime: int or None
+		:param staleWhileRevalidate: For how many seconds after maxCacheTime an entry may still be served
+			while another request is rebuilding it.
+		:type staleWhileRevalidate: int
 
 	"""
-	return lambda f: f  #FIXME!
+	global _cacheInUse
 	assert not any([x.startswith("_") for x in evaluatedArgs]), "A evaluated Parameter cannot start with an underscore!"
-	return lambda f: wrapCallable(f, urls, userSensitive, languageSensitive, evaluatedArgs, maxCacheTime)
+	_cacheInUse = True
+	return lambda f: wrapCallable(f, urls, userSensitive, languageSensitive, evaluatedArgs, maxCacheTime,
+								  staleWhileRevalidate)
 
 
 @tasks.callDeferred
-def flushCache(prefix="/*"):
+def flushCache(prefix="/*", shard=None, cursor=None):
 	"""
 		Flushes the cache. Its possible the flush only a part of the cache by specifying
 		the path-prefix.
 
+		Entries are searched by keys-only queries and deleted in batches. Prefixes ending with "/*" are
+		flushed by one task per shard running in parallel; each task continues itself in a new task if
+		there are more entries than it can handle. See :func:`invalidateCachePrefix` for making a whole
+		prefix invalid immediately.
+
 		:param prefix: Path or prefix that should be flushed.
 		:type prefix: str
 
@@ -205,15 +688,39 @@ def flushCache(prefix="/*"):
 			- "/*" everything from the cache, "/page/*" everything from the page-module (default render),
 			- and "/page/view/*" only that specific subset of the page-module.
 	"""
-	items = db.Query(viurCacheName).filter("path =", prefix.rstrip("*")).iter(keysOnly=True)
-	for item in items:
-		db.Delete(item)
-	if prefix.endswith("*"):
-		items = db.Query(viurCacheName).filter("path >", prefix.rstrip("*")).filter("path <", prefix.rstrip(
-			"*") + u"\ufffd").iter(keysOnly=True)
-		for item in items:
-			db.Delete(item)
+	path = prefix.rstrip("*")
+	if shard is None and cursor is None:  # The initial call
+		if prefix.endswith("*"):
+			memoryCache.removeWhere(lambda key, entry: (entry.get("path") or "").startswith(path))
+		else:
+			memoryCache.removeWhere(lambda key, entry: entry.get("path") == prefix)
+		if prefix.endswith("/*"):
+			for shardIdx in range(0, flushShards):
+				flushCache(prefix, shardIdx)
+			return
+	if not prefix.endswith("*"):
+		query = db.Query(viurCacheName).filter("path =", path)
+	elif prefix.endswith("/*"):
+		query = db.Query(viurCacheName).filter("pathPrefixes =", path).filter("shard =", shard)
+	else:
+		query = db.Query(viurCacheName).filter("path >=", path).filter("path <", path + u"\ufffd")
+	query.setKeysOnly()
+	query.setCursor(cursor)
+	for _ in range(0, 20):  # Up to 10.000 entries per task
+		res = query.run(limit=500)
+		if not res:
+			break
+		db.Delete([x.key for x in res])
+		cursor = query.getCursor()
+		if len(res) < 500 or not cursor:
+			break
+		query.setCursor(cursor)
+	else:
+		if isinstance(cursor, bytes):
+			cursor = cursor.decode("ASCII")
+		flushCache(prefix, shard, cursor)
+		return
 	logging.debug("Flushing cache succeeded. Everything matching \"%s\" is gone." % prefix)
 
 
-__all__ = ["enableCache", "flushCache"]
+__all__ = ["enableCache", "flushCache", "invalidateCachePrefix", "invalidateCacheEntries", "cachedFragment"]
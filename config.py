@@ -13,6 +13,24 @@ conf = {
 	# List of language-codes, which are valid for this application
 	"viur.availableLanguages": ["en"],
 
+	# If set (and the brotli package is available), cache-entries are also stored brotli-compressed
+	"viur.cache.brotli": False,
+
+	# If set, fragments cached by execRequest and {% cache %} are stored in the datastore too, not just in-process
+	"viur.cache.fragmentsInDatastore": False,
+
+	# Seconds the generations set by viur.core.cache.invalidateCachePrefix are kept in memory per instance
+	"viur.cache.generationTTL": 5,
+
+	# Amount of memory (bytes of cached data) the in-process tier of viur.core.cache may use per instance
+	"viur.cache.memorySize": 32 * 1024 * 1024,
+
+	# Seconds an entry is kept in the in-process tier; limits how long other instances may serve flushed entries
+	"viur.cache.memoryTTL": 60,
+
+	# Seconds a request may take to rebuild a cache-entry before another request will try it
+	"viur.cache.rebuildLeaseTime": 30,
+
 	# If set, this function will be called for each cache-attempt and the result will be included in
 	# the computed cache-key
 	"viur.cacheEnvironmentKey": None,
@@ -21,6 +39,9 @@ conf = {
 	# the module configuration (adminInfo)
 	"viur.capabilities": [],
 
+	# If set, views and lists are sent with ETag (and Last-Modified) headers and answered with 304 if unchanged
+	"viur.conditionalRequests": True,
+
 	# If set, viur will emit a CSP http-header with each request. Use the csp module to set this property
 	"viur.contentSecurityPolicy": None,
 
@@ -99,6 +120,9 @@ conf = {
 	# Allows the application to register a function that's called before the request gets routed
 	"viur.requestPreprocessor": None,
 
+	# Maximum depth relationalBones can be expanded to by renders (see skeleton.RelationalExpansion)
+	"viur.render.maxExpandDepth": 3,
+
 	# Characters valid for the internal search functionality (all other chars are ignored)
 	"viur.searchValidChars": "abcdefghijklmnopqrstuvwxyz0123456789",
 
@@ -138,6 +162,14 @@ conf = {
 
 	# If set, must be a tuple of two functions serializing/restoring additional enviromental data in deferred requests,
 	"viur.tasks.customEnvironmentHandler": None,
+	# Amount of key-ranges (shards) a search index rebuild is split into. These are processed in parallel
+	"viur.tasks.searchIndexRebuild.shards": 16,
+	# Amount of entities fetched and written in one batch while rebuilding the search index
+	"viur.tasks.searchIndexRebuild.chunkSize": 100,
+	# Seconds to wait before updating the references to a changed entity. Changes within this time are coalesced
+	"viur.tasks.updateRelationsDelay": 60,
+	# Seconds after which a scheduled update of these references is considered lost and scheduled again
+	"viur.tasks.updateRelationsGracePeriod": 600,
 
 	# Will be set to server.__version__ in server.__init__
 	"viur.version": None,
@@ -9,6 +9,7 @@ from copy import deepcopy
 from google.cloud import datastore, exceptions
 from enum import Enum
 from datetime import datetime, date, time
+from contextvars import ContextVar
 import binascii
 
 """
@@ -38,12 +39,48 @@ class SortOrder(Enum):
 Entity = datastore.Entity
 Key = __client__.key  # Proxy-Function
 KeyClass = datastore.Key  # Expose the class also
-Get = __client__.get
-Delete = __client__.delete
 AllocateIds = __client__.allocate_ids
 Conflict = exceptions.Conflict
 Error = exceptions.GoogleCloudError
 
+# Stack of (kinds, keys) sets recording what has been read, see startDataAccessLog
+_dataAccessLog = ContextVar("viur-dataAccessLog", default=())
+
+# Limits of the datastore for a single lookup and a single commit
+MAX_KEYS_PER_LOOKUP = 1000
+MAX_MUTATIONS_PER_COMMIT = 500
+
+
+def startDataAccessLog() -> None:
+	"""
+		Starts recording which kinds have been queried and which keys have been fetched in the current
+		context. Logs can be nested; each read is recorded in every log currently open.
+	"""
+	_dataAccessLog.set(_dataAccessLog.get() + ((set(), set()),))
+
+
+def endDataAccessLog() -> Tuple[set, set]:
+	"""
+		Stops the log started by the last call to :func:`startDataAccessLog`.
+
+		:returns: Tuple of the set of kind names queried and the set of keys fetched since then
+	"""
+	logs = _dataAccessLog.get()
+	_dataAccessLog.set(logs[:-1])
+	return logs[-1]
+
+
+def logDataAccess(kinds: Union[None, List[str]] = None, keys: Union[None, List[KeyClass]] = None) -> None:
+	"""
+		Records that the given kinds have been queried and the given keys have been fetched
+		in all data access logs currently open.
+	"""
+	for logKinds, logKeys in _dataAccessLog.get():
+		if kinds:
+			logKinds.update(kinds)
+		if keys:
+			logKeys.update(keys)
+
 
 def keyHelper(inKey: Union[KeyClass, str, int], targetKind: str,
 			  additionalAllowdKinds: Union[None, List[str]] = None) -> KeyClass:
@@ -69,10 +106,46 @@ def keyHelper(inKey: Union[KeyClass, str, int], targetKind: str,
 		raise ValueError("Unknown key type %r" % type(inKey))
 
 
+def Get(keys: Union[KeyClass, List[KeyClass]]) -> Union[None, Entity, List[Union[None, Entity]]]:
+	"""
+		Fetches one or multiple entities from the Cloud Datastore.
+		If a list of keys is given, they are fetched using batched requests of up to
+		MAX_KEYS_PER_LOOKUP keys each.
+		:param keys: The key or list of keys to fetch.
+		:returns: The entity (or None if it doesn't exist). If *keys* is a list, a list of the same
+			length and order is returned, containing None for each key that could not be found.
+	"""
+	if _dataAccessLog.get():
+		logDataAccess(keys=keys if isinstance(keys, list) else [keys])
+	if isinstance(keys, list):
+		if not keys:
+			return []
+		res = {}
+		for i in range(0, len(keys), MAX_KEYS_PER_LOOKUP):
+			res.update({x.key: x for x in __client__.get_multi(keys[i:i + MAX_KEYS_PER_LOOKUP])})
+		return [res.get(x) for x in keys]
+	return __client__.get(keys)
+
+
+def Delete(keys: Union[KeyClass, List[KeyClass]]):
+	"""
+		Deletes one or multiple entities from the Cloud Datastore.
+		If a list of keys is given, they are deleted using batched requests of up to
+		MAX_MUTATIONS_PER_COMMIT keys each (inside a transaction, all of them are committed together).
+		:param keys: The key or list of keys to delete.
+	"""
+	if isinstance(keys, list):
+		for i in range(0, len(keys), MAX_MUTATIONS_PER_COMMIT):
+			__client__.delete_multi(keys[i:i + MAX_MUTATIONS_PER_COMMIT])
+		return
+	return __client__.delete(keys)
+
+
 def Put(entity: Union[Entity, List[Entity]]):
 	"""
 		Save an entity in the Cloud Datastore.
 		Also ensures that no string-key with an digit-only name can be used.
+		Lists of entities are written using batched requests of up to MAX_MUTATIONS_PER_COMMIT entities each.
 		:param entity: The entity to be saved to the datastore.
 	"""
 	if not isinstance(entity, list):
@@ -81,7 +154,8 @@ def Put(entity: Union[Entity, List[Entity]]):
 		if not e.key.is_partial and e.key.name and e.key.name.isdigit():
 			raise ValueError("Cannot store an entity with digit-only string key")
 		fixUnindexableProperties(e)
-	return __client__.put_multi(entities=entity)
+	for i in range(0, len(entity), MAX_MUTATIONS_PER_COMMIT):
+		__client__.put_multi(entities=entity[i:i + MAX_MUTATIONS_PER_COMMIT])
 
 
 def fixUnindexableProperties(entry: Entity):
@@ -90,7 +164,7 @@ def fixUnindexableProperties(entry: Entity):
 			return any([hasUnindexableProperty(x) for x in prop.values()])
 		elif isinstance(prop, list):
 			return any([hasUnindexableProperty(x) for x in prop])
-		elif isinstance(prop, str):
+		elif isinstance(prop, (str, bytes)):
 			return len(prop) >= 500
 		else:
 			return False
@@ -197,6 +271,7 @@ class Query(object):
 		self._lastEntry = None
 		self._fulltextQueryString: Union[None, str] = None
 		self.lastCursor = None
+		self._keysOnly: bool = False
 
 	def setFilterHook(self, hook):
 		"""
@@ -475,13 +550,29 @@ class Query(object):
 		self.amount = amount
 		return self
 
+	def setKeysOnly(self, keysOnly: bool = True) -> Query:
+		"""
+			Configures this query to fetch only the keys of the matching entities.
+
+			The entities returned by :func:`server.db.Query.run` will contain no properties then,
+			only their key is set. Keys-only queries are much cheaper than fetching the full entities.
+
+			:param keysOnly: If the query should be used to retrieve entity keys only.
+			:type keysOnly: bool
+
+			:returns: Returns the query itself for chaining.
+			:rtype: server.db.Query
+		"""
+		self._keysOnly = keysOnly
+		return self
+
 	def isKeysOnly(self):
 		"""
 			Returns True if this query is configured as *keys only*, False otherwise.
 
 			:rtype: bool
 		"""
-		return self.datastoreQuery.IsKeysOnly()
+		return self._keysOnly
 
 	def getQueryOptions(self):
 		"""
@@ -602,6 +693,8 @@ class Query(object):
 			key, op = k.split(" ")
 			qry.add_filter(key, op, v)
 		qry.order = [x[0] if x[1] == SortOrder.Ascending else "-" + x[0] for x in self.orders]
+		if self._keysOnly:
+			qry.keys_only()
 		qryRes = qry.fetch(limit=amount, start_cursor=self._startCursor, end_cursor=self._endCursor)
 		res = next(qryRes.pages)
 		self.lastCursor = qryRes.next_page_token
@@ -700,6 +793,8 @@ class Query(object):
 		"""
 		if self.filters is None:
 			return None
+		if _dataAccessLog.get():
+			logDataAccess(kinds=[self.getKind()])
 		origLimit = limit if limit != -1 else self.amount
 		qryLimit = origLimit
 
@@ -772,7 +867,8 @@ class Query(object):
 		if amount < 1 or amount > 100:
 			raise NotImplementedError(
 				"This query is not limited! You must specify an upper bound using limit() between 1 and 100")
-		from viur.core.skeleton import SkelList
+		from viur.core.skeleton import SkelList, refreshRelations
+		from viur.core.bones.relationalBone import RelationalRefresh
 		res = SkelList(self.srcSkel)
 		dbRes = self.run(amount)
 		res.customQueryInfo = self.customQueryInfo
@@ -781,6 +877,7 @@ class Query(object):
 		for e in dbRes:
 			self.srcSkel.setValues(e)  # This will reset it's internal valuesCache to a fresh dict
 			res.append(self.srcSkel.getValuesCache())
+		refreshRelations(self.srcSkel, res[:], RelationalRefresh.OnRead)
 		res.getCursor = lambda: self.getCursor(True)
 		return res
 
@@ -807,6 +904,10 @@ class Query(object):
 			raise StopIteration()
 		elif isinstance(self.filters, list):
 			raise ValueError("No iter on Multiqueries")
+		if _dataAccessLog.get():
+			logDataAccess(kinds=[self.getKind()])
+		if keysOnly:
+			self.setKeysOnly()
 		while True:
 			qryRes = self._runSingleFilterQuery(self.filters, 20)
 			yield from qryRes
@@ -900,4 +1001,4 @@ def RunInTransaction(callee, *args, **kwargs):
 
 __all__ = [KEY_SPECIAL_PROPERTY, DATASTORE_BASE_TYPES, SortOrder, Entity, Key, KeyClass, Put, Get, Delete, AllocateIds,
 		   Conflict, Error, keyHelper, fixUnindexableProperties, GetOrInsert, Query, IsInTransaction,
-		   acquireTransactionSuccessMarker, RunInTransaction]
+		   acquireTransactionSuccessMarker, RunInTransaction, startDataAccessLog, endDataAccessLog, logDataAccess]
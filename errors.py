@@ -175,6 +175,17 @@ class Locked(HTTPException):
 		super(Locked, self).__init__(status=423, name="Ressource is Locked", descr=descr)
 
 
+class TooManyRequests(HTTPException):
+	"""
+		TooManyRequests
+
+		Raised by functions protected by :func:`server.ratelimit.rateLimited` if there's no quota left
+	"""
+
+	def __init__(self, descr="Too Many Requests"):
+		super(TooManyRequests, self).__init__(status=429, name="Too Many Requests", descr=descr)
+
+
 class Censored(HTTPException):
 	"""
 		Censored
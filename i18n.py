@@ -54,8 +54,11 @@ class translate:
 
 def initializeTranslations():
 	global systemTranslations
+	# Build the new tables aside and swap them in at once; other threads may be translating right now
+	newTranslations = {}
 	for tr in db.Query("viur-translations").run(9999):
 		lng = tr["language"]
-		if not lng in systemTranslations:
-			systemTranslations[lng] = {}
-		systemTranslations[lng][tr["key"]] = tr["translation"]
+		if not lng in newTranslations:
+			newTranslations[lng] = {}
+		newTranslations[lng][tr["key"]] = tr["translation"]
+	systemTranslations = newTranslations
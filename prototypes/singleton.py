@@ -116,7 +116,7 @@ class Singleton(BasicApplication):
 		if not self.canView():
 			raise errors.Unauthorized()
 
-		key = str(db.Key.from_path(self.editSkel().kindName, self.getKey()))
+		key = db.Key(self.editSkel().kindName, self.getKey())
 
 		if not skel.fromDB(key):
 			raise errors.NotFound()
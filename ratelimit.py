@@ -1,7 +1,123 @@
 # -*- coding: utf-8 -*-
-#from google.appengine.api import memcache
-from viur.core import request, utils
-from datetime import datetime
+from viur.core import request, utils, db, errors
+from viur.core.tasks import PeriodicTask, callDeferred
+from time import time, sleep
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Dict, List, Callable, Any, Tuple
+import logging, random, threading, json, ipaddress, math
+
+
+class MemoryBackend(object):
+	"""
+		Stores the counters and states of :class:`RateLimit` in the memory of the current instance.
+
+		Only useful for development servers or applications running on exactly one instance.
+	"""
+
+	def __init__(self):
+		super(MemoryBackend, self).__init__()
+		self.counters = {}  # Mapping key -> [value, expires]
+		self.lock = threading.Lock()
+
+	def incr(self, key: str, expires: datetime) -> None:
+		with self.lock:
+			if len(self.counters) > 10000:  # Drop expired counters
+				now = datetime.now()
+				self.counters = {k: v for k, v in self.counters.items() if v[1] > now}
+			counter = self.counters.setdefault(key, [0, expires])
+			counter[0] += 1
+
+	def getMulti(self, keys: List[str]) -> Dict[str, int]:
+		now = datetime.now()
+		with self.lock:
+			return {k: self.counters[k][0] if k in self.counters and self.counters[k][1] > now else 0 for k in keys}
+
+	def get(self, key: str) -> dict:
+		with self.lock:
+			state = self.counters.get(key)
+			return dict(state[0]) if state and state[1] > datetime.now() else {}
+
+	def update(self, key: str, func: Callable[[dict], Any], expires: datetime) -> Any:
+		with self.lock:
+			state = self.counters.get(key)
+			state = dict(state[0]) if state and state[1] > datetime.now() else {}
+			res = func(state)
+			self.counters[key] = [state, expires]
+			return res
+
+
+class DatastoreBackend(object):
+	"""
+		Stores the counters of :class:`RateLimit` in the datastore, shared by all instances.
+
+		Each counter is split into *shards* entities; each increment updates a random one of them,
+		so concurrent requests rarely contend for the same entity. Reading fetches all shards of all
+		counters requested using one batched request. The state of token buckets is stored as json in
+		one entity per endpoint and updated inside a transaction.
+
+		As the datastore sustains only about one write per second to the same entity, concurrent updates of
+		one endpoint's state are likely to conflict. These are retried up to *retries* times; if they still
+		fail, :class:`RateLimit` rejects the call.
+	"""
+	kindName = "viur-ratelimit"
+
+	def __init__(self, shards: int = 4, retries: int = 3):
+		super(DatastoreBackend, self).__init__()
+		self.shards = shards
+		self.retries = retries
+
+	def _shardKeys(self, key):
+		return [db.Key(self.kindName, "%s-%s" % (key, shard)) for shard in range(0, self.shards)]
+
+	def incr(self, key: str, expires: datetime) -> None:
+		shardKey = random.choice(self._shardKeys(key))
+
+		def txn():
+			entity = db.Get(shardKey) or db.Entity(shardKey)
+			entity["value"] = (entity.get("value") or 0) + 1
+			entity["expires"] = expires
+			db.Put(entity)
+
+		try:
+			db.RunInTransaction(txn)
+		except Exception as e:  # Don't fail the request just because we couldn't count it
+			logging.warning("Could not increment rate limit counter %s: %s" % (key, e))
+
+	def getMulti(self, keys: List[str]) -> Dict[str, int]:
+		shardKeys = [self._shardKeys(x) for x in keys]
+		entities = iter(db.Get([y for x in shardKeys for y in x]))
+		res = {}
+		for key, keyShards in zip(keys, shardKeys):
+			res[key] = sum([entity["value"] for entity in [next(entities) for _ in keyShards] if entity])
+		return res
+
+	def get(self, key: str) -> dict:
+		entity = db.Get(db.Key(self.kindName, key))
+		return json.loads(entity["state"]) if entity else {}
+
+	def update(self, key: str, func: Callable[[dict], Any], expires: datetime) -> Any:
+		dbKey = db.Key(self.kindName, key)
+
+		def txn():
+			entity = db.Get(dbKey) or db.Entity(dbKey)
+			state = json.loads(entity["state"]) if entity.get("state") else {}
+			res = func(state)
+			entity["state"] = json.dumps(state)
+			entity["expires"] = expires
+			db.Put(entity)
+			return res
+
+		for attempt in range(0, self.retries + 1):
+			try:
+				return db.RunInTransaction(txn)
+			except db.Conflict:
+				if attempt == self.retries:
+					raise
+				sleep(random.uniform(0.01, 0.05) * (attempt + 1))  # Let the competing request finish first
+
+
+defaultBackend = DatastoreBackend()
 
 
 class RateLimit(object):
@@ -10,11 +126,34 @@ class RateLimit(object):
 
 		Usage: Create an instance of this object in you modules __init__ function. then call
 		isQuotaAvailable before executing the action to check if there is quota available and
-		after executing the action decrementQuota.
+		after executing the action decrementQuota. Or use :func:`rateLimited` to protect an exposed function.
+
+		The following algorithms are available:
+
+			- "fixed": Counts the calls in *steps* fixed buckets (up to 5) covering the time-span.
+			- "sliding": Counts the calls like "fixed", but estimates the calls made in the time-span ending
+				now by weighting the oldest step with the part of it still inside that time-span. So the limit
+				is lifted gradually instead of at the boundaries of steps.
+			- "tokenBucket": Refills *maxRate* tokens per time-span, each call takes one.
 
+		In any case, *burst* calls more than *maxRate* are allowed in the time-span (for "tokenBucket":
+		the bucket holds up to maxRate + burst tokens, so up to that many calls are allowed at once).
+
+		Each instance also keeps a token bucket per endpoint in memory, refilled at *maxRate* per time-span.
+		As that only counts the calls handled by the current instance, an empty bucket means there's
+		no quota left for sure, without asking the backend.
+
+		Throughput: The datastore sustains about one write per second to the same entity. Using
+		:class:`DatastoreBackend`, the counters of "fixed" and "sliding" are spread over its *shards* entities,
+		so about that many calls per second and endpoint are counted; increments beyond that may conflict
+		and are lost (the in-memory bucket still limits each instance). The state of "tokenBucket" is a single
+		entity per endpoint, so about one call per second and endpoint can be decided; calls whose update
+		keeps conflicting are rejected. Use "tokenBucket" only for endpoints expecting less than that.
 	"""
+	algorithms = {"fixed", "sliding", "tokenBucket"}
 
-	def __init__(self, resource, maxRate, minutes, method):
+	def __init__(self, resource, maxRate, minutes, method, backend=None, algorithm="fixed", burst=0,
+				 ipv4Prefix=32, ipv6Prefix=64):
 		"""
 		Initializes a new RateLimit gate.
 		:param resource: Name of the resource to protect
@@ -23,8 +162,20 @@ class RateLimit(object):
 		:type maxRate: int
 		:param minutes: Length of the time-span in minutes
 		:type minutes: int
-		:param method: Lock by IP or by the current user
-		:type method: 'ip' | 'user'
+		:param method: Lock by IP (or network, see ipv4Prefix and ipv6Prefix), by the current user or by the
+			key returned by the given function
+		:type method: 'ip' | 'user' | callable
+		:param backend: Where to store the counters; defaults to the datastore (see :class:`DatastoreBackend`)
+		:type backend: MemoryBackend | DatastoreBackend
+		:param algorithm: How to count the tries made, see above
+		:type algorithm: 'fixed' | 'sliding' | 'tokenBucket'
+		:param burst: Amount of tries allowed in addition to maxRate
+		:type burst: int
+		:param ipv4Prefix: Length of the network-prefix of IPv4 addresses locked together
+		:type ipv4Prefix: int
+		:param ipv6Prefix: Length of the network-prefix of IPv6 addresses locked together (the last 64 bits,
+			the interface id, are easily controlled by the user)
+		:type ipv6Prefix: int
 		"""
 		super(RateLimit, self).__init__()
 		self.resource = resource
@@ -32,51 +183,142 @@ class RateLimit(object):
 		self.minutes = minutes
 		self.steps = min(minutes, 5)
 		self.secondsPerStep = 60 * (float(minutes) / float(self.steps))
-		assert method in ["ip", "user"], "method must be 'ip' or 'user'"
+		assert method in ["ip", "user"] or callable(method), "method must be 'ip', 'user' or a callable"
+		assert algorithm in self.algorithms, "algorithm must be one of %s" % ", ".join(self.algorithms)
+		self.method = method
 		self.useUser = method == "user"
+		self.algorithm = algorithm
+		self.burst = burst
+		self.ipv4Prefix = ipv4Prefix
+		self.ipv6Prefix = ipv6Prefix
+		self.backend = backend or defaultBackend
+		self._localBuckets = {}  # Mapping endpoint -> [tokens, time of last refill]
+		self._localBucketsLock = threading.Lock()
+
+	@property
+	def limit(self):
+		return self.maxRate + self.burst
+
+	@property
+	def window(self):
+		return 60.0 * self.minutes
 
 	def _getEndpointKey(self):
 		"""
 		:warning:
 			It's invalid to call _getEndpointKey if method is set to user and there's no user logged in!
 
-		:return: the key associated with the current endpoint (it's IP or the key of the current user)
+		:return: the key associated with the current endpoint (it's IP-network, the key of the current user or
+			the result of the custom function)
 		"""
-		if self.useUser:
+		if callable(self.method):
+			return str(self.method())
+		elif self.useUser:
 			user = utils.getCurrentUser()
 			assert user, "Cannot decrement usage from guest!"
-			return user["key"]
+			return str(user["key"].id_or_name)
 		else:
-			remoteAddr = request.current.get().request.remote_addr
-			if "::" in remoteAddr:  # IPv6 in shorted form
-				remoteAddr = remoteAddr.split(":")
-				blankIndex = remoteAddr.index("")
-				missigParts = ["0000"] * (8 - len(remoteAddr))
-				remoteAddr = remoteAddr[:blankIndex] + missigParts + remoteAddr[blankIndex + 1:]
-				return ":".join(remoteAddr[:4])
-			elif ":" in remoteAddr:  # It's IPv6, so we remove the last 64 bits (interface id)
-				# as it is easily controlled by the user
-				return ":".join(remoteAddr.split(":")[4:])
-			else:  # It's IPv4, simply return that address
-				return remoteAddr
+			remoteAddr = ipaddress.ip_address(request.current.get().request.remote_addr)
+			prefix = self.ipv6Prefix if remoteAddr.version == 6 else self.ipv4Prefix
+			return str(ipaddress.ip_network("%s/%s" % (remoteAddr, prefix), strict=False))
 
 	def _getCurrentTimeKey(self):
 		"""
-		:return: the current lockperiod used in second position of the memcache key
+		:return: the current lockperiod used in second position of the counter key
+		"""
+		return str(int(time() / self.secondsPerStep))
+
+	def _refillLocalBucket(self, endPoint):
+		"""
+			Refills the in-process token bucket of the given endpoint. Must be called while holding _localBucketsLock.
+
+			:return: The bucket (a list of the current amount of tokens and the time of the last refill)
+		"""
+		now = time()
+		bucket = self._localBuckets.get(endPoint)
+		if bucket is None:
+			if len(self._localBuckets) > 10000:  # Forget about the endpoints we haven't seen for a while
+				self._localBuckets = {k: v for k, v in self._localBuckets.items() if now - v[1] < self.window}
+			bucket = self._localBuckets[endPoint] = [float(self.limit), now]
+		else:
+			bucket[0] = min(float(self.limit), bucket[0] + (now - bucket[1]) * self.maxRate / self.window)
+			bucket[1] = now
+		return bucket
+
+	def _getStateKey(self, endPoint):
+		return "%s-%s-%s" % (self.resource, endPoint, self.algorithm)
+
+	def _updateState(self, state, consume):
+		"""
+			Brings the state of a token bucket up to date and consumes one try if requested and possible.
+
+			:return: Tuple of whether a try is available (and has been consumed) and the seconds until the next
+				try will be available
+		"""
+		now = time()
+		tokens = min(float(self.limit), state.get("tokens", float(self.limit))
+					 + (now - state.get("updated", now)) * self.maxRate / self.window)
+		isAvailable = tokens >= 1
+		if isAvailable and consume:
+			tokens -= 1
+		state["tokens"] = tokens
+		state["updated"] = now
+		return isAvailable, max(0.0, (1 - tokens) * self.window / self.maxRate)
+
+	def _getFixedRetryAfter(self, endPoint):
+		"""
+			Sums up the counters of all steps of the time-span using one batched request.
+
+			:return: The seconds until the current step ends if the limit has been reached, 0 otherwise
+		"""
+		currentStep = int(self._getCurrentTimeKey())
+		counterKeys = ["%s-%s-%s" % (self.resource, endPoint, currentStep - x) for x in range(0, self.steps)]
+		if sum(self.backend.getMulti(counterKeys).values()) < self.limit:
+			return 0
+		return max(1, math.ceil(self.secondsPerStep - time() % self.secondsPerStep))
+
+	def _getSlidingRetryAfter(self, endPoint):
+		"""
+			Estimates the calls made in the time-span ending now from the counters of the steps overlapping it,
+			using one batched request. The oldest of these steps is weighted by the part of it still inside.
+
+			:return: The seconds until the estimate drops below the limit, 0 if it's below already
 		"""
-		dateTime = datetime.now()
-		key = dateTime.strftime("%Y-%m-%d-%%s")
-		secsinceMidnight = (dateTime - dateTime.replace(hour=0, minute=0, second=0, microsecond=0)).total_seconds()
-		currentStep = int(secsinceMidnight / self.secondsPerStep)
-		return key % currentStep
+		now = time()
+		currentStep = int(now / self.secondsPerStep)
+		elapsed = (now % self.secondsPerStep) / self.secondsPerStep  # Part of the current step passed
+		counterKeys = ["%s-%s-%s" % (self.resource, endPoint, currentStep - x) for x in range(0, self.steps + 1)]
+		counters = self.backend.getMulti(counterKeys)
+		recent = sum([counters[x] for x in counterKeys[:-1]])
+		oldest = counters[counterKeys[-1]]
+		if recent + oldest * (1 - elapsed) < self.limit:
+			return 0
+		if recent < self.limit:  # Wait until enough of the oldest step has left the time-span
+			return max(1, math.ceil((1 - (self.limit - recent) / oldest - elapsed) * self.secondsPerStep))
+		return max(1, math.ceil(self.secondsPerStep - now % self.secondsPerStep))
 
 	def decrementQuota(self):
 		"""
 		Removes one attempt from the pool of available Quota for that user/ip
 		"""
-		memcacheKey = "%s-%s-%s" % (self.resource, self._getEndpointKey(), self._getCurrentTimeKey())
-		if memcache.incr(memcacheKey) is None:
-			memcache.set(memcacheKey, 1, 2 * 60 * self.minutes)
+		endPoint = self._getEndpointKey()
+		with self._localBucketsLock:
+			bucket = self._refillLocalBucket(endPoint)
+			bucket[0] = max(0.0, bucket[0] - 1)
+		expires = datetime.now() + timedelta(minutes=2 * self.minutes)
+		if self.algorithm in ("fixed", "sliding"):
+			counterKey = "%s-%s-%s" % (self.resource, endPoint, self._getCurrentTimeKey())
+			self.backend.incr(counterKey, expires)
+		else:
+			def consume(state):
+				isAvailable, retryAfter = self._updateState(state, True)
+				if not isAvailable:
+					state["tokens"] -= 1  # Count it anyway, it has been made
+
+			try:
+				self.backend.update(self._getStateKey(endPoint), consume, expires)
+			except db.Conflict as e:  # Don't fail the request just because we couldn't count it
+				logging.warning("Could not update rate limit state of %s: %s" % (endPoint, e))
 
 	def isQuotaAvailable(self):
 		"""
@@ -84,13 +326,108 @@ class RateLimit(object):
 		:return: True if there's quota available, False otherwise
 		:rtype: bool
 		"""
+		return self.getRetryAfter() == 0
+
+	def getRetryAfter(self) -> int:
+		"""
+		Checks how long the current user/ip has to wait until quota is available again
+		:return: The seconds to wait; 0 if there's quota available right now
+		"""
 		endPoint = self._getEndpointKey()
-		dateTime = datetime.now()
-		secSinceMidnight = (dateTime - dateTime.replace(hour=0, minute=0, second=0, microsecond=0)).total_seconds()
-		currentStep = int(secSinceMidnight / self.secondsPerStep)
-		keyBase = dateTime.strftime("%Y-%m-%d-%%s")
-		memcacheKeys = []
-		for x in range(0, self.steps):
-			memcacheKeys.append("%s-%s-%s" % (self.resource, endPoint, keyBase % (currentStep - x)))
-		tmpRes = memcache.get_multi(memcacheKeys)
-		return sum(tmpRes.values()) <= self.maxRate
+		with self._localBucketsLock:
+			tokens = self._refillLocalBucket(endPoint)[0]
+		if tokens < 1:  # This instance alone has seen too many attempts already
+			return max(1, math.ceil((1 - tokens) * self.window / self.maxRate))
+		if self.algorithm == "fixed":
+			return self._getFixedRetryAfter(endPoint)
+		elif self.algorithm == "sliding":
+			return self._getSlidingRetryAfter(endPoint)
+		isAvailable, retryAfter = self._updateState(self.backend.get(self._getStateKey(endPoint)), False)
+		return 0 if isAvailable else max(1, math.ceil(retryAfter))
+
+	def acquire(self) -> Tuple[bool, int]:
+		"""
+		Checks if there's quota available for the current user/ip and removes one attempt if so.
+		Unlike calling isQuotaAvailable and decrementQuota, this is atomic for token buckets.
+		:return: Tuple of whether the attempt is allowed and the seconds to wait until the next one is
+		"""
+		endPoint = self._getEndpointKey()
+		with self._localBucketsLock:
+			bucket = self._refillLocalBucket(endPoint)
+			if bucket[0] < 1:  # Shed that load before it reaches the backend
+				return False, max(1, math.ceil((1 - bucket[0]) * self.window / self.maxRate))
+			bucket[0] -= 1
+		if self.algorithm in ("fixed", "sliding"):
+			if self.algorithm == "fixed":
+				retryAfter = self._getFixedRetryAfter(endPoint)
+			else:
+				retryAfter = self._getSlidingRetryAfter(endPoint)
+			if retryAfter:
+				return False, retryAfter
+			self.backend.incr("%s-%s-%s" % (self.resource, endPoint, self._getCurrentTimeKey()),
+							  datetime.now() + timedelta(minutes=2 * self.minutes))
+			return True, 0
+		try:
+			isAvailable, retryAfter = self.backend.update(
+				self._getStateKey(endPoint), lambda state: self._updateState(state, True),
+				datetime.now() + timedelta(minutes=2 * self.minutes))
+		except db.Conflict as e:
+			# Too many concurrent attempts to update that state; allowing them would lift the limit under load
+			logging.warning("Could not update rate limit state of %s, rejecting the attempt: %s" % (endPoint, e))
+			return False, 1
+		return isAvailable, 0 if isAvailable else max(1, math.ceil(retryAfter))
+
+
+def rateLimited(resource, maxRate, minutes, method="ip", **kwargs):
+	"""
+		Decorator, which restricts calls to the decorated function using a :class:`RateLimit`.
+
+		If there's no quota left, :class:`server.errors.TooManyRequests` is raised and the Retry-After
+		header tells the client when to try again. All additional arguments are passed to RateLimit.
+
+		Example::
+
+			@exposed
+			@rateLimited("api", 100, 1, algorithm="tokenBucket", burst=20)
+			def list(self, *args, **kwargs):
+				...
+	"""
+	rateLimit = RateLimit(resource, maxRate, minutes, method, **kwargs)
+
+	def decorator(f):
+		@wraps(f)
+		def wrapF(*args, **kwargs):
+			isAllowed, retryAfter = rateLimit.acquire()
+			if not isAllowed:
+				request.current.get().response.headers["Retry-After"] = str(retryAfter)
+				raise errors.TooManyRequests()
+			return f(*args, **kwargs)
+
+		wrapF.rateLimit = rateLimit
+		return wrapF
+
+	return decorator
+
+
+@PeriodicTask(60 * 4)
+def startClearRateLimitCounters():
+	"""
+		Removes expired counters of :class:`DatastoreBackend`
+	"""
+	doClearRateLimitCounters(None)
+
+
+@callDeferred
+def doClearRateLimitCounters(cursor):
+	query = db.Query(DatastoreBackend.kindName).filter("expires <", datetime.now())
+	query.setKeysOnly()
+	query.setCursor(cursor)
+	res = query.run(limit=500)
+	if not res:
+		return
+	db.Delete([x.key for x in res])
+	newCursor = query.getCursor()
+	if len(res) == 500 and newCursor:
+		if isinstance(newCursor, bytes):
+			newCursor = newCursor.decode("ASCII")
+		doClearRateLimitCounters(newCursor)
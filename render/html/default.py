@@ -3,13 +3,13 @@ from . import utils as jinjaUtils
 from .wrap import ListWrapper, SkelListWrapper
 
 from viur.core import utils, request, errors, securitykey
-from viur.core.skeleton import Skeleton, BaseSkeleton, RefSkel, skeletonByKind
+from viur.core.skeleton import Skeleton, BaseSkeleton, RefSkel, skeletonByKind, RelationalExpansion
 from viur.core.bones import *
 
 from collections import OrderedDict
 from jinja2 import Environment, FileSystemLoader, ChoiceLoader
 from viur.core.i18n import translate
-import os, logging, codecs
+import os, logging, codecs, threading
 from collections import namedtuple
 
 KeyValueWrapper = namedtuple("KeyValueWrapper", ["key", "descr"])
@@ -54,6 +54,7 @@ class Render(object):
 	cloneSuccessTemplate = "clone_success"
 
 	__haveEnvImported_ = False
+	_envLock = threading.RLock()  # Guards creating the environment, renders are shared by all threads
 
 	def __init__(self, parent=None, *args, **kwargs):
 		super(Render, self).__init__(*args, **kwargs)
@@ -230,7 +231,41 @@ class Render(object):
 
 		return res
 
-	def renderBoneValue(self, bone, skel, key, boneValue):
+	def getRenderPreparation(self, expand=None):
+		"""
+		Returns the function assigned to skel.renderPreparation, so values are rendered lazily by
+		:func:`renderBoneValue` once the template accesses them.
+
+		:param expand: Referenced entries that should be rendered completely
+		:type expand: server.skeleton.RelationalExpansion | None
+		"""
+		if not expand:
+			return self.renderBoneValue
+		return lambda bone, skel, key, boneValue: self.renderBoneValue(bone, skel, key, boneValue, expand=expand)
+
+	def renderRelationalDest(self, bone, dest, expand=None, lazy=False):
+		"""
+		Renders the referenced entry of a relationalBone.
+
+		If that entry has been resolved by *expand*, the full entry is rendered, otherwise only its refKeys.
+
+		:param lazy: Return the skeleton itself (with renderPreparation set) instead of its collected data
+		"""
+		refSkel = bone._refSkelCache
+		refSkel.renderPreparation = None
+		refSkel.setValuesCache(dest)
+		if expand and dest and refSkel["key"] in expand:
+			skel = expand.getSkel(refSkel["key"])
+			expand = expand.descend()
+		else:
+			skel = refSkel
+			expand = None
+		if lazy:
+			skel.renderPreparation = self.getRenderPreparation(expand)
+			return skel
+		return self.collectSkelData(skel, expand=expand)
+
+	def renderBoneValue(self, bone, skel, key, boneValue, expand=None):
 		"""
 		Renders the value of a bone.
 
@@ -240,6 +275,9 @@ class Render(object):
 		:param bone: The bone which value should be rendered.
 		:type bone: Any bone that inherits from :class:`server.bones.base.baseBone`.
 
+		:param expand: Referenced entries that should be rendered completely
+		:type expand: server.skeleton.RelationalExpansion | None
+
 		:return: A dict containing the rendered attributes.
 		:rtype: dict
 		"""
@@ -257,10 +295,8 @@ class Render(object):
 			if isinstance(boneValue, list):
 				tmpList = []
 				for k in boneValue:
-					refSkel = bone._refSkelCache
-					refSkel.setValuesCache(k["dest"])
 					if bone.using is None:
-						tmpList.append(self.collectSkelData(refSkel))
+						tmpList.append(self.renderRelationalDest(bone, k["dest"], expand))
 					else:
 						usingSkel = bone._usingSkelCache
 						if k["rel"]:
@@ -269,16 +305,13 @@ class Render(object):
 						else:
 							usingData = None
 						tmpList.append({
-							"dest": self.collectSkelData(refSkel),
+							"dest": self.renderRelationalDest(bone, k["dest"], expand),
 							"rel": usingData
 						})
 				return tmpList
 			elif isinstance(boneValue, dict):
-				refSkel = bone._refSkelCache
-				refSkel.setValuesCache(boneValue["dest"])
-				refSkel.renderPreparation = self.renderBoneValue
 				if bone.using is None:
-					return refSkel
+					return self.renderRelationalDest(bone, boneValue["dest"], expand, lazy=True)
 				else:
 					usingSkel = bone._usingSkelCache
 					if boneValue["rel"]:
@@ -288,7 +321,7 @@ class Render(object):
 						usingData = None
 
 					return {
-						"dest": self.collectSkelData(refSkel),
+						"dest": self.renderRelationalDest(bone, boneValue["dest"], expand),
 						"rel": usingData
 					}
 		elif bone.type == "record" or bone.type.startswith("record."):
@@ -310,22 +343,28 @@ class Render(object):
 			return boneValue
 		return None
 
-	def collectSkelData(self, skel):
+	def collectSkelData(self, skel, expand=None):
 		"""
 			Prepares values of one :class:`server.db.skeleton.Skeleton` or a list of skeletons for output.
 
 			:param skel: Skeleton which contents will be processed.
 			:type skel: server.db.skeleton.Skeleton
 
+			:param expand: Referenced entries that should be rendered completely
+			:type expand: server.skeleton.RelationalExpansion | None
+
 			:returns: A dictionary or list of dictionaries.
 			:rtype: dict | list
 		"""
 		# logging.error("collectSkelData %s", skel)
 		if isinstance(skel, list):
-			return [self.collectSkelData(x) for x in skel]
+			return [self.collectSkelData(x, expand=expand) for x in skel]
 		res = {}
 		for key, bone in skel.items():
-			val = self.renderBoneValue(bone, skel, key, skel[key])
+			if expand:
+				val = self.renderBoneValue(bone, skel, key, skel[key], expand=expand)
+			else:
+				val = self.renderBoneValue(bone, skel, key, skel[key])
 			res[key] = val
 			if isinstance(res[key], list):
 				res[key] = ListWrapper(res[key])
@@ -523,8 +562,12 @@ class Render(object):
 		# resList = []
 		# for skel in skellist:
 		#	resList.append(self.collectSkelData(skel))
-		skellist.renderPreparation = self.renderBoneValue
-		return template.render(skellist=skellist, params=params, **kwargs)  # SkelListWrapper(resList, skellist)
+		expand = RelationalExpansion.fromRequest(skellist.baseSkel, skellist[:]) if skellist else None
+		skellist.renderPreparation = self.getRenderPreparation(expand)
+		res = template.render(skellist=skellist, params=params, **kwargs)  # SkelListWrapper(resList, skellist)
+		if utils.conditionalRequest(res):  # Templates might include anything, we can only compare the result
+			return ""
+		return res
 
 	def listRootNodes(self, repos, tpl=None, params=None, **kwargs):
 		"""
@@ -579,8 +622,12 @@ class Render(object):
 
 		if isinstance(skel, Skeleton):
 			# res = self.collectSkelData(skel)
-			skel.renderPreparation = self.renderBoneValue
-		return template.render(skel=skel, params=params, **kwargs)
+			skel.renderPreparation = self.getRenderPreparation(
+				RelationalExpansion.fromRequest(skel, [skel.getValuesCache()]))
+		res = template.render(skel=skel, params=params, **kwargs)
+		if utils.conditionalRequest(res):  # Templates might include anything, we can only compare the result
+			return ""
+		return res
 
 	## Extended functionality for the Tree-Application ##
 	def listRootNodeContents(self, subdirs, entries, tpl=None, params=None, **kwargs):
@@ -845,31 +892,41 @@ class Render(object):
 			:rtype: jinja2.Environment
 		"""
 
+		if not "env" in dir(self):
+			with self._envLock:
+				if not "env" in dir(self):  # Another thread might have built it while we've been waiting
+					self.env = self._buildEnv()
+		return self.env
+
+	def _buildEnv(self):
+		"""
+			Creates the Jinja2 environment returned by :func:`getEnv`.
+		"""
+
 		def mkLambda(func, s):
 			return lambda *args, **kwargs: func(s, *args, **kwargs)
 
-		if not "env" in dir(self):
-			loaders = self.getLoaders()
-			self.env = Environment(loader=loaders, extensions=["jinja2.ext.do", "jinja2.ext.loopcontrols"])
+		loaders = self.getLoaders()
+		env = Environment(loader=loaders, extensions=["jinja2.ext.do", "jinja2.ext.loopcontrols"])
 
-			# Translation remains global
-			self.env.globals["_"] = lambda x, *args, **kwargs: str(x)  # FIXME !translate
-			self.env.filters["tr"] = lambda x, *args, **kwargs: str(x)  # FIXME !translate
+		# Translation remains global
+		env.globals["_"] = lambda x, *args, **kwargs: str(x)  # FIXME !translate
+		env.filters["tr"] = lambda x, *args, **kwargs: str(x)  # FIXME !translate
 
-			# Import functions.
-			for name, func in jinjaUtils.getGlobalFunctions().items():
-				self.env.globals[name] = mkLambda(func, self)
+		# Import functions.
+		for name, func in jinjaUtils.getGlobalFunctions().items():
+			env.globals[name] = mkLambda(func, self)
 
-			# Import filters.
-			for name, func in jinjaUtils.getGlobalFilters().items():
-				self.env.filters[name] = mkLambda(func, self)
+		# Import filters.
+		for name, func in jinjaUtils.getGlobalFilters().items():
+			env.filters[name] = mkLambda(func, self)
 
-			# Import extensions.
-			for ext in jinjaUtils.getGlobalExtensions():
-				self.env.add_extension(ext)
+		# Import extensions.
+		for ext in jinjaUtils.getGlobalExtensions():
+			env.add_extension(ext)
 
-			# Import module-specific environment, if available.
-			if "jinjaEnv" in dir(self.parent):
-				self.env = self.parent.jinjaEnv(self.env)
+		# Import module-specific environment, if available.
+		if "jinjaEnv" in dir(self.parent):
+			env = self.parent.jinjaEnv(env)
 
-		return self.env
+		return env
@@ -2,6 +2,7 @@
 
 from . import date
 from . import debug
+from . import fragmentcache
 from . import regex
 from . import session
 from . import strings
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from viur.core import utils, request, conf, cache
+from viur.core.render.html.utils import jinjaGlobalExtension
+from jinja2 import nodes
+from jinja2.ext import Extension
+from hashlib import sha512
+import os
+
+
+@jinjaGlobalExtension
+class FragmentCacheExtension(Extension):
+	"""
+	Jinja2 extension: Caches the rendered content of a block.
+
+	Usage::
+
+		{% cache "newsTeaser", 300, vary=[skel["key"]] %}
+			{% for news in getList("news", amount=5) %}...{% endfor %}
+		{% endcache %}
+
+	The first argument is a key unique for that block, the second (optional) one the amount of seconds
+	the content stays valid (None for unlimited). The content is cached separately for each language,
+	user class (guests, and users by their access rights) and each value given in *vary*.
+	See :func:`server.cache.cachedFragment` for how it's stored and invalidated.
+	"""
+	tags = {"cache"}
+
+	def parse(self, parser):
+		lineno = next(parser.stream).lineno
+		key = parser.parse_expression()
+		ttl = nodes.Const(None)
+		vary = nodes.Const(None)
+		while parser.stream.skip_if("comma"):
+			if parser.stream.current.type == "name" and parser.stream.look().type == "assign":
+				argName = next(parser.stream).value
+				next(parser.stream)
+				if argName == "vary":
+					vary = parser.parse_expression()
+				elif argName == "ttl":
+					ttl = parser.parse_expression()
+				else:
+					parser.fail("Unknown argument %s for cache" % argName, lineno)
+			else:
+				ttl = parser.parse_expression()
+		body = parser.parse_statements(["name:endcache"], drop_needle=True)
+		return nodes.CallBlock(self.call_method("_renderCached", [key, ttl, vary]), [], [], body).set_lineno(lineno)
+
+	def _renderCached(self, key, ttl, vary, caller):
+		if conf["viur.disableCache"] or request.current.get().disableCache:
+			return caller()
+		user = utils.getCurrentUser()
+		userClass = sorted(user["access"] or []) if user else None
+		mysha512 = sha512()
+		mysha512.update(str(["jinja2_fragment", key, vary, request.current.get().language, userClass,
+							 os.environ.get("GAE_VERSION", "")]).encode("UTF8"))
+		return cache.cachedFragment(mysha512.hexdigest(), "/_jinja2/%s" % key, caller, ttl,
+									conf["viur.cache.fragmentsInDatastore"])
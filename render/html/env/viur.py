@@ -1,12 +1,10 @@
 # -*- coding: utf-8 -*-
-from viur.core import utils, request, conf, prototypes, securitykey, errors, db
-from viur.core.skeleton import Skeleton, RelSkel, BaseSkeleton
+from viur.core import utils, request, conf, prototypes, securitykey, errors, db, cache
+from viur.core.skeleton import Skeleton, RelSkel, BaseSkeleton, SkelList, RelationalExpansion
 from viur.core.render.html.utils import jinjaGlobalFunction, jinjaGlobalFilter
 from viur.core.render.html.wrap import ListWrapper, SkelListWrapper
 import urllib, urllib.parse
 from hashlib import sha512
-#from google.appengine.ext import db
-#from google.appengine.api import memcache, users
 from datetime import timedelta
 from collections import OrderedDict
 import string
@@ -27,6 +25,11 @@ def execRequest(render, path, *args, **kwargs):
 	Must not include an protocol or hostname.
 	:type path: str
 
+	If *cachetime* is given, the result is cached for that many seconds (see
+	:func:`server.cache.cachedFragment`). *cacheusersensitive* controls whether the result depends on the
+	current user (0: no, 1: only cached for guests, 2: one for guests and one for all users,
+	3: for each user separately).
+
 	:returns: Whatever the requested resource returns. This is *not* limited to strings!
 	"""
 	if "cachetime" in kwargs:
@@ -34,6 +37,7 @@ def execRequest(render, path, *args, **kwargs):
 		del kwargs["cachetime"]
 	else:
 		cachetime = 0
+	userSensitive = kwargs.pop("cacheusersensitive", 0)
 
 	if conf["viur.disableCache"] or request.current.get().disableCache:  # Caching disabled by config
 		cachetime = 0
@@ -45,6 +49,10 @@ def execRequest(render, path, *args, **kwargs):
 		except RuntimeError:
 			cachetime = 0
 
+	user = utils.getCurrentUser() if cachetime and userSensitive else None
+	if user and userSensitive == 1:  # Only cached for guests
+		cachetime = 0
+
 	if cachetime:
 		# Calculate the cache key that entry would be stored under
 		tmpList = ["%s:%s" % (str(k), str(v)) for k, v in kwargs.items()]
@@ -53,22 +61,24 @@ def execRequest(render, path, *args, **kwargs):
 		tmpList.append(path)
 		if cacheEnvKey is not None:
 			tmpList.append(cacheEnvKey)
-
-		try:
-			appVersion = request.current.get().request.environ["CURRENT_VERSION_ID"].split('.')[0]
-		except:
-			appVersion = ""
-			logging.error("Could not determine the current application id! Caching might produce unexpected results!")
-
-		tmpList.append(appVersion)
+		tmpList.append(request.current.get().language)
+		if userSensitive == 2:
+			tmpList.append("__ISUSER" if user else None)
+		elif userSensitive == 3:
+			tmpList.append(str(user["key"]) if user else None)
+		tmpList.append(os.environ.get("GAE_VERSION", ""))
 		mysha512 = sha512()
 		mysha512.update(str(tmpList).encode("UTF8"))
-		cacheKey = "jinja2_cache_%s" % mysha512.hexdigest()
-		res = None  # memcache.get(cacheKey)
+		return cache.cachedFragment(mysha512.hexdigest(), "/" + path,
+									lambda: _execRequest(path, args, kwargs), cachetime,
+									conf["viur.cache.fragmentsInDatastore"])
+	return _execRequest(path, args, kwargs)
 
-		if res:
-			return res
 
+def _execRequest(path, args, kwargs):
+	"""
+		Performs the internal request for :func:`execRequest`.
+	"""
 	currentRequest = request.current.get()
 	tmp_params = currentRequest.kwargs.copy()
 	currentRequest.kwargs = {"__args": args, "__outer": tmp_params}
@@ -107,10 +117,6 @@ def execRequest(render, path, *args, **kwargs):
 	currentRequest.kwargs = tmp_params
 	currentRequest.internalRequest = lastRequestState
 
-	if cachetime:
-		pass
-		#memcache.set(cacheKey, resstr, cachetime)
-
 	return resstr
 
 
@@ -203,6 +209,40 @@ def getEntry(render, module, key=None, skel="viewSkel"):
 	return False
 
 
+@jinjaGlobalFunction
+def expandRelations(render, skels, depth=1, bones=None):
+	"""
+	Jinja2 global: Render the relationalBones of the given entries as the full entries they reference.
+
+	All referenced entries are fetched at once (one request per level of depth), which avoids calling
+	getEntry for each row of a list. Only entries the current user may view are expanded.
+
+	Usage: {% set skellist = expandRelations(skellist, 2) %}
+
+	:param skels: A skellist or a single skel passed to the template
+	:type skels: server.skeleton.SkelList | server.skeleton.Skeleton
+
+	:param depth: How many levels of relations should be resolved
+	:type depth: int
+
+	:param bones: If set, only these relationalBones of *skels* are resolved
+	:type bones: list of str
+
+	:returns: *skels*, rendering the expanded entries
+	"""
+	if isinstance(skels, SkelList):
+		skel, valuesCaches = skels.baseSkel, skels[:]
+	elif isinstance(skels, BaseSkeleton):
+		skel, valuesCaches = skels, [skels.getValuesCache()]
+	else:
+		return skels
+	expand = RelationalExpansion.fromSkels(skel, valuesCaches, depth=depth, boneNames=bones)
+	for valuesCache in valuesCaches:
+		valuesCache.renderAccessedValues = {}  # Discard anything rendered without the expansion
+	skels.renderPreparation = render.getRenderPreparation(expand)
+	return skels
+
+
 @jinjaGlobalFunction
 def getHostUrl(render, forceSSL=False, *args, **kwargs):
 	"""
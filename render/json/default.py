@@ -2,7 +2,7 @@
 import json
 from collections import OrderedDict
 from viur.core import errors, request, bones, utils
-from viur.core.skeleton import RefSkel, skeletonByKind, BaseSkeleton
+from viur.core.skeleton import RefSkel, skeletonByKind, BaseSkeleton, RelationalExpansion
 import logging
 
 class DefaultRender(object):
@@ -129,7 +129,22 @@ class DefaultRender(object):
 				 "descr": str(e.descr),
 				 "skel": self.renderSkelStructure(e.dataSkel())})
 
-	def renderBoneValue(self, bone, skel, key):
+	def renderRelationalDest(self, bone, dest, expand=None):
+		"""
+		Renders the referenced entry of a relationalBone.
+
+		If that entry has been resolved by *expand*, the full entry is rendered, otherwise only its refKeys.
+		"""
+		isFileBone = isinstance(bone, bones.fileBone)
+		refSkel = bone._refSkelCache
+		refSkel.renderPreparation = None
+		refSkel.setValuesCache(dest)
+		if expand and dest and refSkel["key"] in expand:
+			return self.renderSkelValues(expand.getSkel(refSkel["key"]), injectDownloadURL=isFileBone,
+										 expand=expand.descend())
+		return self.renderSkelValues(refSkel, injectDownloadURL=isFileBone)
+
+	def renderBoneValue(self, bone, skel, key, expand=None):
 		"""
 		Renders the value of a bone.
 
@@ -139,6 +154,9 @@ class DefaultRender(object):
 		:param bone: The bone which value should be rendered.
 		:type bone: Any bone that inherits from :class:`server.bones.base.baseBone`.
 
+		:param expand: Referenced entries that should be rendered completely
+		:type expand: server.skeleton.RelationalExpansion | None
+
 		:return: A dict containing the rendered attributes.
 		:rtype: dict
 		"""
@@ -152,33 +170,28 @@ class DefaultRender(object):
 				return skel[key].strftime("%H:%M:%S")
 		elif isinstance(bone, bones.relationalBone):
 			if isinstance(skel[key], list):
-				isFileBone = isinstance(bone, bones.fileBone)
-				refSkel = bone._refSkelCache
 				usingSkel = bone._usingSkelCache
 				tmpList = []
 				for k in skel[key]:
-					refSkel.setValuesCache(k["dest"])
 					if usingSkel:
 						usingSkel.setValuesCache(k.get("rel", {}))
 						usingData = self.renderSkelValues(usingSkel)
 					else:
 						usingData = None
 					tmpList.append({
-						"dest": self.renderSkelValues(refSkel, injectDownloadURL=isFileBone),
+						"dest": self.renderRelationalDest(bone, k["dest"], expand),
 						"rel": usingData
 					})
 				return tmpList
 			elif isinstance(skel[key], dict):
-				refSkel = bone._refSkelCache
 				usingSkel = bone._usingSkelCache
-				refSkel.setValuesCache(skel[key]["dest"])
 				if usingSkel:
 					usingSkel.setValuesCache(skel[key].get("rel", {}))
 					usingData = self.renderSkelValues(usingSkel)
 				else:
 					usingData = None
 				return {
-					"dest": self.renderSkelValues(refSkel, injectDownloadURL=isinstance(bone, bones.fileBone)),
+					"dest": self.renderRelationalDest(bone, skel[key]["dest"], expand),
 					"rel": usingData
 				}
 		elif isinstance(bone, bones.recordBone):
@@ -197,13 +210,16 @@ class DefaultRender(object):
 
 		return None
 
-	def renderSkelValues(self, skel, injectDownloadURL=False):
+	def renderSkelValues(self, skel, injectDownloadURL=False, expand=None):
 		"""
 		Prepares values of one :class:`server.db.skeleton.Skeleton` or a list of skeletons for output.
 
 		:param skel: Skeleton which contents will be processed.
 		:type skel: server.db.skeleton.Skeleton
 
+		:param expand: Referenced entries that should be rendered completely
+		:type expand: server.skeleton.RelationalExpansion | None
+
 		:returns: A dictionary or list of dictionaries.
 		:rtype: dict
 		"""
@@ -213,18 +229,21 @@ class DefaultRender(object):
 			return skel
 		res = {}
 		for key, bone in skel.items():
-			res[key] = self.renderBoneValue(bone, skel, key)
+			if expand:
+				res[key] = self.renderBoneValue(bone, skel, key, expand=expand)
+			else:
+				res[key] = self.renderBoneValue(bone, skel, key)
 		if injectDownloadURL and "dlkey" in skel and "name" in skel:
 			res["downloadUrl"] = utils.downloadUrlFor(skel["dlkey"], skel["name"], derived=False)
 		return res
 
-	def renderEntry(self, skel, actionName, params=None):
+	def renderEntry(self, skel, actionName, params=None, expand=None):
 		if isinstance(skel, list):
 			vals = [self.renderSkelValues(x) for x in skel]
 			struct = self.renderSkelStructure(skel[0])
 			errors = None
 		elif isinstance(skel, BaseSkeleton):
-			vals = self.renderSkelValues(skel)
+			vals = self.renderSkelValues(skel, expand=expand)
 			struct = self.renderSkelStructure(skel)
 			errors = [{"severity": x.severity.value, "fieldPath": x.fieldPath, "errorMessage": x.errorMessage} for x in skel.errors]
 		else:  # Hopefully we can pass it directly...
@@ -242,8 +261,31 @@ class DefaultRender(object):
 		request.current.get().response.headers["Content-Type"] = "application/json"
 		return json.dumps(res)
 
+	def isNotModified(self, valuesCaches, expand, validatorData, withLastModified=True):
+		"""
+			Sends the ETag (and Last-Modified) header for a response containing the given entries and checks
+			if the client still has a valid copy of it, see :func:`server.utils.conditionalRequest`.
+
+			:returns: True if the client's copy is still valid; the response must not be rendered then.
+		"""
+		entities = [x.entity for x in valuesCaches]
+		if expand:
+			entities.extend([x.entity for _, x in expand.entries.values()])
+		if any([x is None or x.key is None for x in entities]):
+			return False  # Not (completely) read from the datastore
+		changeDates = [x.get("changedate") for x in entities]
+		lastModified = max([x for x in changeDates if x], default=None) if withLastModified else None
+		return utils.conditionalRequest(
+			["json", validatorData, [(x.key, y) for x, y in zip(entities, changeDates)]], lastModified)
+
 	def view(self, skel, action="view", params=None, *args, **kwargs):
-		return self.renderEntry(skel, action, params)
+		if isinstance(skel, BaseSkeleton):
+			expand = RelationalExpansion.fromRequest(skel, [skel.getValuesCache()])
+			if self.isNotModified([skel.getValuesCache()], expand, [action, params]):
+				return ""
+		else:
+			expand = None
+		return self.renderEntry(skel, action, params, expand=expand)
 
 	def add(self, skel, action="add", params=None, **kwargs):
 		return self.renderEntry(skel, action, params)
@@ -255,8 +297,12 @@ class DefaultRender(object):
 		res = {}
 		skels = []
 
+		expand = RelationalExpansion.fromRequest(skellist.baseSkel, skellist[:]) if skellist else None
+		# Entries removed from that list don't change the date of the last modification
+		if self.isNotModified(skellist[:], expand, [action, params], withLastModified=False):
+			return ""
 		for skel in skellist:
-			skels.append(self.renderSkelValues(skel))
+			skels.append(self.renderSkelValues(skel, expand=expand))
 
 		res["skellist"] = skels
 
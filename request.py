@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-import threading
+import contextvars
 import sys, traceback, os, inspect
 from viur.core.config import conf
 from urllib import parse
@@ -14,6 +14,7 @@ import google.cloud.logging
 from google.cloud.logging.handlers import CloudLoggingHandler
 from google.cloud.logging.resource import Resource
 from time import time
+from typing import Callable
 
 client = google.cloud.logging.Client()
 loggingRessource = Resource(type="gae_app",
@@ -464,17 +465,45 @@ class RequestWrapper(object):
 
 	def __init__(self, *args, **kwargs):
 		super(RequestWrapper, self).__init__(*args, **kwargs)
-		self.data = threading.local()
+		# Stored as context variables, so each thread and each asyncio task sees its own request
+		self._request = contextvars.ContextVar("viur.request", default=None)
+		self._reqData = contextvars.ContextVar("viur.requestData", default=None)
 
 	def setRequest(self, request):
-		self.data.request = request
-		self.data.reqData = {}
+		self._request.set(request)
+		self._reqData.set({})
 
 	def get(self):
-		return (self.data.request)
+		return self._request.get()  # None if there's no request in this context
 
 	def requestData(self):
-		return (self.data.reqData)
+		reqData = self._reqData.get()
+		if reqData is None:
+			reqData = {}
+			self._reqData.set(reqData)
+		return (reqData)
 
 
 current = RequestWrapper()
+
+
+def bindCurrentContext(func: Callable) -> Callable:
+	"""
+		Binds *func* to the current request context (request, session and anything else stored in context variables).
+
+		New threads (and executors like :class:`concurrent.futures.ThreadPoolExecutor`) start with an empty context,
+		so current.get() or utils.getCurrentUser() won't work there. Wrap the function before handing it over::
+
+			executor.submit(bindCurrentContext(prefetch), key)
+
+		asyncio tasks inherit the context of their creator and don't need this.
+
+		:param func: The function to run in another thread
+		:returns: A function running *func* inside a copy of the current context on each call
+	"""
+	ctx = contextvars.copy_context()
+
+	def runInContext(*args, **kwargs):
+		return ctx.copy().run(func, *args, **kwargs)  # A context can't be entered by two threads at once
+
+	return runInContext
@@ -61,7 +61,7 @@ def _rebuildCspHeaderCache():
 		the Content-Security-Policy-Report-Only and Content-Security-Policy headers based on what has been passed
 		to 'addRule' earlier on. Should not be called directly.
 	"""
-	conf["viur.security.contentSecurityPolicy"]["_headerCache"] = {}
+	headerCache = {}  # Build it aside, requests in other threads are reading the current one
 	for enforceMode in ["monitor", "enforce"]:
 		resStr = ""
 		if not enforceMode in conf["viur.security.contentSecurityPolicy"]:
@@ -76,10 +76,10 @@ def _rebuildCspHeaderCache():
 					resStr += value
 			resStr += "; "
 		if enforceMode == "monitor":
-			conf["viur.security.contentSecurityPolicy"]["_headerCache"][
-				"Content-Security-Policy-Report-Only"] = resStr
+			headerCache["Content-Security-Policy-Report-Only"] = resStr
 		else:
-			conf["viur.security.contentSecurityPolicy"]["_headerCache"]["Content-Security-Policy"] = resStr
+			headerCache["Content-Security-Policy"] = resStr
+	conf["viur.security.contentSecurityPolicy"]["_headerCache"] = headerCache
 
 
 def enableStrictTransportSecurity(maxAge=365 * 24 * 60 * 60, includeSubDomains=False, preload=False):
@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-import threading
+import contextvars
 import json, pickle
 import base64
 import string, random
@@ -29,18 +29,48 @@ from hmac import compare_digest
 """
 
 
-class SessionWrapper(threading.local):
+class SessionWrapper(object):
 	cookieName = "viurCookie"
 
 	def __init__(self, sessionFactory, *args, **kwargs):
 		super(SessionWrapper, self).__init__(*args, **kwargs)
 		self.factory = sessionFactory
+		self._session = contextvars.ContextVar("viur.session", default=None)
+
+	@property
+	def session(self):
+		"""
+			The session of the current context (thread or asyncio task).
+			Raises AttributeError if there's none, like accessing an unset attribute would.
+		"""
+		session = self._session.get()
+		if session is None:
+			raise AttributeError("There's no session in the current context")
+		return session
+
+	@session.setter
+	def session(self, session):
+		self._session.set(session)
+
+	@session.deleter
+	def session(self):
+		self._session.set(None)
 
 	def load(self, req):
-		if not "session" in dir(self):
-			self.session = self.factory()
+		# Always start with a fresh session-object, so nothing is carried over from the previous request
+		# handled by this thread
+		self.session = self.factory()
 		return self.session.load(req)
 
+	def unload(self):
+		"""
+			Drops the session of the current context after its request has been processed.
+		"""
+		try:
+			del self.session
+		except AttributeError:
+			pass
+
 	def __contains__(self, key):
 		try:
 			return key in self.session
@@ -197,10 +227,12 @@ class GaeSession:
 		"""
 			Writes the session to the memcache/datastore.
 
-			Does nothing, if the session hasn't been changed in the current request.
+			Does nothing, if the session hasn't been changed in the current request. As a new session
+			isn't marked changed until something is written to it, visitors who never store anything
+			in their session won't cause any writes or cookies.
 		"""
 		try:
-			if self.changed or self.isInitial:
+			if self.changed:
 				serialized = base64.b64encode(pickle.dumps(self.session, protocol=pickle.HIGHEST_PROTOCOL))
 				# Get the current user id
 				try:
@@ -302,17 +334,18 @@ class GaeSession:
 			:warning: Everything (except the current language) is flushed.
 		"""
 		lang = self.session.get("language")
-		if self.httpKey:
-			db.Delete((self.kindName, self.httpKey))
+		if self.httpKey and not self.isInitial:
+			db.Delete(db.Key(self.kindName, self.httpKey))
 		self.httpKey = utils.generateRandomString(42)
 		self.sslKey = utils.generateRandomString(42)
 		self.staticSecurityKey = utils.generateRandomString(13)
 		self.securityKey = utils.generateRandomString(13)
-		self.changed = True
 		self.isInitial = True
 		self.session = {}
 		if lang:
 			self.session["language"] = lang
+		# Don't store the new session (and set no cookie) until there's something in it
+		self.changed = bool(self.session)
 
 	def items(self):
 		"""
@@ -321,6 +354,8 @@ class GaeSession:
 		return self.session.items()
 
 	def getSecurityKey(self):
+		if self.isInitial:  # That key must be valid when it's sent back, so we have to store this session
+			self.changed = True
 		return self.securityKey
 
 	def validateSecurityKey(self, key):
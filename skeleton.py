@@ -1,13 +1,17 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 from viur.core import db, utils, conf, errors
-from viur.core.bones import baseBone, keyBone, dateBone, selectBone, relationalBone, stringBone
-from viur.core.bones.bone import ReadFromClientError, ReadFromClientErrorSeverity
+from viur.core.bones import baseBone, keyBone, dateBone, selectBone, relationalBone, stringBone, numericBone
+from viur.core.bones.relationalBone import RelationalConsistency, RelationalRefresh
+from viur.core.bones.bone import ReadFromClientError, ReadFromClientErrorSeverity, getSystemInitialized
 from viur.core.tasks import CallableTask, CallableTaskBase, callDeferred
+from viur.core.cache import invalidateCacheEntries
 from collections import OrderedDict
 from time import time
+from hashlib import sha256
+from datetime import datetime, timedelta
 import inspect, os, sys, logging, copy
-from typing import Union, Dict, List, Callable
+from typing import Union, Dict, List, Tuple, Callable
 
 try:
 	import pytz
@@ -41,6 +45,10 @@ class MetaBaseSkel(type):
 
 				boneMap[key] = prop
 		cls.__boneMap__ = boneMap
+		cls.__serializers__ = {}
+		cls.__unserializers__ = {}
+		if getSystemInitialized():  # Bones are already frozen, we can build our fast-paths right now
+			cls.__serializers__, cls.__unserializers__ = buildFastSerializers(boneMap)
 		MetaBaseSkel._allSkelClasses.add(cls)
 		super(MetaBaseSkel, cls).__init__(name, bases, dct)
 
@@ -62,6 +70,107 @@ def iterAllSkelClasses():
 		yield cls
 
 
+# Templates used by buildFastSerializers. They must behave exactly like the serialize/unserialize
+# methods of the bones they're used for; %(name)r is replaced by the name of the bone and %(idx)s
+# by its position in the skeleton.
+__plainSerializeTemplate__ = """
+def serialize_%(idx)s(skeletonValues, name):
+	if %(name)r in skeletonValues.accessedValues:
+		skeletonValues.entity[%(name)r] = skeletonValues.accessedValues[%(name)r]
+		return True
+	return False
+"""
+
+__plainUnserializeTemplate__ = """
+def unserialize_%(idx)s(skeletonValues, name):
+	entity = skeletonValues.entity
+	if %(name)r in entity:
+		skeletonValues.accessedValues[%(name)r] = entity[%(name)r]
+		return True
+	return False
+"""
+
+__multipleSelectUnserializeTemplate__ = """
+def unserialize_%(idx)s(skeletonValues, name):
+	entity = skeletonValues.entity
+	if %(name)r in entity:
+		value = entity[%(name)r]
+		if not isinstance(value, list):
+			value = [value]
+		skeletonValues.accessedValues[%(name)r] = value
+		return True
+	return False
+"""
+
+__numericUnserializeTemplate__ = """
+def unserialize_%(idx)s(skeletonValues, name):
+	entity = skeletonValues.entity
+	if %(name)r in entity:
+		value = entity[%(name)r]
+		if type(value) is %(type)s:
+			skeletonValues.accessedValues[%(name)r] = value
+			return True
+		return bone_%(idx)s.unserialize(skeletonValues, name)  # Needs conversion
+	return False
+"""
+
+__keyUnserializeTemplate__ = """
+def unserialize_%(idx)s(skeletonValues, name):
+	entity = skeletonValues.entity
+	if isinstance(entity, Entity) and entity.key and not entity.key.is_partial:
+		skeletonValues.accessedValues[%(name)r] = entity.key
+		return True
+	return bone_%(idx)s.unserialize(skeletonValues, name)
+"""
+
+
+def buildFastSerializers(boneMap: Dict[str, baseBone]):
+	"""
+		Generates specialized serialize/unserialize functions for the given bones.
+
+		Bones that just copy their value (or need only a trivial conversion) get a function that's
+		generated from the templates above, so reading or writing such a value doesn't have to walk
+		through the generic bone methods. All other bones are mapped to their bound methods.
+		As the generated code depends on the bone's configuration, this must only be called once the
+		bones are frozen (ie. the system has been initialized).
+
+		:param boneMap: Mapping of bone-names to bone-instances as found in :attr:`__boneMap__`
+		:return: Two dictionaries mapping bone-names to serialize- and unserialize-functions
+	"""
+	source = []
+	namespace = {"Entity": db.Entity}
+	serializers = {}
+	unserializers = {}
+	for idx, (boneName, bone) in enumerate(boneMap.items()):
+		namespace["bone_%s" % idx] = bone
+		boneCls = type(bone)
+		params = {"name": boneName, "idx": idx}
+		if boneCls.serialize is baseBone.serialize:
+			source.append(__plainSerializeTemplate__ % params)
+		else:
+			serializers[boneName] = bone.serialize
+		if boneCls.unserialize is baseBone.unserialize \
+				or (boneCls.unserialize is stringBone.unserialize and not bone.languages) \
+				or (boneCls.unserialize is selectBone.unserialize and not bone.multiple):
+			source.append(__plainUnserializeTemplate__ % params)
+		elif boneCls.unserialize is selectBone.unserialize:
+			source.append(__multipleSelectUnserializeTemplate__ % params)
+		elif boneCls.unserialize is numericBone.unserialize:
+			params["type"] = "float" if bone.precision else "int"
+			source.append(__numericUnserializeTemplate__ % params)
+		elif boneCls.unserialize is keyBone.unserialize and boneName == "key":
+			source.append(__keyUnserializeTemplate__ % params)
+		else:
+			unserializers[boneName] = bone.unserialize
+	exec(compile("".join(source), "<fastSerializers>", "exec"), namespace)
+	for idx, boneName in enumerate(boneMap.keys()):
+		if "serialize_%s" % idx in namespace:
+			serializers[boneName] = namespace["serialize_%s" % idx]
+		if "unserialize_%s" % idx in namespace:
+			unserializers[boneName] = namespace["unserialize_%s" % idx]
+	return serializers, unserializers
+
+
 class SkeletonValues(object):
 	__slots__ = ["entity", "accessedValues", "renderAccessedValues"]
 
@@ -216,6 +325,7 @@ class BaseSkeleton(object, metaclass=MetaBaseSkel):
 			bone = getattr(cls, attrName)
 			if isinstance(bone, baseBone):
 				bone.setSystemInitialized()
+		cls.__serializers__, cls.__unserializers__ = buildFastSerializers(cls.__boneMap__)
 
 	def clone(self):
 		"""
@@ -269,10 +379,13 @@ class BaseSkeleton(object, metaclass=MetaBaseSkel):
 			if key in vc.renderAccessedValues:
 				return vc.renderAccessedValues[key]
 		if key not in vc.accessedValues:
-			boneInstance = getattr(self, key, None)
+			boneInstance = self.boneMap.get(key) or getattr(self, key, None)
 			if boneInstance:
 				if vc.entity is not None:
-					boneInstance.unserialize(vc, key)
+					if key in self.__unserializers__ and boneInstance is self.__boneMap__[key]:
+						self.__unserializers__[key](vc, key)  # Use the fast-path for this class
+					else:
+						boneInstance.unserialize(vc, key)
 				else:
 					vc.accessedValues[key] = boneInstance.getDefaultValue()
 		if not self.renderPreparation:
@@ -389,10 +502,20 @@ class BaseSkeleton(object, metaclass=MetaBaseSkel):
 			This function causes a refresh of all relational bones and their associated
 			information.
 		"""
+		self.refreshBones()
+		refreshRelations(self, [self.valuesCache])
+
+	def refreshBones(self):
+		"""
+			Like :meth:`refresh`, but leaves relationalBones using the default refresh untouched.
+			Use :func:`refreshRelations` to refresh these for multiple skeletons at once.
+		"""
 		for key, bone in self.items():
 			if not isinstance(bone, baseBone):
 				continue
 			self[key]  # Ensure value gets loaded
+			if isinstance(bone, relationalBone) and type(bone).refresh is relationalBone.refresh:
+				continue  # These are refreshed by refreshRelations
 			if "refresh" in dir(bone):
 				bone.refresh(self.valuesCache, key, self)
 
@@ -604,6 +727,7 @@ class Skeleton(BaseSkeleton, metaclass=MetaSkel):
 		self.setValues(dbRes)
 		# key = str(dbRes.key())
 		self["key"] = dbKey
+		refreshRelations(self, [self.valuesCache], RelationalRefresh.OnRead)
 		return True
 
 	def toDB(self, clearUpdateTag=False):
@@ -623,159 +747,196 @@ class Skeleton(BaseSkeleton, metaclass=MetaSkel):
 			:returns: The data store key of the entity.
 			:rtype: str
 		"""
+		return self.toDBMulti([self], clearUpdateTag=clearUpdateTag)[0]
+
+	@classmethod
+	def toDBMulti(cls, skels: List[Skeleton], clearUpdateTag: bool = False, batchSize: int = 50,
+				  refreshRelationalBones: bool = True) -> List[db.KeyClass]:
+		"""
+			Store multiple skeletons of this kind to data store at once.
+
+			Works like :func:`~server.skeleton.Skeleton.toDB`, but the current entities, their blob-locks and
+			the unique value locks are fetched and written using batched requests. Up to *batchSize*
+			skeletons are written inside one transaction; batches that would exceed the mutations allowed
+			in one commit are split. Once all entities have been written, each bone is informed about the
+			whole set by :func:`server.bones.baseBone.postSavedHandlerMulti`.
+
+			:param skels: The skeletons to store. All of them must share the kindName of this class.
+			:type skels: list of Skeleton
+			:param clearUpdateTag: If True, these entities won't be marked dirty;
+				This avoids from being fetched by the background task updating relations.
+			:type clearUpdateTag: bool
+			:param batchSize: Maximum amount of skeletons written inside one transaction.
+			:type batchSize: int
+			:param refreshRelationalBones: If False, the values of relationalBones using RelationalRefresh.OnSave
+				aren't refreshed, as the caller has done so already (see :func:`refreshRelations`).
+			:type refreshRelationalBones: bool
+
+			:returns: The data store keys of the entities, in the same order as *skels*.
+			:rtype: list of db.Key
+		"""
+		if not isinstance(clearUpdateTag, bool):
+			raise ValueError(
+				"Got an unsupported type %s for clearUpdateTag. toDB doesn't accept a key argument any more!" % str(
+					type(clearUpdateTag)))
+		entries = []
+		for skel in skels:
+			if skel.kindName != cls.kindName:
+				raise ValueError("Cannot store a skeleton of kind %s using %s" % (skel.kindName, cls.kindName))
+			key = skel["key"] or None
+			# Allow bones to perform outstanding "magic" operations before saving to db
+			for bkey, _bone in skel.items():
+				_bone.performMagic(skel.valuesCache, bkey, isAdd=key is None)
+			entries.append((key, skel))
+
+		# Refresh the values copied by relationalBones using RelationalRefresh.OnSave (or OnRead)
+		if refreshRelationalBones:
+			skelsByType = OrderedDict()
+			for skel in skels:
+				skelsByType.setdefault(type(skel), []).append(skel.valuesCache)
+			for skelCls, valuesCaches in skelsByType.items():
+				refreshRelations(skelCls(), valuesCaches, RelationalRefresh.OnSave)
+
+		# Run our SaveTxn
+		if db.IsInTransaction():
+			results = cls._txnUpdateMulti(entries, clearUpdateTag)
+		else:
+			results = _runInBatchedTransactions(cls._txnUpdateMulti, entries, batchSize, clearUpdateTag)
+
+		# Perform post-save operations (postProcessSerializedData Hook, Searchindex, ..)
+		savedByType = OrderedDict()  # Skeleton class -> ([skel, ...], [key, ...])
+		for srcSkel, (key, dbObj, skel, changeList, isAdd) in zip(skels, results):
+			srcSkel["key"] = key
+			savedSkels, savedKeys = savedByType.setdefault(type(skel), ([], []))
+			savedSkels.append(skel)
+			savedKeys.append(key)
+		for savedSkels, savedKeys in savedByType.values():
+			for boneName, bone in savedSkels[0].items():
+				bone.postSavedHandlerMulti(savedSkels, boneName, savedKeys)
+
+		for key, dbObj, skel, changeList, isAdd in results:
+			skel.postSavedHandler(key, dbObj)
 
-		def txnUpdate(dbKey, mergeFrom, clearUpdateTag):
+			# Inform the custom DB Adapter of the changes made to the entry
+			if cls.customDatabaseAdapter:
+				cls.customDatabaseAdapter.updateEntry(dbObj, skel, changeList, isAdd)
+
+		# Update the entries referencing the changed ones, using one batched request for all of them
+		if not clearUpdateTag:
+			scheduleUpdateRelationsMulti([(key, changeList if len(changeList) < 30 else None)
+										  for key, dbObj, skel, changeList, isAdd in results if not isAdd])
+
+		# Remove cached responses depending on these entries
+		invalidateCacheEntries([x[0] for x in results])
+
+		return [x[0] for x in results]
+
+	@classmethod
+	def _txnUpdateMulti(cls, entries, clearUpdateTag, maxMutations=None):
+		"""
+			Merges the values of the given skeletons into their entities and writes them back.
+			Must be called inside a transaction.
+
+			:param entries: List of (key, mergeFrom) tuples; key is None for entries that will be added
+			:param clearUpdateTag: If True, these entities won't be marked dirty.
+			:param maxMutations: If set, :exc:`_MutationLimitExceeded` is raised before anything is written if
+				more than one entry is given and they need more mutations than this.
+			:returns: List of (key, dbObj, skel, changeList, isAdd) tuples in the order of *entries*
+		"""
+		# We'll generate the keys for new entries early so we can use them for locks etc
+		addCount = len([x for x, _ in entries if not x])
+		newKeys = iter(db.AllocateIds(db.Key(cls.kindName), addCount) if addCount else [])
+		dbKeys = [db.keyHelper(x, cls.kindName) if x else next(newKeys) for x, _ in entries]
+
+		# Load the current values and blob-lock objects from Datastore, using one batched Get each
+		existingKeys = [dbKey for dbKey, (key, _) in zip(dbKeys, entries) if key]
+		existingObjs = dict(zip(existingKeys, db.Get(existingKeys)))
+		oldBlobLockObjs = dict(zip(existingKeys, db.Get([db.Key("viur-blob-locks", x.id_or_name) for x in existingKeys])))
+
+		results = []
+		putList = []
+		requestedLocks = {}  # Key of the lock-object -> (entity name, boneName, value) of the entry requesting it
+		releasedLocks = {}  # Key of the lock-object -> entity name of the entry that doesn't need it anymore
+		releasedRelationalLocks = []  # Keys of incoming-relational-locks not held by these entries anymore
+		releasedLegacyRelationalLocks = []  # (destKey, srcKey) of locks written by an older version
+		for dbKey, (key, mergeFrom) in zip(dbKeys, entries):
+			isAdd = not key
 			blobList = set()
 			skel = type(mergeFrom)()
 			changeList = []
-
-			# Load the current values from Datastore or create a new, empty db.Entity
-			if not dbKey:
-				# We'll generate the key we'll be stored under early so we can use it for locks etc
-				newKey = db.__client__.allocate_ids(db.Key(skel.kindName), 1)[0]
-				dbObj = db.Entity(newKey)
+			dbObj = existingObjs.get(dbKey)
+			if not dbObj:
+				dbObj = db.Entity(dbKey)
 				oldCopy = {}
-				dbObj["viur"] = {}
 				skel.valuesCache.entity = dbObj
-				oldBlobLockObj = None
-				isAdd = True
 			else:
-				if isinstance(dbKey, str) or isinstance(dbKey, int):
-					dbKey = db.Key(self.kindName, dbKey)
-				dbObj = db.Get(dbKey)
-				if not dbObj:
-					dbObj = db.Entity(dbKey)
-					oldCopy = {}
-					skel.valuesCache.entity = dbObj
-				else:
-					skel.setValues(dbObj)
-					oldCopy = {k: v for k, v in dbObj.items()}
-				oldBlobLockObj = db.Get(db.Key("viur-blob-locks", dbKey.id_or_name))
-				isAdd = False
+				skel.setValues(dbObj)
+				oldCopy = {k: v for k, v in dbObj.items()}
 			if not "viur" in dbObj:
 				dbObj["viur"] = {}
 			# Merge values and assemble unique properties
 			# Move accessed Values from srcSkel over to skel
 			skel.valuesCache.accessedValues = mergeFrom.valuesCache.accessedValues
-			for key, bone in skel.items():
-				if key == "key":  # Explicitly skip key on top-level - this had been set above
+			serializers = skel.__serializers__
+			for boneName, bone in skel.items():
+				if boneName == "key":  # Explicitly skip key on top-level - this had been set above
 					continue
 				# Remember old hashes for bones that must have an unique value
 				oldUniqueValues = []
 				if bone.unique:
-					if "%s_uniqueIndexValue" % key in dbObj["viur"]:
-						oldUniqueValues = dbObj["viur"]["%s_uniqueIndexValue" % key]
+					oldUniqueValues = dbObj["viur"].get("%s_uniqueIndexValue" % boneName) or []
 
 				# Merge the values from mergeFrom in
-				if key in skel.valuesCache.accessedValues:
-					# bone.mergeFrom(skel.valuesCache, key, mergeFrom)
-					bone.serialize(skel.valuesCache, key)
-
-				## Serialize bone into entity
-				# dbObj = bone.serialize(skel.valuesCache, key, dbObj)
+				if boneName in skel.valuesCache.accessedValues:
+					if boneName in serializers and bone is skel.__boneMap__[boneName]:
+						serializers[boneName](skel.valuesCache, boneName)
+					else:
+						bone.serialize(skel.valuesCache, boneName)
+					if isinstance(bone, relationalBone) and bone.updateLevel != 2 \
+							and bone.refreshPolicy.value >= RelationalRefresh.OnSave.value:
+						# These values have been refreshed in toDBMulti
+						dbObj["viur"]["%s_refreshedAt" % boneName] = time()
 
 				# Obtain referenced blobs
-				blobList.update(bone.getReferencedBlobs(skel, key))
+				blobList.update(bone.getReferencedBlobs(skel, boneName))
 
 				# Check if the value has actually changed
-				if dbObj.get(key) != oldCopy.get(key):
-					changeList.append(key)
+				if dbObj.get(boneName) != oldCopy.get(boneName):
+					changeList.append(boneName)
 
-				# Lock hashes from bones that must have unique values
+				# Remember the locks for bones that must have unique values; they're checked together below
 				if bone.unique:
-					# Check if the property is really unique
-					newUniqueValues = bone.getUniquePropertyIndexValues(skel, key)
+					lockKind = "%s_%s_uniquePropertyIndex" % (skel.kindName, boneName)
+					newUniqueValues = bone.getUniquePropertyIndexValues(skel, boneName)
 					for newLockValue in newUniqueValues:
-						lockObj = db.Get(db.Key("%s_%s_uniquePropertyIndex" % (skel.kindName, key), newLockValue))
-						if lockObj:
-							# There's already a lock for that value, check if we hold it
-							if lockObj["references"] != dbObj.key.id_or_name:
-								# This value has already been claimed, and not by us
-								raise ValueError(
-									"The unique value '%s' of bone '%s' has been recently claimed!" %
-									(self[key], key))
-						else:
-							# This value is locked for the first time, create a new lock-object
-							newLockObj = db.Entity(db.Key(
-								"%s_%s_uniquePropertyIndex" % (skel.kindName, key),
-								newLockValue))
-							newLockObj["references"] = dbObj.key.id_or_name
-							db.Put(newLockObj)
-						if newLockValue in oldUniqueValues:
-							oldUniqueValues.remove(newLockValue)
-					dbObj["viur"]["%s_uniqueIndexValue" % key] = newUniqueValues
-					# Remove any lock-object we're holding for values that we don't have anymore
+						lockKey = db.Key(lockKind, newLockValue)
+						if lockKey in requestedLocks and requestedLocks[lockKey][0] != dbKey.id_or_name:
+							raise ValueError("The unique value '%s' of bone '%s' is used twice in this batch!" %
+											 (mergeFrom[boneName], boneName))
+						requestedLocks[lockKey] = (dbKey.id_or_name, boneName, mergeFrom[boneName])
 					for oldValue in oldUniqueValues:
-						# Try to delete the old lock
-						oldLockObj = db.Get(("%s_%s_uniquePropertyIndex" % (skel.kindName, key), oldValue))
-						if oldLockObj:
-							if oldLockObj["references"] != dbObj.id_or_name:
-								# We've been supposed to have that lock - but we don't.
-								# Don't remove that lock as it now belongs to a different entry
-								logging.critical("Detected Database corruption! A Value-Lock had been reassigned!")
-							else:
-								# It's our lock which we don't need anymore
-								db.Delete(("%s_%s_uniquePropertyIndex" % (skel.kindName, key), oldValue))
-						else:
-							logging.critical("Detected Database corruption! Could not delete stale lock-object!")
+						if oldValue not in newUniqueValues:
+							releasedLocks[db.Key(lockKind, oldValue)] = dbKey.id_or_name
+					dbObj["viur"]["%s_uniqueIndexValue" % boneName] = newUniqueValues
+
+				# Create or release the locks on entities referenced with RelationalConsistency.PreventDeletion
+				if isinstance(bone, relationalBone):
+					oldRelationalLocks = set(oldCopy.get("%s_outgoingRelationalLocks" % boneName) or [])
+					newRelationalLocks = set(dbObj.get("%s_outgoingRelationalLocks" % boneName) or [])
+					for destKey in newRelationalLocks - oldRelationalLocks:
+						relationalLockObj = db.Entity(getRelationalLockKey(destKey, dbKey, boneName))
+						relationalLockObj["dest"] = destKey
+						relationalLockObj["src"] = dbKey
+						relationalLockObj["viur_src_property"] = boneName
+						putList.append(relationalLockObj)
+					for destKey in oldRelationalLocks - newRelationalLocks:
+						if not isinstance(destKey, db.KeyClass):  # Written by an older version
+							destKey = db.Key(bone.kind, destKey)
+							releasedLegacyRelationalLocks.append((destKey, dbKey))
+						releasedRelationalLocks.append(getRelationalLockKey(destKey, dbKey, boneName))
 
 			# Ensure the SEO-Keys are up2date
-			lastRequestedSeoKeys = dbObj["viur"].get("viurLastRequestedSeoKeys") or {}
-			lastSetSeoKeys = dbObj["viur"].get("viurCurrentSeoKeys") or {}
-			currentSeoKeys = skel.getCurrentSEOKeys()
-			if not isinstance(dbObj["viur"].get("viurCurrentSeoKeys"), dict):
-				dbObj["viur"]["viurCurrentSeoKeys"] = {}
-			if currentSeoKeys:
-				# Convert to lower-case and remove certain characters
-				for lang, value in list(currentSeoKeys.items()):
-					value = value.lower()
-					value = value.replace("<", "") \
-						.replace(">", "") \
-						.replace("\"", "") \
-						.replace("'", "") \
-						.replace("\n", "") \
-						.replace("\0", "") \
-						.replace("/", "") \
-						.replace("\\", "") \
-						.replace("?", "") \
-						.replace("&", "") \
-						.replace("#", "").strip()
-					currentSeoKeys[lang] = value
-			for language in (conf["viur.availableLanguages"] or [conf["viur.defaultLanguage"]]):
-				if currentSeoKeys and language in currentSeoKeys:
-					currentKey = currentSeoKeys[language]
-					if currentKey != lastRequestedSeoKeys.get(language):  # This one is new or has changed
-						newSeoKey = currentSeoKeys[language]
-						for _ in range(0, 3):
-							entryUsingKey = db.Query(self.kindName).filter("viurActiveSeoKeys AC", newSeoKey).get()
-							if entryUsingKey and entryUsingKey.name != dbObj.name:
-								# It's not unique; append a random string and try again
-								newSeoKey = "%s-%s" % (currentSeoKeys[language], utils.generateRandomString(5).lower())
-							else:
-								break
-						else:
-							raise ValueError("Could not generate an unique seo key in 3 attempts")
-					else:
-						newSeoKey = currentKey
-					lastSetSeoKeys[language] = newSeoKey
-				else:
-					# We'll use the database-key instead
-					lastSetSeoKeys[language] = dbObj.key.id_or_name
-				# Store the current, active key for that language
-				dbObj["viur"]["viurCurrentSeoKeys"][language] = lastSetSeoKeys[language]
-			if not dbObj["viur"].get("viurActiveSeoKeys"):
-				dbObj["viur"]["viurActiveSeoKeys"] = []
-			for language, seoKey in lastSetSeoKeys.items():
-				if dbObj["viur"]["viurCurrentSeoKeys"][language] not in dbObj["viur"]["viurActiveSeoKeys"]:
-					# Ensure the current, active seo key is in the list of all seo keys
-					dbObj["viur"]["viurActiveSeoKeys"].insert(0, seoKey)
-			if dbObj.key.id_or_name not in dbObj["viur"]["viurActiveSeoKeys"]:
-				# Ensure that key is also in there
-				dbObj["viur"]["viurActiveSeoKeys"].insert(0, str(dbObj.key.id_or_name))
-			# Trim to the last 200 used entries
-			dbObj["viur"]["viurActiveSeoKeys"] = dbObj["viur"]["viurActiveSeoKeys"][:200]
-			# Store lastRequestedKeys so further updates can run more efficient
-			dbObj["viur"]["viurLastRequestedSeoKeys"] = currentSeoKeys
+			skel._updateSEOKeys(dbObj)
 
 			if clearUpdateTag:
 				# Mark this entity as Up-to-date.
@@ -786,24 +947,23 @@ class Skeleton(BaseSkeleton, metaclass=MetaSkel):
 			dbObj = skel.preProcessSerializedData(dbObj)
 
 			# Allow the custom DB Adapter to apply last minute changes to the object
-			if self.customDatabaseAdapter:
-				dbObj = self.customDatabaseAdapter.preprocessEntry(dbObj, skel, changeList, isAdd)
-
-			# Write the core entry back
-			db.Put(dbObj)
+			if cls.customDatabaseAdapter:
+				dbObj = cls.customDatabaseAdapter.preprocessEntry(dbObj, skel, changeList, isAdd)
+			putList.append(dbObj)
 
-			# Now write the blob-lock object
+			# Now update the blob-lock object
 			blobList = skel.preProcessBlobLocks(blobList)
 			if blobList is None:
 				raise ValueError("Did you forget to return the bloblist somewhere inside getReferencedBlobs()?")
 			if None in blobList:
 				logging.error("b1l is %s" % blobList)
 				raise ValueError("None is not a valid blobKey.")
+			oldBlobLockObj = oldBlobLockObjs.get(dbKey)
 			if oldBlobLockObj is not None:
 				oldBlobs = set(oldBlobLockObj.get("active_blob_references") or [])
 				removedBlobs = oldBlobs - blobList
 				oldBlobLockObj["active_blob_references"] = list(blobList)
-				if oldBlobLockObj["old_blob_references"] is None:
+				if oldBlobLockObj.get("old_blob_references") is None:
 					oldBlobLockObj["old_blob_references"] = [x for x in removedBlobs]
 				else:
 					tmp = set(oldBlobLockObj["old_blob_references"] + [x for x in removedBlobs])
@@ -812,52 +972,121 @@ class Skeleton(BaseSkeleton, metaclass=MetaSkel):
 					oldBlobLockObj["old_blob_references"] is not None \
 					and len(oldBlobLockObj["old_blob_references"]) > 0
 				oldBlobLockObj["is_stale"] = False
-				db.Put(oldBlobLockObj)
+				putList.append(oldBlobLockObj)
 			else:  # We need to create a new blob-lock-object
 				blobLockObj = db.Entity(db.Key("viur-blob-locks", dbObj.key.id_or_name))
 				blobLockObj["active_blob_references"] = list(blobList)
 				blobLockObj["old_blob_references"] = []
 				blobLockObj["has_old_blob_references"] = False
 				blobLockObj["is_stale"] = False
-				db.Put(blobLockObj)
-
-			return dbObj.key, dbObj, skel, changeList
-
-		# END of txnUpdate subfunction
-
-		key = self["key"] or None
-		isAdd = key is None
-		if not isinstance(clearUpdateTag, bool):
-			raise ValueError(
-				"Got an unsupported type %s for clearUpdateTag. toDB doesn't accept a key argument any more!" % str(
-					type(clearUpdateTag)))
-
-		# Allow bones to perform outstanding "magic" operations before saving to db
-		for bkey, _bone in self.items():
-			_bone.performMagic(self.valuesCache, bkey, isAdd=isAdd)
-
-		# Run our SaveTxn
-		if db.IsInTransaction():
-			key, dbObj, skel, changeList = txnUpdate(key, self, clearUpdateTag)
-		else:
-			key, dbObj, skel, changeList = db.RunInTransaction(txnUpdate, key, self, clearUpdateTag)
-
-		# Perform post-save operations (postProcessSerializedData Hook, Searchindex, ..)
-		self["key"] = key
+				putList.append(blobLockObj)
+			results.append((dbObj.key, dbObj, skel, changeList, isAdd))
+
+		# Check if the requested values are really unique and lock them
+		lockKeys = list(requestedLocks.keys())
+		for lockKey, lockObj in zip(lockKeys, db.Get(lockKeys)):
+			owner, boneName, value = requestedLocks[lockKey]
+			if lockObj:
+				if lockObj["references"] == owner:
+					continue  # We already hold that lock
+				if releasedLocks.get(lockKey) != lockObj["references"]:
+					# This value has already been claimed, and not by an entry giving it up in this batch
+					raise ValueError("The unique value '%s' of bone '%s' has been recently claimed!" % (value, boneName))
+			# This value is locked for the first time (or handed over), create a new lock-object
+			newLockObj = db.Entity(lockKey)
+			newLockObj["references"] = owner
+			putList.append(newLockObj)
+
+		# Remove any lock-object we're holding for values that we don't have anymore
+		deleteList = releasedRelationalLocks
+		releaseKeys = [x for x in releasedLocks.keys() if x not in requestedLocks]
+		for lockKey, lockObj in zip(releaseKeys, db.Get(releaseKeys)):
+			if not lockObj:
+				logging.critical("Detected Database corruption! Could not delete stale lock-object!")
+			elif lockObj["references"] != releasedLocks[lockKey]:
+				# We've been supposed to have that lock - but we don't.
+				# Don't remove that lock as it now belongs to a different entry
+				logging.critical("Detected Database corruption! A Value-Lock had been reassigned!")
+			else:
+				# It's our lock which we don't need anymore
+				deleteList.append(lockKey)
 
-		for boneName, bone in skel.items():
-			bone.postSavedHandler(skel, boneName, key)
+		# Remove released locks from the lists older versions stored on the referenced entities
+		putList.extend(releaseLegacyRelationalLocks(releasedLegacyRelationalLocks, {x[0]: x[1] for x in results}))
 
-		skel.postSavedHandler(key, dbObj)
+		if maxMutations and len(entries) > 1 and len(putList) + len(deleteList) > maxMutations:
+			raise _MutationLimitExceeded()
 
-		if not clearUpdateTag and not isAdd:
-			updateRelations(key.to_legacy_urlsafe().decode("ASCII"), time() + 1, changeList if len(changeList) < 30 else None)
+		# Write the core entries, blob-locks and unique-locks back
+		db.Put(putList)
+		if deleteList:
+			db.Delete(deleteList)
+		return results
 
-		# Inform the custom DB Adapter of the changes made to the entry
-		if self.customDatabaseAdapter:
-			self.customDatabaseAdapter.updateEntry(dbObj, skel, changeList, isAdd)
+	def _updateSEOKeys(self, dbObj):
+		"""
+			Ensures that the SEO-Keys stored in dbObj["viur"] match the ones returned by
+			:func:`~server.skeleton.Skeleton.getCurrentSEOKeys`.
 
-		return key
+			:param dbObj: The entity that's about to be written
+			:type dbObj: db.Entity
+		"""
+		lastRequestedSeoKeys = dbObj["viur"].get("viurLastRequestedSeoKeys") or {}
+		lastSetSeoKeys = dbObj["viur"].get("viurCurrentSeoKeys") or {}
+		currentSeoKeys = self.getCurrentSEOKeys()
+		if not isinstance(dbObj["viur"].get("viurCurrentSeoKeys"), dict):
+			dbObj["viur"]["viurCurrentSeoKeys"] = {}
+		if currentSeoKeys:
+			# Convert to lower-case and remove certain characters
+			for lang, value in list(currentSeoKeys.items()):
+				value = value.lower()
+				value = value.replace("<", "") \
+					.replace(">", "") \
+					.replace("\"", "") \
+					.replace("'", "") \
+					.replace("\n", "") \
+					.replace("\0", "") \
+					.replace("/", "") \
+					.replace("\\", "") \
+					.replace("?", "") \
+					.replace("&", "") \
+					.replace("#", "").strip()
+				currentSeoKeys[lang] = value
+		for language in (conf["viur.availableLanguages"] or [conf["viur.defaultLanguage"]]):
+			if currentSeoKeys and language in currentSeoKeys:
+				currentKey = currentSeoKeys[language]
+				if currentKey != lastRequestedSeoKeys.get(language):  # This one is new or has changed
+					newSeoKey = currentSeoKeys[language]
+					for _ in range(0, 3):
+						entryUsingKey = db.Query(self.kindName).filter("viurActiveSeoKeys AC", newSeoKey).get()
+						if entryUsingKey and entryUsingKey.name != dbObj.name:
+							# It's not unique; append a random string and try again
+							newSeoKey = "%s-%s" % (currentSeoKeys[language], utils.generateRandomString(5).lower())
+						else:
+							break
+					else:
+						raise ValueError("Could not generate an unique seo key in 3 attempts")
+				else:
+					newSeoKey = currentKey
+				lastSetSeoKeys[language] = newSeoKey
+			else:
+				# We'll use the database-key instead
+				lastSetSeoKeys[language] = dbObj.key.id_or_name
+			# Store the current, active key for that language
+			dbObj["viur"]["viurCurrentSeoKeys"][language] = lastSetSeoKeys[language]
+		if not dbObj["viur"].get("viurActiveSeoKeys"):
+			dbObj["viur"]["viurActiveSeoKeys"] = []
+		for language, seoKey in lastSetSeoKeys.items():
+			if dbObj["viur"]["viurCurrentSeoKeys"][language] not in dbObj["viur"]["viurActiveSeoKeys"]:
+				# Ensure the current, active seo key is in the list of all seo keys
+				dbObj["viur"]["viurActiveSeoKeys"].insert(0, seoKey)
+		if dbObj.key.id_or_name not in dbObj["viur"]["viurActiveSeoKeys"]:
+			# Ensure that key is also in there
+			dbObj["viur"]["viurActiveSeoKeys"].insert(0, str(dbObj.key.id_or_name))
+		# Trim to the last 200 used entries
+		dbObj["viur"]["viurActiveSeoKeys"] = dbObj["viur"]["viurActiveSeoKeys"][:200]
+		# Store lastRequestedKeys so further updates can run more efficient
+		dbObj["viur"]["viurLastRequestedSeoKeys"] = currentSeoKeys
 
 	def preProcessBlobLocks(self, locks):
 		"""
@@ -906,65 +1135,144 @@ class Skeleton(BaseSkeleton, metaclass=MetaSkel):
 		"""
 			Deletes the entity associated with the current Skeleton from the data store.
 		"""
+		key = self["key"]
+		if key is None:
+			raise ValueError("This skeleton is not in the database (anymore?)!")
+		self.deleteMulti([key])
+
+	@classmethod
+	def deleteMulti(cls, keys: List[Union[db.KeyClass, str]], batchSize: int = 50) -> None:
+		"""
+			Deletes multiple entities of this kind from the data store at once.
+
+			Works like :func:`~server.skeleton.Skeleton.delete`, but the entities and their lock-objects
+			are fetched and removed using batched requests. Up to *batchSize* entities are deleted inside
+			one transaction; batches that would exceed the mutations allowed in one commit are split.
+			Once all entities are gone, each bone is informed about the whole set by
+			:func:`server.bones.baseBone.postDeletedHandlerMulti`.
+
+			:param keys: The keys of the entities to delete
+			:type keys: list of db.Key | list of str
+			:param batchSize: Maximum amount of entities deleted inside one transaction.
+			:type batchSize: int
+		"""
+		dbKeys = [db.keyHelper(x, cls.kindName) for x in keys]
+		skels = []
+		for dbKey, dbObj in zip(dbKeys, db.Get(dbKeys)):
+			if dbObj is None:
+				raise ValueError("The entity %s is not in the database (anymore?)!" % str(dbKey))
+			skel = cls()
+			skel.setValues(dbObj)
+			skels.append(skel)
+		if db.IsInTransaction():
+			dbObjs = cls._txnDeleteMulti(list(zip(dbKeys, skels)))
+		else:
+			dbObjs = _runInBatchedTransactions(cls._txnDeleteMulti, list(zip(dbKeys, skels)), batchSize)
+		if skels:
+			for boneName, _bone in skels[0].items():
+				_bone.postDeletedHandlerMulti(skels, boneName, dbKeys)
+		for dbKey, dbObj, skel in zip(dbKeys, dbObjs, skels):
+			skel.postDeletedHandler(dbKey)
+
+			# Inform the custom DB Adapter
+			if cls.customDatabaseAdapter:
+				cls.customDatabaseAdapter.deleteEntry(dbObj, skel)
+
+		# Remove cached responses depending on these entries
+		invalidateCacheEntries(dbKeys)
+
+	@classmethod
+	def _txnDeleteMulti(cls, entries, maxMutations=None):
+		"""
+			Removes the given entities, their value-locks and blob-locks.
+			Must be called inside a transaction.
 
-		def txnDelete(key: str, skel: Skeleton):
-			skelKey = (self.kindName, key)
-			dbObj = db.Get(skelKey)  # Fetch the raw object as we might have to clear locks
-			if dbObj.get("viur_incomming_relational_locks"):
+			:param entries: List of (key, skel) tuples; skel holds the current values of the entity to delete
+			:param maxMutations: If set, :exc:`_MutationLimitExceeded` is raised before anything is written if
+				more than one entry is given and they need more mutations than this.
+			:returns: The raw entities that have been deleted
+		"""
+		dbKeys = [x[0] for x in entries]
+		skels = [x[1] for x in entries]
+		dbObjs = db.Get(dbKeys)  # Fetch the raw objects as we might have to clear locks
+		deleteList = list(dbKeys)
+		putList = []
+		releasedLegacyRelationalLocks = []  # (destKey, srcKey) of locks written by an older version
+		for dbKey, dbObj, skel in zip(dbKeys, dbObjs, skels):
+			if dbObj is None:
+				raise ValueError("The entity %s is not in the database (anymore?)!" % str(dbKey))
+			# viur_incomming_relational_locks had been used by previous versions to store these locks
+			if dbObj.get("viur_incomming_relational_locks") or hasIncomingRelationalLocks(dbKey):
 				raise errors.Locked("This entry is locked!")
 			for boneName, bone in skel.items():
 				# Ensure that we delete any value-lock objects remaining for this entry
 				if bone.unique:
-					try:
-						if "%s_uniqueIndexValue" % boneName in dbObj:
-							db.Delete((
-								"%s_%s_uniquePropertyIndex" % (skel.kindName, boneName),
-								dbObj["%s_uniqueIndexValue" % boneName]))
-
-					except db.EntityNotFoundError:
-						raise
-						pass
-			# Delete the blob-key lock object
-			lockObjectKey = ("viur-blob-locks", str(key))
-			try:
-				lockObj = db.Get(lockObjectKey)
-			except:
-				lockObj = None
-			if lockObj is not None:
-				if lockObj["old_blob_references"] is None and lockObj["active_blob_references"] is None:
-					db.Delete(lockObjectKey)  # Nothing to do here
-				else:
-					if lockObj["old_blob_references"] is None:
-						# No old stale entries, move active_blob_references -> old_blob_references
-						lockObj["old_blob_references"] = lockObj["active_blob_references"]
-					elif lockObj["active_blob_references"] is not None:
-						# Append the current references to the list of old & stale references
-						lockObj["old_blob_references"] += lockObj["active_blob_references"]
-					lockObj["active_blob_references"] = []  # There are no active ones left
-					lockObj["is_stale"] = True
-					lockObj["has_old_blob_references"] = True
-					db.Put(lockObj)
-			db.Delete(skelKey)
-			processRemovedRelations(skelKey)
-			return dbObj
+					for lockValue in (dbObj.get("viur") or {}).get("%s_uniqueIndexValue" % boneName) or []:
+						deleteList.append(db.Key("%s_%s_uniquePropertyIndex" % (skel.kindName, boneName), lockValue))
+				# Release the locks this entry holds on other entities
+				if isinstance(bone, relationalBone):
+					for destKey in dbObj.get("%s_outgoingRelationalLocks" % boneName) or []:
+						if not isinstance(destKey, db.KeyClass):
+							destKey = db.Key(bone.kind, destKey)
+							releasedLegacyRelationalLocks.append((destKey, dbKey))
+						deleteList.append(getRelationalLockKey(destKey, dbKey, boneName))
+		# Entities deleted in this batch don't need to be updated
+		putList.extend(releaseLegacyRelationalLocks(releasedLegacyRelationalLocks, dict(zip(dbKeys, dbObjs))))
+		# Update the blob-key lock objects
+		lockObjectKeys = [db.Key("viur-blob-locks", x.id_or_name) for x in dbKeys]
+		for lockObjectKey, lockObj in zip(lockObjectKeys, db.Get(lockObjectKeys)):
+			if lockObj is None:
+				continue
+			if lockObj.get("old_blob_references") is None and lockObj.get("active_blob_references") is None:
+				deleteList.append(lockObjectKey)  # Nothing to do here
+			else:
+				if lockObj.get("old_blob_references") is None:
+					# No old stale entries, move active_blob_references -> old_blob_references
+					lockObj["old_blob_references"] = lockObj["active_blob_references"]
+				elif lockObj.get("active_blob_references") is not None:
+					# Append the current references to the list of old & stale references
+					lockObj["old_blob_references"] += lockObj["active_blob_references"]
+				lockObj["active_blob_references"] = []  # There are no active ones left
+				lockObj["is_stale"] = True
+				lockObj["has_old_blob_references"] = True
+				putList.append(lockObj)
+		if maxMutations and len(entries) > 1 and len(putList) + len(deleteList) > maxMutations:
+			raise _MutationLimitExceeded()
+		if putList:
+			db.Put(putList)
+		db.Delete(deleteList)
+		for dbKey in dbKeys:
+			processRemovedRelations((dbKey.kind, dbKey.id_or_name))
+		return dbObjs
+
+
+class _MutationLimitExceeded(Exception):
+	"""
+		Raised inside the transactions run by :func:`_runInBatchedTransactions` if a batch needs more mutations
+		than allowed in one commit. Nothing has been written then.
+	"""
+	pass
 
-		key = self["key"]
-		if key is None:
-			raise ValueError("This skeleton is not in the database (anymore?)!")
-		skel = type(self)()
-		if not skel.fromDB(key):
-			raise ValueError("This skeleton is not in the database (anymore?)!")
-		if db.IsInTransaction():
-			dbObj = txnDelete(key, skel)
-		else:
-			dbObj = db.RunInTransaction(txnDelete, key, skel)
-		for boneName, _bone in skel.items():
-			_bone.postDeletedHandler(skel, boneName, key)
-		skel.postDeletedHandler(key)
 
-		# Inform the custom DB Adapter
-		if self.customDatabaseAdapter:
-			self.customDatabaseAdapter.deleteEntry(dbObj, skel)
+def _runInBatchedTransactions(callee: Callable, entries: List, batchSize: int, *args) -> List:
+	"""
+		Calls callee(batch, \*args, maxMutations=...) for batches of up to *batchSize* entries, each inside its
+		own transaction. A batch raising :exc:`_MutationLimitExceeded` is split in halves, which are run again.
+		A single entry is always written, so the datastore decides if it's too large.
+
+		:returns: The concatenated results of all calls, in the order of *entries*
+	"""
+	# One mutation is left for the marker written if tasks are deferred inside that transaction
+	maxMutations = db.MAX_MUTATIONS_PER_COMMIT - 1
+	res = []
+	pending = [entries[idx: idx + batchSize] for idx in range(0, len(entries), batchSize)]
+	while pending:
+		batch = pending.pop(0)
+		try:
+			res.extend(db.RunInTransaction(callee, batch, *args, maxMutations=maxMutations))
+		except _MutationLimitExceeded:
+			pending[0:0] = [batch[:len(batch) // 2], batch[len(batch) // 2:]]
+	return res
 
 
 class RelSkel(BaseSkeleton):
@@ -1011,9 +1319,14 @@ class RelSkel(BaseSkeleton):
 		return complete
 
 	def serialize(self):
+		serializers = self.__serializers__
+		boneMap = self.__boneMap__
 		for key, _bone in self.items():
 			if key in self.valuesCache.accessedValues:
-				_bone.serialize(self.valuesCache, key)
+				if key in serializers and _bone is boneMap[key]:
+					serializers[key](self.valuesCache, key)
+				else:
+					_bone.serialize(self.valuesCache, key)
 		# if "key" in self:  # Write the key seperatly, as the base-bone doesn't store it
 		#	dbObj["key"] = self["key"]
 		# FIXME: is this a good idea? Any other way to ensure only bones present in refKeys are serialized?
@@ -1079,6 +1392,283 @@ class RefSkel(RelSkel):
 		return skel
 
 
+_scheduledRelationalRefreshes = set()  # Names of the persistRelationalRefresh tasks created by this instance
+
+
+def refreshRelations(skel: BaseSkeleton, valuesCaches: List[SkeletonValues],
+					 trigger: Union[None, RelationalRefresh] = None) -> None:
+	"""
+		Refreshes the values the relationalBones of *skel* copied from the entities they reference.
+
+		The referenced entities of all given valuesCaches (eg. all entries of a :class:`SkelList`) and all
+		relationalBones are fetched using one batched request and updated in place.
+
+		When an entry is saved, the time its values have been refreshed is stored for each bone
+		(as viur.<boneName>_refreshedAt). On read, bones using RelationalRefresh.OnRead are only refreshed if
+		that time is more than their refreshTTL seconds ago; the refreshed values are then written back by
+		:func:`persistRelationalRefresh`, so following reads don't have to fetch them again. Refreshing on read
+		is skipped inside transactions, as the additional reads would enlarge the transaction's read set.
+
+		:param skel: The skeleton describing the valuesCaches
+		:param valuesCaches: The values to refresh
+		:param trigger: RelationalRefresh.OnSave or RelationalRefresh.OnRead to refresh only bones whose
+			refreshPolicy includes that event; None to refresh every bone (except for updateLevel 2)
+	"""
+	if trigger == RelationalRefresh.OnRead and db.IsInTransaction():
+		return
+	relationalBones = []
+	for boneName, bone in skel.items():
+		if not isinstance(bone, relationalBone) or bone.updateLevel == 2:
+			continue
+		if trigger and bone.refreshPolicy.value < trigger.value:
+			continue
+		relationalBones.append((boneName, bone))
+	if not relationalBones or not valuesCaches:
+		return
+	now = time()
+	refreshList = []  # (valuesCache, boneName, bone) to refresh
+	requestedKeys = set()
+	for valuesCache in valuesCaches:
+		skel.setValuesCache(valuesCache)
+		refreshTimes = (valuesCache.entity.get("viur") if valuesCache.entity else None) or {}
+		for boneName, bone in relationalBones:
+			if boneName not in valuesCache.accessedValues and not (valuesCache.entity and boneName in valuesCache.entity):
+				continue  # Don't populate bones that are not set
+			if trigger == RelationalRefresh.OnRead \
+					and (refreshTimes.get("%s_refreshedAt" % boneName) or 0) > now - bone.refreshTTL:
+				continue  # These values are recent enough
+			refreshList.append((valuesCache, boneName, bone))
+			requestedKeys.update(bone.getReferencedKeys(skel, boneName))
+	requestedKeys = list(requestedKeys)
+	entities = dict(zip(requestedKeys, db.Get(requestedKeys)))
+	outdatedKeys = {}  # Entries read with outdated values -> smallest refreshTTL of these bones
+	for valuesCache, boneName, bone in refreshList:
+		skel.setValuesCache(valuesCache)
+		bone.refreshReferencedValues(skel, boneName, entities)
+		if trigger == RelationalRefresh.OnRead and valuesCache.entity and valuesCache.entity.key:
+			key = valuesCache.entity.key
+			outdatedKeys[key] = min(outdatedKeys.get(key, bone.refreshTTL), bone.refreshTTL)
+	for key, refreshTTL in outdatedKeys.items():
+		urlsafeKey = key.to_legacy_urlsafe().decode("ASCII")
+		# One task per entry and refresh window, regardless of how often it's read until that task ran
+		taskName = "relationalRefresh-%s-%s" % (
+			sha256(urlsafeKey.encode("UTF-8")).hexdigest(), int(now // max(refreshTTL, 1)))
+		if taskName in _scheduledRelationalRefreshes:
+			continue
+		if len(_scheduledRelationalRefreshes) > 1000:
+			_scheduledRelationalRefreshes.clear()
+		_scheduledRelationalRefreshes.add(taskName)
+		persistRelationalRefresh(key.kind, urlsafeKey, _name=taskName)
+
+
+@callDeferred
+def persistRelationalRefresh(kindName: str, key: str) -> None:
+	"""
+		Writes the values copied by the relationalBones using RelationalRefresh.OnRead of the given entry back,
+		if they're outdated.
+
+		Only these bones and their refresh times are written; other values are left untouched, so the entry
+		isn't marked as changed. It's scheduled as a named task once per entry and refresh window (see
+		:func:`refreshRelations`) and does nothing if another run has refreshed them already.
+	"""
+	skelCls = skeletonByKind(kindName)
+	if not skelCls:
+		return
+	dbKey = db.KeyClass.from_legacy_urlsafe(key)
+
+	def txn():
+		dbObj = db.Get(dbKey)
+		if not dbObj:
+			return
+		skel = skelCls()
+		skel.setValues(dbObj)
+		now = time()
+		refreshTimes = dbObj.get("viur") or {}
+		outdatedBones = []
+		for boneName, bone in skel.items():
+			if isinstance(bone, relationalBone) and bone.refreshPolicy == RelationalRefresh.OnRead \
+					and bone.updateLevel != 2 and boneName in dbObj \
+					and (refreshTimes.get("%s_refreshedAt" % boneName) or 0) <= now - bone.refreshTTL:
+				outdatedBones.append((boneName, bone))
+		if not outdatedBones:
+			return
+		requestedKeys = list({x for boneName, bone in outdatedBones for x in bone.getReferencedKeys(skel, boneName)})
+		entities = dict(zip(requestedKeys, db.Get(requestedKeys)))
+		if not isinstance(dbObj.get("viur"), dict):
+			dbObj["viur"] = {}
+		for boneName, bone in outdatedBones:
+			bone.refreshReferencedValues(skel, boneName, entities)
+			# The entities referenced are the same, so keep the locks exactly as they are
+			relationalLocks = dbObj.get("%s_outgoingRelationalLocks" % boneName)
+			bone.serialize(skel.valuesCache, boneName)
+			dbObj["%s_outgoingRelationalLocks" % boneName] = relationalLocks
+			dbObj["viur"]["%s_refreshedAt" % boneName] = now
+		db.Put(dbObj)
+		return True
+
+	if db.RunInTransaction(txn):
+		invalidateCacheEntries([dbKey])
+
+
+class RelationalExpansion(object):
+	"""
+		Holds the entities referenced by relationalBones, resolved to full skeletons for rendering.
+
+		Use :meth:`fromSkels` to build an expansion: all entities referenced by the given entries are fetched
+		with one batched request, then the entities referenced by these (if depth > 1) with the next one, and
+		so on. Only entries of List modules are expanded and only if the current user is allowed to view them;
+		all other references are rendered from their refKeys as usual.
+
+		:ivar depth: How many levels of relations are resolved below the entries currently rendered
+		:vartype depth: int
+	"""
+	maxKeysPerLevel = 1000  # Don't resolve more entries than this on one level
+
+	def __init__(self, entries, depth):
+		self.entries = entries  # Mapping key -> (moduleName, SkeletonValues)
+		self.depth = depth
+
+	def __contains__(self, key):
+		return key in self.entries
+
+	def getSkel(self, key: db.KeyClass) -> Union[None, Skeleton]:
+		"""
+			Returns the viewSkel of the module the given entry belongs to, filled with that entry.
+		"""
+		if key not in self.entries:
+			return None
+		moduleName, valuesCache = self.entries[key]
+		skel = getattr(conf["viur.mainApp"], moduleName).viewSkel()
+		skel.setValuesCache(valuesCache)
+		return skel
+
+	def descend(self) -> Union[None, RelationalExpansion]:
+		"""
+			Returns the expansion used to render the relations of the entries resolved here.
+		"""
+		if self.depth <= 1:
+			return None
+		return RelationalExpansion(self.entries, self.depth - 1)
+
+	@staticmethod
+	def _getModule(bone: relationalBone):
+		from viur.core.prototypes.list import List
+		module = getattr(conf["viur.mainApp"], bone.module, None)
+		if not isinstance(module, List):
+			return None
+		return module
+
+	@staticmethod
+	def _canViewAll(module) -> Union[None, bool]:
+		"""
+			Checks if the current user can view all entries of the given module without checking each entry.
+
+			:returns: True if all entries may be viewed, False if none, None if canView must be checked per entry
+		"""
+		from viur.core.prototypes.list import List
+		if type(module).canView is not List.canView:
+			return None  # It's been overridden and might allow more or less than listFilter
+		query = module.viewSkel().all()
+		origFilters = copy.deepcopy(query.filters)
+		query = module.listFilter(query)
+		if query is None:
+			return False
+		if query.filters == origFilters:
+			return True
+		return None
+
+	@classmethod
+	def fromRequest(cls, skel: BaseSkeleton, valuesCaches: List[SkeletonValues]) -> Union[None, RelationalExpansion]:
+		"""
+			Resolves the relationalBones requested by the *expand* parameter of the current request.
+
+			*expand* is either a depth (all relationalBones are resolved up to that level) or a
+			comma-separated list of bone names (these bones are resolved one level deep).
+
+			:param skel: The skeleton describing the valuesCaches
+			:param valuesCaches: The entries which will be rendered
+			:returns: The expansion, or None if nothing is to be expanded
+		"""
+		from viur.core import request
+		currentRequest = request.current.get()
+		expand = currentRequest.kwargs.get("expand") if currentRequest else None
+		if not expand or not isinstance(expand, str):
+			return None
+		if expand.isdigit():
+			return cls.fromSkels(skel, valuesCaches, depth=int(expand))
+		return cls.fromSkels(skel, valuesCaches, boneNames=[x.strip() for x in expand.split(",")])
+
+	@classmethod
+	def fromSkels(cls, skel: BaseSkeleton, valuesCaches: List[SkeletonValues], depth: int = 1,
+				  boneNames: Union[None, List[str]] = None) -> Union[None, RelationalExpansion]:
+		"""
+			Resolves the relationalBones of the given entries.
+
+			:param skel: The skeleton describing the valuesCaches
+			:param valuesCaches: The entries to expand (eg. all entries of a :class:`SkelList`)
+			:param depth: How many levels of relations should be resolved
+			:param boneNames: If set, only these bones of *skel* are resolved (their relations are resolved
+				completely on the following levels)
+			:returns: The expansion, or None if nothing is to be expanded
+		"""
+		depth = min(depth, conf["viur.render.maxExpandDepth"])
+		if depth < 1 or not valuesCaches:
+			return None
+		origValuesCache = skel.getValuesCache()
+		origRenderPreparation = skel.renderPreparation
+		skel.renderPreparation = None  # We need the raw values
+		entries = {}
+		moduleSkels = {}
+		accessAll = {}
+		level = [(skel, valuesCaches, boneNames)]
+		for currentDepth in range(depth):
+			requestedKeys = {}  # Mapping key -> module
+			for levelSkel, levelValuesCaches, levelBoneNames in level:
+				relationalBones = []
+				for boneName, bone in levelSkel.items():
+					if not isinstance(bone, relationalBone) or (levelBoneNames and boneName not in levelBoneNames):
+						continue
+					if bone.module not in accessAll:
+						module = cls._getModule(bone)
+						accessAll[bone.module] = cls._canViewAll(module) if module else False
+					if accessAll[bone.module] is not False:
+						relationalBones.append((boneName, bone))
+				if not relationalBones:
+					continue
+				for valuesCache in levelValuesCaches:
+					levelSkel.setValuesCache(valuesCache)
+					for boneName, bone in relationalBones:
+						for key in bone.getReferencedKeys(levelSkel, boneName):
+							if key not in entries and key not in requestedKeys:
+								requestedKeys[key] = bone.module
+			if not requestedKeys:
+				break
+			fetchKeys = list(requestedKeys.keys())[:cls.maxKeysPerLevel]
+			newEntries = {}  # Mapping moduleName -> [SkeletonValues]
+			for key, entity in zip(fetchKeys, db.Get(fetchKeys)):
+				if entity is None:
+					continue
+				moduleName = requestedKeys[key]
+				module = getattr(conf["viur.mainApp"], moduleName)
+				if moduleName not in moduleSkels:
+					moduleSkels[moduleName] = module.viewSkel()
+				moduleSkel = moduleSkels[moduleName]
+				if moduleSkel.kindName != key.kind:
+					continue
+				moduleSkel.setValues(entity)
+				if accessAll[moduleName] is None and not module.canView(moduleSkel):
+					continue
+				entries[key] = (moduleName, moduleSkel.getValuesCache())
+				newEntries.setdefault(moduleName, []).append(moduleSkel.getValuesCache())
+			level = [(moduleSkels[moduleName], levelValuesCaches, None)
+					 for moduleName, levelValuesCaches in newEntries.items()]
+		skel.setValuesCache(origValuesCache)
+		skel.renderPreparation = origRenderPreparation
+		if not entries:
+			return None
+		return cls(entries, depth)
+
+
 class SkelList(list):
 	"""
 		This class is used to hold multiple skeletons together with other, commonly used information.
@@ -1117,68 +1707,287 @@ class SkelList(list):
 
 ### Tasks ###
 
+_relationalBonesCache = {}  # Mapping kindName -> {boneName: relationalBone}
+
+
+def getRelationalBones(kindName: str) -> Dict[str, relationalBone]:
+	"""
+		Returns the relationalBones defined on the skeleton of the given kind.
+
+		The result is cached once the system has been initialized (the bones cannot change afterwards),
+		so there's no need to instantiate a skeleton just to inspect its relations.
+
+		:param kindName: Name of the kind
+		:return: Mapping of bone-names to the relationalBone instances
+		:raises: :exc:`AssertionError` if that kind is unknown
+	"""
+	if kindName in _relationalBonesCache:
+		return _relationalBonesCache[kindName]
+	res = {k: v for k, v in skeletonByKind(kindName).__boneMap__.items() if isinstance(v, relationalBone)}
+	if getSystemInitialized():
+		_relationalBonesCache[kindName] = res
+	return res
+
+
+def getRelationalLockKey(destKey: db.KeyClass, srcKey: db.KeyClass, boneName: str) -> db.KeyClass:
+	"""
+		Returns the key of the lock-object created for the entity *srcKey* referencing *destKey*
+		using a relationalBone with RelationalConsistency.PreventDeletion.
+	"""
+	return db.Key("viur-relational-locks", "%s_%s_%s" % (
+		destKey.to_legacy_urlsafe().decode("ASCII"), srcKey.to_legacy_urlsafe().decode("ASCII"), boneName))
+
+
+def releaseLegacyRelationalLocks(locks: List[Tuple[db.KeyClass, db.KeyClass]],
+								 loadedEntities: Dict[db.KeyClass, db.Entity]) -> List[db.Entity]:
+	"""
+		Removes the given locks from the viur_incomming_relational_locks lists, which previous versions stored
+		on the referenced entities instead of viur-relational-locks. Must be called inside a transaction.
+
+		:param locks: Pairs of (key of the referenced entity, key of the entity referencing it)
+		:param loadedEntities: Entities already fetched and written by the caller; these are updated in place
+		:returns: The other referenced entities that have been changed, these must be written by the caller
+	"""
+	fetchKeys = list({destKey for destKey, _ in locks if destKey not in loadedEntities})
+	entities = dict(zip(fetchKeys, db.Get(fetchKeys)))
+	entities.update(loadedEntities)
+	res = {}
+	for destKey, srcKey in locks:
+		entity = entities.get(destKey)
+		if not entity or not entity.get("viur_incomming_relational_locks"):
+			continue
+		# Previous versions stored the name of the referencing entity
+		lockList = [x for x in entity["viur_incomming_relational_locks"] if str(x) != str(srcKey.id_or_name)]
+		if len(lockList) != len(entity["viur_incomming_relational_locks"]):
+			entity["viur_incomming_relational_locks"] = lockList
+			if destKey not in loadedEntities:
+				res[destKey] = entity
+	return list(res.values())
+
+
+def hasIncomingRelationalLocks(key: db.KeyClass) -> bool:
+	"""
+		Checks if the entity *key* is referenced by a relationalBone with RelationalConsistency.PreventDeletion
+		(and therefore must not be deleted). This runs a keys-only query fetching at most one lock-object.
+	"""
+	return bool(db.Query("viur-relational-locks").filter("dest =", key).setKeysOnly().run(1))
+
+
+def _isReferencing(bone: relationalBone, value: Dict, key: db.KeyClass) -> bool:
+	"""
+		Checks if the given value of that relationalBone references the entity *key*
+	"""
+	if not value or not value["dest"]:
+		return False
+	refSkel = bone._refSkelCache
+	refSkel.setValuesCache(value["dest"])
+	return refSkel["key"] == key
+
+
 @callDeferred
 def processRemovedRelations(removedKey, cursor=None):
-	kind, name = removedKey
+	"""
+		Applies the consistency-rules of all relationalBones that referenced the (now deleted) entity *removedKey*.
 
-	updateListQuery = db.Query("viur-relations").filter("dest.key =", name) \
+		References from bones with RelationalConsistency.SetNull are removed, entities referencing it by a bone
+		with RelationalConsistency.CascadeDeletion are deleted. Processes 100 relations and calls the next batch.
+	"""
+	kind, name = removedKey
+	removedDbKey = db.Key(kind, name)
+	updateListQuery = db.Query("viur-relations").filter("dest.__key__ =", removedDbKey) \
 		.filter("viur_dest_kind =", kind).filter("viur_relational_consistency >", 2)
 	updateListQuery = updateListQuery.setCursor(cursor)
-	updateList = updateListQuery.run(limit=5)
+	updateList = updateListQuery.run(limit=100)
+	setNull = {}  # Mapping srcKind -> {srcKey: {boneName, ...}}
+	cascade = {}  # Mapping srcKind -> {srcKey: {boneName, ...}}
+	pagedRemovals = []  # References held by paged bones just need their relation object removed
 	for entry in updateList:
-		skel = skeletonByKind(entry["viur_src_kind"])()
-		assert skel.fromDB(entry["src"]["key"])
-		if entry["viur_relational_consistency"] == 3:  # Set Null
-			for key, _bone in skel.items():
-				if isinstance(_bone, relationalBone):
-					relVal = skel[key]
-					if isinstance(relVal, dict) and relVal["dest"]["entity"]["key"] == name:
-						# FIXME: Should never happen: "key" not in relVal["dest"]
-						# skel.setBoneValue(key, None)
-						skel[key] = None
-					elif isinstance(relVal, list):
-						skel[key] = [x for x in relVal if x["dest"]["key"] != name]
-					else:
-						print("Type? %s" % type(relVal))
-			skel.toDB(clearUpdateTag=True)
+		if entry["viur_relational_consistency"] == RelationalConsistency.SetNull.value:
+			bone = getRelationalBones(entry["viur_src_kind"]).get(entry["viur_src_property"])
+			if bone is not None and bone.paged:
+				pagedRemovals.append(entry.key)
+				continue
+			target = setNull
 		else:
-			logging.critical("Cascading Delete to %s/%s" % (skel.kindName, skel["key"]))
-			skel.delete()
-			pass
+			target = cascade
+		target.setdefault(entry["viur_src_kind"], {}).setdefault(entry["src"].key, set()).add(entry["viur_src_property"])
+	if pagedRemovals:
+		db.Delete(pagedRemovals)
+	for srcKind, srcMap in setNull.items():
+		Skel = skeletonByKind(srcKind)
+		relationalBones = getRelationalBones(srcKind)
+		srcKeys = list(srcMap.keys())
+		skels = []
+		for srcKey, srcEntity in zip(srcKeys, db.Get(srcKeys)):
+			if not srcEntity:
+				continue
+			skel = Skel()
+			skel.setValues(srcEntity)
+			for boneName in srcMap[srcKey]:
+				bone = relationalBones.get(boneName)
+				if not bone:
+					continue
+				relVal = skel[boneName]
+				if isinstance(relVal, dict) and _isReferencing(bone, relVal, removedDbKey):
+					skel[boneName] = None
+				elif isinstance(relVal, list):
+					skel[boneName] = [x for x in relVal if not _isReferencing(bone, x, removedDbKey)]
+			skels.append(skel)
+		Skel.toDBMulti(skels, clearUpdateTag=True)
+	for srcKind, srcMap in cascade.items():
+		srcKeys = list(srcMap.keys())
+		srcKeys = [srcKey for srcKey, srcEntity in zip(srcKeys, db.Get(srcKeys)) if srcEntity]
+		for srcKey in srcKeys:
+			logging.critical("Cascading Delete to %s/%s" % (srcKind, srcKey))
+		skeletonByKind(srcKind).deleteMulti(srcKeys)
+	newCursor = updateListQuery.getCursor()
+	if len(updateList) == 100 and newCursor:
+		if isinstance(newCursor, bytes):
+			newCursor = newCursor.decode("ASCII")
+		processRemovedRelations(removedKey, newCursor)
+
+
+def scheduleUpdateRelations(destKey: db.KeyClass, changeList: Union[None, List[str]]) -> None:
+	"""
+		Requests updating all references to the entity *destKey*.
 
+		The update is deferred by viur.tasks.updateRelationsDelay seconds. All changes made to that
+		entity within that time are coalesced into one single run of :func:`updateRelations`.
+		If that run didn't happen viur.tasks.updateRelationsGracePeriod seconds after it was due (the task
+		got lost or failed permanently), it's scheduled again.
 
-@callDeferred
-def updateRelations(destID, minChangeTime, changeList, cursor=None):
-	logging.error("Updaterelations currently disabled")
-	return
-	logging.debug("Starting updateRelations for %s ; minChangeTime %s, Changelist: %s", destID, minChangeTime,
-				  changeList)
-	updateListQuery = db.Query("viur-relations").filter("dest.key =", destID) \
-		.filter("viur_delayed_update_tag <", minChangeTime).filter("viur_relational_updateLevel =", 0)
-	if changeList:
-		updateListQuery.filter("viur_foreign_keys IA", changeList)
-	if cursor:
-		updateListQuery.cursor(cursor)
-	updateList = updateListQuery.run(limit=5)
-
-	def updateTxn(skel, key, srcRelKey):
-		if not skel.fromDB(key):
-			logging.warning("Cannot update stale reference to %s (referenced from %s)" % (key, srcRelKey))
-			return
-		for key, _bone in skel.items():
-			_bone.refresh(skel.valuesCache, key, skel)
-		skel.toDB(clearUpdateTag=True)
+		:param destKey: Key of the entity that has been changed
+		:param changeList: Names of the bones that have been changed or None if unknown
+	"""
+	scheduleUpdateRelationsMulti([(destKey, changeList)])
 
-	for srcRel in updateList:
-		try:
-			skel = skeletonByKind(srcRel["viur_src_kind"])()
-		except AssertionError:
-			logging.info("Deleting %s which refers to unknown kind %s" % (str(srcRel.key()), srcRel["viur_src_kind"]))
-			continue
-		db.RunInTransaction(updateTxn, skel, srcRel["src"]["key"], srcRel.name)
 
-	if len(updateList) == 5:
-		updateRelations(destID, minChangeTime, changeList, updateListQuery.getCursor().urlsafe())
+def scheduleUpdateRelationsMulti(entries: List[Tuple[db.KeyClass, Union[None, List[str]]]]) -> None:
+	"""
+		Works like :func:`scheduleUpdateRelations` for many changed entities at once. The markers coalescing
+		their updates are read and written using one batched request each (per transaction of up to
+		db.MAX_MUTATIONS_PER_COMMIT markers).
+
+		:param entries: List of (destKey, changeList) tuples
+	"""
+	changes = OrderedDict()  # destID -> names of the bones changed or None if unknown
+	for destKey, changeList in entries:
+		destID = destKey.to_legacy_urlsafe().decode("ASCII")
+		if changeList is None or (destID in changes and changes[destID] is None):
+			changes[destID] = None
+		else:
+			changes[destID] = sorted(set(changes.get(destID) or []) | set(changeList))
+
+	staleAfter = timedelta(seconds=conf["viur.tasks.updateRelationsDelay"] +
+						   conf["viur.tasks.updateRelationsGracePeriod"])
+
+	def txn(destIDs):
+		markerKeys = [db.Key("viur-relations-pending-update", x) for x in destIDs]
+		putList = []
+		res = []  # (destID, changeList) of the updates to schedule
+		for destID, markerKey, marker in zip(destIDs, markerKeys, db.Get(markerKeys)):
+			changeList = changes[destID]
+			if marker and marker["creationdate"].replace(tzinfo=None) > datetime.now() - staleAfter:
+				# There's already an update scheduled, just extend it
+				if marker["changeList"] is not None:
+					marker["changeList"] = None if changeList is None else sorted(set(marker["changeList"]) | set(changeList))
+					putList.append(marker)
+				continue
+			if marker:  # The update scheduled has been lost, schedule it again including its changes
+				logging.warning("Rescheduling stale updateRelations for %s" % destID)
+				if marker["changeList"] is not None and changeList is not None:
+					changeList = sorted(set(marker["changeList"]) | set(changeList))
+				else:
+					changeList = None
+			else:
+				marker = db.Entity(markerKey)
+			marker["changeList"] = changeList
+			marker["creationdate"] = datetime.now()
+			putList.append(marker)
+			res.append((destID, changeList))
+		if putList:
+			db.Put(putList)
+		return res
+
+	destIDs = list(changes.keys())
+	if db.IsInTransaction():
+		scheduled = txn(destIDs)
+	else:
+		scheduled = []
+		for idx in range(0, len(destIDs), db.MAX_MUTATIONS_PER_COMMIT):
+			scheduled.extend(db.RunInTransaction(txn, destIDs[idx: idx + db.MAX_MUTATIONS_PER_COMMIT]))
+	for destID, changeList in scheduled:
+		updateRelations(destID, None, changeList, _countdown=conf["viur.tasks.updateRelationsDelay"])
+
+
+@callDeferred
+def updateRelations(destID, minChangeTime, changeList, cursor=None, srcKind=None, srcProperty=None):
+	"""
+		Updates the values copied from the entity *destID* into the entities referencing it.
+
+		The first call (without *srcKind*) collects the changes scheduled by :func:`scheduleUpdateRelations`
+		and starts one chain of tasks for each relationalBone referencing that kind. These are processed in
+		parallel, each handling up to 50 references per batch.
+	"""
+	if srcKind is None:
+		markerKey = db.Key("viur-relations-pending-update", destID)
+
+		def popMarker():
+			marker = db.Get(markerKey)
+			if marker:
+				db.Delete(markerKey)
+			return marker
+
+		marker = db.RunInTransaction(popMarker)
+		if marker:
+			changeList = marker["changeList"]
+		minChangeTime = max(minChangeTime or 0, time())
+		destKind = db.KeyClass.from_legacy_urlsafe(destID).kind
+		logging.debug("Starting updateRelations for %s ; minChangeTime %s, Changelist: %s", destID, minChangeTime,
+					  changeList)
+		for kindName in listKnownSkeletons():
+			for boneName, bone in getRelationalBones(kindName).items():
+				if bone.kind != destKind or bone.updateLevel != 0:
+					continue
+				if changeList and not set(changeList) & set(bone.refKeys):
+					continue  # None of the values copied by this bone changed
+				updateRelations(destID, minChangeTime, changeList, None, kindName, boneName)
+		return
+	destKey = db.KeyClass.from_legacy_urlsafe(destID)
+	updateListQuery = db.Query("viur-relations").filter("dest.__key__ =", destKey) \
+		.filter("viur_src_kind =", srcKind).filter("viur_src_property =", srcProperty) \
+		.filter("viur_relational_updateLevel =", 0).filter("viur_delayed_update_tag <", minChangeTime)
+	updateListQuery.setCursor(cursor)
+	updateList = updateListQuery.run(limit=50)
+	destEntity = db.Get(destKey)
+	if not updateList or not destEntity:  # Nothing to do or it had been deleted in the meantime
+		return
+	try:
+		Skel = skeletonByKind(srcKind)
+	except AssertionError:
+		logging.info("Ignoring references from unknown kind %s" % srcKind)
+		return
+	bone = getRelationalBones(srcKind).get(srcProperty)
+	if bone is not None and bone.paged:
+		# These references are not stored in the referencing entities, just update the relation objects
+		bone.refreshPagedReferences(updateList, destEntity)
+	else:
+		srcKeys = [x["src"].key for x in updateList]
+		skels = []
+		for srcKey, srcEntity in zip(srcKeys, db.Get(srcKeys)):
+			if not srcEntity:
+				logging.warning("Cannot update stale reference to %s (referenced from %s)" % (destKey, srcKey))
+				continue
+			skel = Skel()
+			skel.setValues(srcEntity)
+			if getattr(skel, srcProperty).refreshReferencedValues(skel, srcProperty, {destKey: destEntity}):
+				skels.append(skel)
+		Skel.toDBMulti(skels, clearUpdateTag=True)
+	newCursor = updateListQuery.getCursor()
+	if len(updateList) == 50 and newCursor:
+		if isinstance(newCursor, bytes):
+			newCursor = newCursor.decode("ASCII")
+		updateRelations(destID, minChangeTime, changeList, newCursor, srcKind, srcProperty)
 
 
 @CallableTask
@@ -1222,53 +2031,241 @@ class TaskUpdateSearchIndex(CallableTaskBase):
 		if module == "*":
 			for module in listKnownSkeletons():
 				logging.info("Rebuilding search index for module '%s'" % module)
-				processChunk(module, compact, None, notify=notify)
+				startRebuildSearchIndex(module, compact, notify=notify)
 		else:
-			processChunk(module, compact, None, notify=notify)
+			startRebuildSearchIndex(module, compact, notify=notify)
+
+	def status(self, module="*", *args, **kwargs):
+		"""
+			Returns the progress of the last rebuild of the given module (see :func:`getSearchIndexRebuildStatus`),
+			or of all modules rebuilt so far if module is "*".
+		"""
+		if module != "*":
+			return getSearchIndexRebuildStatus(module)
+		res = {}
+		for module in listKnownSkeletons():
+			moduleStatus = getSearchIndexRebuildStatus(module)
+			if moduleStatus:
+				res[module] = moduleStatus
+		return res
+
+
+def _keySortOrder(key: db.KeyClass) -> List:
+	"""
+		Returns a sort-key for *key* that matches the order used by the datastore
+		(path-element by path-element, numeric ids before names).
+	"""
+	return [(0, x) if isinstance(x, int) else (1, x) for x in key.flat_path]
+
+
+def _getShardBoundaries(kindName: str, shardCount: int) -> List[db.KeyClass]:
+	"""
+		Splits the given kind into (roughly) equally sized key-ranges.
+
+		We fetch a random sample of keys (by sorting on the __scatter__ property), sort them and
+		pick evenly spaced keys from that sample as the boundaries between two shards.
+
+		:param kindName: The kind to split
+		:param shardCount: The amount of shards requested
+		:return: Sorted list of at most *shardCount*-1 keys
+	"""
+	if shardCount < 2:
+		return []
+	query = db.Query(kindName).order(("__scatter__", db.SortOrder.Ascending)).setKeysOnly()
+	sample = sorted([x.key for x in query.run(shardCount * 32) or []], key=_keySortOrder)
+	boundaries = []
+	for idx in range(1, shardCount):
+		key = sample[int(len(sample) * idx / shardCount)] if sample else None
+		if key is not None and (not boundaries or _keySortOrder(boundaries[-1]) < _keySortOrder(key)):
+			boundaries.append(key)
+	return boundaries
+
+
+def _estimateEntityCount(kindName: str) -> Union[None, int]:
+	"""
+		Returns the amount of entities of the given kind according to the datastore statistics.
+		These are updated only once in a while, so this is just an estimate (or None if unavailable).
+	"""
+	try:
+		stat = db.Query("__Stat_Kind__").filter("kind_name =", kindName).get()
+	except Exception as e:  # Statistics are not available on the emulator
+		logging.debug("Cannot fetch statistics for %s: %s" % (kindName, e))
+		return None
+	return stat["count"] if stat else None
 
 
 @callDeferred
-def processChunk(module, compact, cursor, allCount=0, notify=None):
+def startRebuildSearchIndex(module, compact, notify=None):
 	"""
-		Processes 100 Entries and calls the next batch
+		Splits the given kind into key-ranges and starts rebuilding each of them in parallel.
+		The progress is tracked in the *viur-search-index-rebuild* kind,
+		see :func:`getSearchIndexRebuildStatus`.
 	"""
 	Skel = skeletonByKind(module)
 	if not Skel:
 		logging.error("TaskUpdateSearchIndex: Invalid module")
 		return
-	query = Skel().all().setCursor(cursor)
-	count = 0
-	for obj in query.run(25):
-		count += 1
-		try:
-			skel = Skel()
-			skel.fromDB(obj.key)
-			if compact == "YES":
-				raise NotImplementedError()  # FIXME: This deletes the __currentKey__ property..
-				skel.delete()
-			skel.refresh()
-			skel.toDB(clearUpdateTag=True)
-		except Exception as e:
-			logging.error("Updating %s failed" % str(obj.key))
-			logging.exception(e)
-			raise
-	newCursor = query.getCursor()
-	if not newCursor:  # We're done
+	boundaries = _getShardBoundaries(Skel.kindName, conf["viur.tasks.searchIndexRebuild.shards"])
+	rebuildId = utils.generateRandomString()
+	shardRanges = list(zip([None] + boundaries, boundaries + [None]))
+	statusObj = db.Entity(db.Key("viur-search-index-rebuild", module))
+	statusObj["rebuildId"] = rebuildId
+	statusObj["startdate"] = datetime.now()
+	statusObj["enddate"] = None
+	statusObj["shards"] = len(shardRanges)
+	statusObj["shardsDone"] = 0
+	statusObj["estimatedCount"] = _estimateEntityCount(Skel.kindName)
+	statusObj["processed"] = 0
+	statusObj["notify"] = notify
+	putList = [statusObj]
+	for shardIdx in range(0, len(shardRanges)):
+		shardObj = db.Entity(db.Key("viur-search-index-rebuild-shard", "%s_%s" % (module, shardIdx)))
+		shardObj["rebuildId"] = rebuildId
+		shardObj["module"] = module
+		shardObj["processed"] = 0
+		shardObj["changedate"] = statusObj["startdate"]
+		shardObj["done"] = False
+		putList.append(shardObj)
+	db.Put(putList)
+	logging.info("Rebuilding search index for %s using %s shards" % (module, len(shardRanges)))
+	for shardIdx, (startKey, endKey) in enumerate(shardRanges):
+		processChunk(module, compact, None, notify=notify, rebuildId=rebuildId, shardIdx=shardIdx,
+					 startKey=startKey.to_legacy_urlsafe().decode("ASCII") if startKey else None,
+					 endKey=endKey.to_legacy_urlsafe().decode("ASCII") if endKey else None)
+
+
+def getSearchIndexRebuildStatus(module: str) -> Union[None, Dict]:
+	"""
+		Returns the progress of the last search index rebuild of the given module.
+
+		:param module: Name of the kind
+		:return: None if there was no rebuild yet, otherwise a dictionary containing the amount
+			of shards (and how many of them have finished), the amount of processed entities,
+			the estimated amount of entities in total, the progress (0-1), the throughput in
+			entities per second and the estimated time of completion (if it can be estimated).
+	"""
+	statusObj = db.Get(db.Key("viur-search-index-rebuild", module))
+	if not statusObj:
+		return None
+	shardKeys = [db.Key("viur-search-index-rebuild-shard", "%s_%s" % (module, x)) for x in range(0, statusObj["shards"])]
+	shardObjs = [x for x in db.Get(shardKeys) if x and x["rebuildId"] == statusObj["rebuildId"]]
+	processed = sum([x["processed"] for x in shardObjs])
+	endTime = statusObj["enddate"] or max([x["changedate"] for x in shardObjs] + [statusObj["startdate"]])
+	duration = (endTime - statusObj["startdate"]).total_seconds()
+	throughput = processed / duration if duration > 0 else 0
+	progress = eta = None
+	if statusObj["enddate"]:
+		progress = 1
+	elif statusObj["estimatedCount"]:
+		progress = min(processed / statusObj["estimatedCount"], 1)
+		if throughput:
+			eta = datetime.now() + timedelta(seconds=max(statusObj["estimatedCount"] - processed, 0) / throughput)
+	return {
+		"module": module,
+		"startdate": statusObj["startdate"],
+		"enddate": statusObj["enddate"],
+		"shards": statusObj["shards"],
+		"shardsDone": statusObj["shardsDone"],
+		"processed": processed,
+		"estimatedCount": statusObj["estimatedCount"],
+		"progress": progress,
+		"throughput": throughput,
+		"eta": eta,
+	}
+
+
+def _finishRebuildShard(module, rebuildId):
+	"""
+		Marks one shard of the given rebuild as finished. Returns the status entity if that has been the last one.
+	"""
+
+	def txn():
+		statusObj = db.Get(db.Key("viur-search-index-rebuild", module))
+		if not statusObj or statusObj["rebuildId"] != rebuildId:
+			return None
+		statusObj["shardsDone"] += 1
+		if statusObj["shardsDone"] < statusObj["shards"]:
+			db.Put(statusObj)
+			return None
+		statusObj["enddate"] = datetime.now()
+		db.Put(statusObj)
+		return statusObj
+
+	statusObj = db.RunInTransaction(txn)
+	if statusObj:
+		statusObj["processed"] = getSearchIndexRebuildStatus(module)["processed"]
+		db.Put(statusObj)
+	return statusObj
+
+
+@callDeferred
+def processChunk(module, compact, cursor, allCount=0, notify=None, rebuildId=None, shardIdx=0, startKey=None,
+				 endKey=None):
+	"""
+		Processes one chunk of entries of the given shard and calls the next one
+	"""
+	Skel = skeletonByKind(module)
+	if not Skel:
+		logging.error("TaskUpdateSearchIndex: Invalid module")
 		return
-	newCursor = newCursor.decode("ASCII")
-	logging.info("END processChunk %s, %d records refreshed" % (module, count))
-	if count and newCursor and newCursor != cursor:
+	shardKey = db.Key("viur-search-index-rebuild-shard", "%s_%s" % (module, shardIdx))
+	if rebuildId:
+		shardObj = db.Get(shardKey)
+		if not shardObj or shardObj["rebuildId"] != rebuildId:
+			logging.info("Rebuild %s of %s has been superseded, stopping" % (rebuildId, module))
+			return
+	chunkSize = conf["viur.tasks.searchIndexRebuild.chunkSize"]
+	query = Skel().all()
+	if startKey:
+		query.filter("%s >=" % db.KEY_SPECIAL_PROPERTY, db.KeyClass.from_legacy_urlsafe(startKey))
+	if endKey:
+		query.filter("%s <" % db.KEY_SPECIAL_PROPERTY, db.KeyClass.from_legacy_urlsafe(endKey))
+	query.setCursor(cursor)
+	skels = []
+	for obj in query.run(chunkSize):
+		if compact == "YES":
+			raise NotImplementedError()  # FIXME: This deletes the __currentKey__ property..
+		skel = Skel()
+		skel.setValues(obj)  # No need to fetch that entity again
+		skel.refreshBones()
+		skels.append(skel)
+	refreshRelations(Skel(), [x.valuesCache for x in skels])  # One batched Get for the whole chunk
+	try:
+		Skel.toDBMulti(skels, clearUpdateTag=True, refreshRelationalBones=False)
+	except Exception as e:
+		logging.error("Updating %s failed" % ", ".join([str(x["key"]) for x in skels]))
+		logging.exception(e)
+		raise
+	count = len(skels)
+	newCursor = query.getCursor()
+	if isinstance(newCursor, bytes):
+		newCursor = newCursor.decode("ASCII")
+	isDone = not (count == chunkSize and newCursor and newCursor != cursor)
+	logging.info("END processChunk %s (shard %s), %d records refreshed" % (module, shardIdx, count))
+	if rebuildId:
+		shardObj["processed"] = allCount + count
+		shardObj["changedate"] = datetime.now()
+		shardObj["done"] = isDone
+		db.Put(shardObj)
+	if not isDone:
 		# Start processing of the next chunk
-		processChunk(module, compact, newCursor, allCount + count, notify)
+		processChunk(module, compact, newCursor, allCount + count, notify, rebuildId, shardIdx, startKey, endKey)
+		return
+	if rebuildId:
+		statusObj = _finishRebuildShard(module, rebuildId)
+		if not statusObj:  # There are other shards still running
+			return
+		allCount = statusObj["processed"]
 	else:
-		try:
-			if notify:
-				txt = ("Subject: Rebuild search index finished for %s\n\n" +
-					   "ViUR finished to rebuild the search index for module %s.\n" +
-					   "%d records updated in total on this kind.") % (module, module, allCount)
-				utils.sendEMail([notify], txt, None)
-		except:  # OverQuota, whatever
-			pass
+		allCount += count
+	try:
+		if notify:
+			txt = ("Subject: Rebuild search index finished for %s\n\n" +
+				   "ViUR finished to rebuild the search index for module %s.\n" +
+				   "%d records updated in total on this kind.") % (module, module, allCount)
+			utils.sendEMail([notify], txt, None)
+	except:  # OverQuota, whatever
+		pass
 
 
 ### Vacuum Relations
@@ -1305,48 +2302,76 @@ class TaskVacuumRelations(CallableTaskBase):
 		processVacuumRelationsChunk(module.strip(), None, notify=notify)
 
 
+def _excludingFilters(prop: str, values: List[str]) -> List[List[List]]:
+	"""
+		Returns a list of filter-sets that together match all values of *prop* except the given ones.
+		Each set is a list of [filter, value] pairs selecting one gap between two (sorted) values.
+	"""
+	if not values:
+		return [[]]
+	values = sorted(values)
+	res = [[["%s <" % prop, values[0]]]]
+	for lower, upper in zip(values, values[1:]):
+		res.append([["%s >" % prop, lower], ["%s <" % prop, upper]])
+	res.append([["%s >" % prop, values[-1]]])
+	return res
+
+
+def _buildVacuumRanges(module: str) -> List[List[List]]:
+	"""
+		Builds the filter-sets matching exactly the relation objects that must be removed by the vacuum,
+		that are relation objects whose source kind is unknown or whose source property is not a
+		relationalBone of that kind (anymore).
+	"""
+	knownKinds = listKnownSkeletons()
+	if module == "*":
+		kinds = knownKinds
+		ranges = _excludingFilters("viur_src_kind", knownKinds)  # Kinds not existing in this data model
+	elif module not in knownKinds:
+		return [[["viur_src_kind =", module]]]
+	else:
+		kinds = [module]
+		ranges = []
+	for kind in kinds:
+		for filters in _excludingFilters("viur_src_property", list(getRelationalBones(kind).keys())):
+			ranges.append([["viur_src_kind =", kind]] + filters)
+	return ranges
+
+
 @callDeferred
-def processVacuumRelationsChunk(module, cursor, allCount=0, removedCount=0, notify=None):
+def processVacuumRelationsChunk(module, cursor, allCount=0, removedCount=0, notify=None, ranges=None):
 	"""
-		Processes 100 Entries and calls the next batch
+		Removes up to 100 stale relation objects matching the first of the given ranges and calls the next batch.
+
+		The ranges are built from the cached relationalBones of each kind, so everything they match can be
+		deleted using keys-only queries without having to look at the relation objects themselves.
 	"""
-	query = db.Query("viur-relations")
-	if module != "*":
-		query.filter("viur_src_kind =", module)
-	query.cursor(cursor)
-	countTotal = 0
+	if ranges is None:
+		ranges = _buildVacuumRanges(module)
 	countRemoved = 0
-	for relationObject in query.run(25):
-		countTotal += 1
-		srcKind = relationObject.get("viur_src_kind")
-		if not srcKind:
-			logging.critical("We got an relation-object without a srcKind!")
-			continue
-		srcProp = relationObject.get("viur_src_property")
-		if not srcProp:
-			logging.critical("We got an relation-object without a srcProp!")
-			continue
-		try:
-			skel = skeletonByKind(srcKind)()
-		except AssertionError:
-			# The referenced skeleton does not exist in this data model -> drop that relation object
-			logging.info("Deleting %r which refers to unknown kind %s", str(relationObject.key()), srcKind)
-			db.Delete(relationObject)
-			countRemoved += 1
-			continue
-		if srcProp not in skel:
-			logging.info("Deleting %r which refers to non-existing relationalBone %s of %s",
-						 str(relationObject.key()), srcProp, srcKind)
-			db.Delete(relationObject)
-			countRemoved += 1
-	newCursor = query.getCursor()
-	newTotalCount = allCount + countTotal
+	newCursor = None
+	if ranges:
+		query = db.Query("viur-relations").setKeysOnly()
+		for filterStr, value in ranges[0]:
+			query.filter(filterStr, value)
+		query.setCursor(cursor)
+		staleKeys = [x.key for x in query.run(100)]
+		db.Delete(staleKeys)
+		countRemoved = len(staleKeys)
+		if countRemoved == 100:
+			newCursor = query.getCursor()
+			if isinstance(newCursor, bytes):
+				newCursor = newCursor.decode("ASCII")
+	newTotalCount = allCount + countRemoved
 	newRemovedCount = removedCount + countRemoved
 	logging.info("END processVacuumRelationsChunk %s, %d records processed, %s removed " % (
 		module, newTotalCount, newRemovedCount))
-	if countTotal and newCursor and newCursor.urlsafe() != cursor:
-		# Start processing of the next chunk
-		processVacuumRelationsChunk(module, newCursor.urlsafe(), newTotalCount, newRemovedCount, notify)
+	if newCursor and newCursor != cursor:
+		# Continue with the next chunk of the current range
+		processVacuumRelationsChunk(module, newCursor, newTotalCount, newRemovedCount, notify, ranges)
+	elif len(ranges) > 1:
+		# Start processing of the next range
+		processVacuumRelationsChunk(module, None, newTotalCount, newRemovedCount, notify, ranges[1:])
 	else:
 		try:
 			if notify:
@@ -9,6 +9,7 @@ import json
 import logging
 import os, sys
 from google.cloud import tasks_v2
+from google.api_core.exceptions import AlreadyExists
 from google.protobuf import timestamp_pb2
 from typing import Dict, List, Callable
 
@@ -65,6 +66,13 @@ class CallableTaskBase:
 		"""
 		raise NotImplemented()
 
+	def status(self, *args, **kwargs):
+		"""
+			If the progress of this task can be determined, return it here (as a json-serializable dict).
+			It's available to users allowed to call this task, see :meth:`TaskHandler.status`.
+		"""
+		return (None)
+
 
 class TaskHandler:
 	"""
@@ -287,6 +295,21 @@ class TaskHandler:
 
 	execute.exposed = True
 
+	def status(self, taskID, *args, **kwargs):
+		"""Returns the progress of a specific task as json (null if it doesn't report one)"""
+		global _callableTasks
+		if taskID in _callableTasks:
+			task = _callableTasks[taskID]()
+		else:
+			raise errors.NotFound()
+		if not task.canCall():
+			raise errors.Unauthorized()
+		request.current.get().response.headers["Content-Type"] = "application/json"
+		return json.dumps(task.status(*args, **kwargs),
+						  default=lambda x: x.isoformat() if isinstance(x, datetime) else str(x))
+
+	status.exposed = True
+
 
 TaskHandler.admin = True
 TaskHandler.vi = True
@@ -322,6 +345,8 @@ def callDeferred(func):
 		if not queueRegion:
 			# Run tasks inline
 			logging.error("Running inline: %s" % func)
+			for x in ("countdown", "eta", "name", "target", "retry_options", "transactional", "queue"):
+				kwargs.pop("_%s" % x, None)  # These are only meaningful for the task queue
 			if self is __undefinedFlag_:
 				func(*args, **kwargs)
 			else:
@@ -398,9 +423,16 @@ def callDeferred(func):
 				timestamp.FromDatetime(datetime.utcnow() + timedelta(seconds=taskargs["countdown"]))
 				task['schedule_time'] = timestamp
 			task['app_engine_http_request']['body'] = pickled
+			if taskargs.get("name"):
+				# Named tasks are only created once; the queue rejects the same name for some time after it ran
+				task['name'] = taskClient.task_path(project, location, queue, taskargs["name"])
 
 			# Use the client to build and send the task.
-			response = taskClient.create_task(parent, task)
+			try:
+				response = taskClient.create_task(parent, task)
+			except AlreadyExists:
+				logging.debug("Task %s has already been created" % taskargs["name"])
+				return
 
 			print('Created task {}'.format(response.name))
 
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+	Imports this repository as viur.core for the tests, as a project would: The server is linked into a
+	temporary project directory as viur/core, next to the skeletons in tests/skeletons. The datastore is
+	replaced by an in-memory stand-in, so no project or credentials are needed.
+
+	Install the dependencies listed in tests/requirements.txt to run them.
+"""
+import os
+
+# The protobuf modules of google-cloud-logging 1.x can't be loaded by the C++ implementation
+os.environ.setdefault("PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION", "python")
+os.environ.setdefault("GAE_ENV", "localdev")
+
+import google.auth
+from google.cloud import datastore
+from google.auth.credentials import AnonymousCredentials
+from contextlib import contextmanager
+import atexit, copy, itertools, logging, shutil, sys, tempfile, threading, types
+
+
+class LocalQuery(object):
+	"""
+		Stand-in for google.cloud.datastore.Query, evaluated against the entities of a LocalDatastore.
+		Supports the filters, sort orders and offset cursors used by viur.core.db.Query.
+	"""
+	operators = {
+		"=": lambda a, b: a == b,
+		"<": lambda a, b: a < b,
+		"<=": lambda a, b: a <= b,
+		">": lambda a, b: a > b,
+		">=": lambda a, b: a >= b,
+	}
+
+	def __init__(self, client, kind):
+		super(LocalQuery, self).__init__()
+		self.client = client
+		self.kind = kind
+		self.filters = []
+		self.order = []
+		self.keysOnly = False
+
+	def add_filter(self, name, op, value):
+		self.filters.append((name, self.operators[op], value))
+
+	def keys_only(self):
+		self.keysOnly = True
+
+	@staticmethod
+	def getValues(entity, name):
+		value = entity.get(name)
+		if value is None and "." in name:  # Properties of embedded entities
+			value = entity
+			for part in name.split("."):
+				value = value.get(part) if isinstance(value, dict) else None
+		if name == "__key__":
+			value = entity.key
+		return value if isinstance(value, list) else [value]
+
+	@staticmethod
+	def comparable(value):
+		if isinstance(value, datastore.Key):  # Keys are ordered path-element by path-element, ids before names
+			return [(0, x) if isinstance(x, int) else (1, x) for x in value.flat_path]
+		return value
+
+	def matches(self, entity):
+		for name, op, value in self.filters:
+			try:
+				if not any([x is not None and op(self.comparable(x), self.comparable(value))
+							for x in self.getValues(entity, name)]):
+					return False
+			except TypeError:  # Values of different types never match
+				return False
+		return True
+
+	def fetch(self, limit=None, start_cursor=None, end_cursor=None):
+		with self.client.lock:
+			res = [copy.deepcopy(x) for x in self.client.entities.values() if x.key.kind == self.kind and self.matches(x)]
+		for order in reversed(self.order):
+			name = order.lstrip("-")
+			res.sort(key=lambda x: str(min(self.getValues(x, name), key=str)), reverse=order.startswith("-"))
+		start = int(start_cursor or 0)
+		end = min(int(end_cursor), len(res)) if end_cursor else len(res)
+		if limit is not None:
+			end = min(end, start + limit)
+		res = res[start:end]
+		if self.keysOnly:
+			for entity in res:
+				entity.clear()
+		return types.SimpleNamespace(pages=iter([res]), next_page_token=str(end).encode("ASCII") if res else None)
+
+
+class LocalDatastore(object):
+	"""
+		Stand-in for google.cloud.datastore.Client keeping all entities in memory.
+		Transactions are serialized by a global lock.
+	"""
+	project = "viur-test"
+
+	def __init__(self, *args, **kwargs):
+		super(LocalDatastore, self).__init__()
+		self.entities = {}
+		self.lock = threading.RLock()
+		self.local = threading.local()
+		self.ids = itertools.count(1)
+
+	def key(self, *pathArgs, **kwargs):
+		kwargs.setdefault("project", self.project)
+		return datastore.Key(*pathArgs, **kwargs)
+
+	def get(self, key):
+		with self.lock:
+			return copy.deepcopy(self.entities.get(key))
+
+	def get_multi(self, keys):
+		return [x for x in [self.get(key) for key in keys] if x is not None]
+
+	def put(self, entity):
+		self.put_multi([entity])
+
+	def put_multi(self, entities):
+		with self.lock:
+			for entity in entities:
+				if entity.key.is_partial:
+					entity.key = entity.key.completed_key(next(self.ids))
+				self.entities[entity.key] = copy.deepcopy(entity)
+
+	def delete(self, key):
+		self.delete_multi([key])
+
+	def delete_multi(self, keys):
+		with self.lock:
+			for key in keys:
+				self.entities.pop(key, None)
+
+	def query(self, kind):
+		return LocalQuery(self, kind)
+
+	def allocate_ids(self, incompleteKey, num):
+		return [incompleteKey.completed_key(next(self.ids)) for _ in range(num)]
+
+	@property
+	def current_transaction(self):
+		return getattr(self.local, "transaction", None)
+
+	@contextmanager
+	def transaction(self):
+		with self.lock:
+			self.local.transaction = types.SimpleNamespace(id=os.urandom(8))
+			try:
+				yield self.local.transaction
+			finally:
+				self.local.transaction = None
+
+
+def importServer():
+	"""
+		Imports this repository as viur.core, using the datastore stand-in and anonymous credentials.
+	"""
+	google.auth.default = lambda *args, **kwargs: (AnonymousCredentials(), LocalDatastore.project)
+	datastore.Client = LocalDatastore
+	testDir = os.path.dirname(os.path.abspath(__file__))
+	projectDir = tempfile.mkdtemp(prefix="viur-test-")
+	atexit.register(shutil.rmtree, projectDir, True)
+	os.mkdir(os.path.join(projectDir, "viur"))
+	os.symlink(os.path.dirname(testDir), os.path.join(projectDir, "viur", "core"))
+	os.symlink(os.path.join(testDir, "skeletons"), os.path.join(projectDir, "skeletons"))
+	os.chdir(projectDir)  # Skeletons are located relative to the project directory
+	sys.path.insert(0, projectDir)
+	import viur.core
+	from viur.core import request, securityheaders
+	from viur.core.bones import bone
+	# What viur.core.setup() does besides building the application from the project's modules
+	securityheaders._rebuildCspHeaderCache()
+	bone.setSystemInitialized()
+	import skeletons  # Before pytest finds them in tests/, outside of the project directory
+	logging.getLogger().removeHandler(request.handler)  # Don't send anything to stackdriver
+	request.reqLogger.log_text = lambda *args, **kwargs: None
+	return viur.core
+
+
+server = importServer()
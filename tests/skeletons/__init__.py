@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+"""
+	Skeletons used by the tests. Linked into the test project as skeletons/, as the skeletons of an
+	application would be.
+"""
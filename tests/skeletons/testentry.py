@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+from viur.core.skeleton import Skeleton
+from viur.core.bones import stringBone
+
+
+class testentrySkel(Skeleton):
+	name = stringBone(descr="Name", indexed=True)
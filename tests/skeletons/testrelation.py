@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+from viur.core.skeleton import Skeleton
+from viur.core.bones import stringBone, relationalBone
+from viur.core.bones.relationalBone import RelationalRefresh
+
+
+class testrelationSkel(Skeleton):
+	name = stringBone(descr="Name", indexed=True)
+	entry = relationalBone(descr="Entry", kind="testentry", refreshPolicy=RelationalRefresh.OnRead, refreshTTL=60)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+	Tests for Skeleton.toDBMulti and Skeleton.deleteMulti splitting their transactions.
+"""
+import pytest
+from conftest import server
+from viur.core import db
+from skeletons.testentry import testentrySkel
+
+
+@pytest.fixture
+def mutationsPerCommit(monkeypatch):
+	"""
+		Lowers the mutations allowed in one commit and returns a list receiving the amount of mutations
+		of each transaction.
+	"""
+	monkeypatch.setattr(db, "MAX_MUTATIONS_PER_COMMIT", 8)
+	client = db.__client__
+	res = []
+	putMulti, deleteMulti, transaction = client.put_multi, client.delete_multi, client.transaction
+
+	def countedPutMulti(entities):
+		if client.current_transaction:
+			res[-1] += len(entities)
+		putMulti(entities)
+
+	def countedDeleteMulti(keys):
+		if client.current_transaction:
+			res[-1] += len(keys)
+		deleteMulti(keys)
+
+	def countedTransaction():
+		res.append(0)
+		return transaction()
+
+	monkeypatch.setattr(client, "put_multi", countedPutMulti)
+	monkeypatch.setattr(client, "delete_multi", countedDeleteMulti)
+	monkeypatch.setattr(client, "transaction", countedTransaction)
+	return res
+
+
+def test_batchesAreSplitByMutations(mutationsPerCommit):
+	skels = []
+	for idx in range(0, 10):
+		skel = testentrySkel()
+		skel["name"] = "batch entry %s" % idx
+		skels.append(skel)
+	keys = testentrySkel.toDBMulti(skels)  # Each entry needs two mutations: the entity and its blob-lock
+	assert [db.Get(x)["name"] for x in keys] == ["batch entry %s" % idx for idx in range(0, 10)]
+	committed = [x for x in mutationsPerCommit if x]
+	assert sum(committed) == 20
+	assert max(committed) < 8
+	del mutationsPerCommit[:]
+	testentrySkel.deleteMulti(keys)
+	assert not any(db.Get(keys))
+	committed = [x for x in mutationsPerCommit if x]
+	assert sum(committed) == 20
+	assert max(committed) < 8
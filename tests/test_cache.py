@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+	Tests for the two tiers (in-process and datastore) of viur.core.cache.
+"""
+from conftest import server
+from viur.core import cache, conf
+from datetime import datetime
+from hashlib import sha256
+from time import time
+
+
+def test_waitForRebuildSkipsOutdatedMemory(monkeypatch):
+	monkeypatch.setitem(conf, "viur.cache.rebuildLeaseTime", 5)
+	key = sha256(b"test_waitForRebuildSkipsOutdatedMemory").hexdigest()
+	# Rebuilt by another instance, while this one still holds the previous version in memory
+	cache.putCacheEntry(key, {"data": "rebuilt", "creationtime": datetime.now(), "path": "/test"})
+	cache.memoryCache.put(key, {"data": "outdated", "creationtime": datetime.now(), "path": "/test"})
+
+	def getEntry(skipMemory=False):
+		entry = cache.getCacheEntry(key, skipMemory=skipMemory)
+		return entry if entry and entry["data"] == "rebuilt" else None
+
+	start = time()
+	assert cache.waitForRebuild(key, getEntry)["data"] == "rebuilt"
+	assert time() - start < 1
+	assert cache.getCacheEntry(key)["data"] == "rebuilt"  # And the in-process copy has been replaced
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+	Tests for the conditional requests (ETag / If-None-Match) answered by the json render.
+"""
+import pytest
+import webob
+from conftest import server
+from viur.core import conf, exposed
+from viur.core.render.json.default import DefaultRender
+from skeletons.testentry import testentrySkel
+
+
+@exposed
+def entries(*args, **kwargs):
+	skel = testentrySkel()
+	skellist = skel.all().fetch()
+	return DefaultRender().list(skellist)
+
+
+@exposed
+def entry(key, *args, **kwargs):
+	skel = testentrySkel()
+	assert skel.fromDB(key)
+	return DefaultRender().view(skel)
+
+
+@pytest.fixture
+def application(monkeypatch):
+	monkeypatch.setitem(conf, "viur.mainResolver", {"entries": entries, "entry": entry})
+	monkeypatch.setitem(conf, "viur.forceSSL", False)
+	monkeypatch.setitem(conf, "viur.conditionalRequests", True)
+	return server.app
+
+
+def addEntry(name):
+	skel = testentrySkel()
+	skel["name"] = name
+	return skel.toDB()
+
+
+def callApp(application, path, etag=None):
+	req = webob.Request.blank(path)
+	if etag:
+		req.headers["If-None-Match"] = '"%s"' % etag
+	return req.get_response(application)
+
+
+def test_listIsAnsweredWithNotModified(application):
+	addEntry("first")
+	addEntry("second")
+	res = callApp(application, "/entries")
+	assert res.status_code == 200, res.text
+	assert sorted([x["name"] for x in res.json["skellist"]]) == ["first", "second"]
+	assert res.etag
+	res = callApp(application, "/entries", res.etag)
+	assert res.status_code == 304
+	assert not res.body
+
+
+def test_listChangesItsETag(application):
+	res = callApp(application, "/entries")
+	assert res.status_code == 200, res.text
+	addEntry("third")
+	res2 = callApp(application, "/entries", res.etag)
+	assert res2.status_code == 200, res2.text
+	assert res2.etag != res.etag
+
+
+def test_viewIsAnsweredWithNotModified(application):
+	key = addEntry("fourth")
+	res = callApp(application, "/entry/%s" % key.to_legacy_urlsafe().decode("ASCII"))
+	assert res.status_code == 200, res.text
+	assert res.json["values"]["name"] == "fourth"
+	res = callApp(application, "/entry/%s" % key.to_legacy_urlsafe().decode("ASCII"), res.etag)
+	assert res.status_code == 304
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+	Tests for the algorithms of viur.core.ratelimit.RateLimit.
+"""
+from conftest import server
+from viur.core import ratelimit, db
+from datetime import datetime, timedelta
+
+stepStart = 60.0 * 1000  # Start of a step of one minute
+
+
+def test_slidingWindowWeightsTheOldestStep(monkeypatch):
+	backend = ratelimit.MemoryBackend()
+	rateLimit = ratelimit.RateLimit("test", 4, 1, lambda: "client", backend=backend, algorithm="sliding")
+	expires = datetime.now() + timedelta(minutes=2)
+	for _ in range(0, 4):
+		backend.incr("test-client-999", expires)  # The previous step
+	for _ in range(0, 2):
+		backend.incr("test-client-1000", expires)  # The current step
+	monkeypatch.setattr(ratelimit, "time", lambda: stepStart + 15)
+	assert rateLimit.getRetryAfter() == 15  # 2 + 4 * 0.75 calls in the last minute
+	monkeypatch.setattr(ratelimit, "time", lambda: stepStart + 31)
+	assert rateLimit.getRetryAfter() == 0  # 2 + 4 * 0.48 calls
+	assert rateLimit.acquire() == (True, 0)
+	assert backend.getMulti(["test-client-1000"])["test-client-1000"] == 3
+
+
+def test_slidingWindowRejectsOverLimit():
+	backend = ratelimit.MemoryBackend()
+	rateLimit = ratelimit.RateLimit("test", 3, 1, lambda: "client", backend=backend, algorithm="sliding")
+	assert [rateLimit.acquire()[0] for _ in range(0, 4)] == [True, True, True, False]
+	assert 1 <= rateLimit.getRetryAfter() <= 60
+
+
+def test_tokenBucketRejectsOnConflicts():
+	class ConflictingBackend(ratelimit.MemoryBackend):
+		def update(self, key, func, expires):
+			raise db.Conflict("Too much contention on these datastore entities")
+
+	rateLimit = ratelimit.RateLimit("test", 10, 1, lambda: "client", backend=ConflictingBackend(),
+									algorithm="tokenBucket")
+	isAllowed, retryAfter = rateLimit.acquire()
+	assert not isAllowed
+	assert retryAfter >= 1
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+	Tests for relationalBones refreshing the values they copied from the referenced entities on read.
+"""
+import pytest
+from conftest import server
+from viur.core import db, skeleton
+from skeletons.testentry import testentrySkel
+from skeletons.testrelation import testrelationSkel
+
+
+def referencedNames(skellist):
+	refSkel = testrelationSkel.entry._refSkelCache
+	res = []
+	for skel in skellist:
+		refSkel.setValuesCache(skel["entry"]["dest"])
+		res.append(refSkel["name"])
+	return res
+
+
+@pytest.fixture
+def outdatedRelation():
+	"""
+		Returns the key of an entry referencing a testentry that has been renamed since its values were copied.
+	"""
+	entrySkel = testentrySkel()
+	entrySkel["name"] = "old name"
+	entryKey = entrySkel.toDB()
+	relSkel = testrelationSkel()
+	relSkel["name"] = "relation"
+	assert relSkel.setBoneValue("entry", entryKey)
+	relKey = relSkel.toDB()
+	# Rename the referenced entity without scheduling updateRelations
+	entryObj = db.Get(entryKey)
+	entryObj["name"] = "new name"
+	db.Put(entryObj)
+	relObj = db.Get(relKey)
+	relObj["viur"]["entry_refreshedAt"] = 0
+	db.Put(relObj)
+	yield relKey
+	db.Delete([entryKey, relKey])
+
+
+def test_fetchRefreshesOutdatedValues(outdatedRelation):
+	skellist = testrelationSkel().all().filter("name =", "relation").fetch()
+	assert referencedNames(skellist) == ["new name"]
+	# Written back by persistRelationalRefresh (running inline here)
+	relObj = db.Get(outdatedRelation)
+	assert relObj["entry"]["dest"]["name"] == "new name"
+	assert relObj["viur"]["entry_refreshedAt"] > 0
+
+
+def test_refreshIsScheduledOncePerWindow(outdatedRelation, monkeypatch):
+	scheduled = []
+	monkeypatch.setattr(skeleton, "persistRelationalRefresh", lambda *args, **kwargs: scheduled.append(kwargs["_name"]))
+	for _ in range(0, 3):
+		skellist = testrelationSkel().all().filter("name =", "relation").fetch()
+		assert referencedNames(skellist) == ["new name"]
+	assert len(scheduled) == 1
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+	Tests for rebuilding the search index and reporting its progress.
+"""
+import pytest
+import webob
+from conftest import server
+from viur.core import conf, db, skeleton, utils
+from viur.core.tasks import TaskHandler
+from skeletons.testentry import testentrySkel
+from skeletons.testrelation import testrelationSkel
+
+
+@pytest.fixture
+def application(monkeypatch):
+	taskHandler = TaskHandler("_tasks", "/_tasks")
+	monkeypatch.setitem(conf, "viur.mainResolver", {"_tasks": {"status": taskHandler.status}})
+	monkeypatch.setitem(conf, "viur.forceSSL", False)
+	return server.app
+
+
+def test_rebuildStatusIsExposed(application, monkeypatch):
+	entrySkel = testentrySkel()
+	entrySkel["name"] = "referenced entry"
+	entryKey = entrySkel.toDB()
+	relSkel = testrelationSkel()
+	relSkel["name"] = "rebuilt relation"
+	assert relSkel.setBoneValue("entry", entryKey)
+	relSkel.toDB()
+	relationCount = len([x for x in db.__client__.entities if x.kind == "testrelation"])
+	fetchedKeys = []
+	getMulti = db.__client__.get_multi
+	monkeypatch.setattr(db.__client__, "get_multi", lambda keys: fetchedKeys.extend(keys) or getMulti(keys))
+	skeleton.startRebuildSearchIndex("testrelation", "")  # Runs inline
+	assert fetchedKeys.count(entryKey) == 1  # Its values are refreshed once, not again by toDBMulti
+
+	res = webob.Request.blank("/_tasks/status/rebuildSearchIndex?module=testrelation").get_response(application)
+	assert res.status_code == 401
+	monkeypatch.setattr(utils, "getCurrentUser", lambda: {"key": None, "name": "root", "access": ["root"]})
+	res = webob.Request.blank("/_tasks/status/rebuildSearchIndex?module=testrelation").get_response(application)
+	assert res.status_code == 200, res.text
+	assert res.json["module"] == "testrelation"
+	assert res.json["processed"] == relationCount
+	assert res.json["progress"] == 1
+	assert res.json["enddate"]
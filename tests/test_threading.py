@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+	Stress test for threaded workers: Hammers app() from many threads at once and checks that the
+	current request, the session and skeleton values never leak from one request into another.
+"""
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+import random, time
+import webob
+from conftest import server
+from viur.core import request, session, db, conf, exposed
+from viur.core.skeleton import RelSkel
+from viur.core.bones import stringBone
+
+
+class ProbeSkel(RelSkel):
+	name = stringBone(descr="Name")
+
+
+@exposed
+def probe(token, *args, **kwargs):
+	"""
+		Stores *token* in the current session and a skeleton, waits a bit so other requests
+		run in between, then reports what this request sees.
+	"""
+	currentRequest = request.current.get()
+	previousToken = session.current.get("token")
+	session.current["token"] = token
+	skel = ProbeSkel()
+	skel["name"] = token
+	time.sleep(random.random() / 100)
+	return "|".join([
+		str(previousToken),
+		currentRequest.args[0] if request.current.get() is currentRequest else "request changed",
+		str(session.current.get("token")),
+		str(skel["name"]),
+		repr(ProbeSkel()["name"])
+	])
+
+
+@pytest.fixture
+def application(monkeypatch):
+	monkeypatch.setitem(conf, "viur.mainResolver", {"probe": probe})
+	monkeypatch.setitem(conf, "viur.forceSSL", False)
+	return server.app
+
+
+def callApp(application, path, cookies=None):
+	req = webob.Request.blank(path)
+	if cookies:
+		req.headers["Cookie"] = "; ".join(["%s=%s" % x for x in cookies.items()])
+	res = req.get_response(application)
+	assert res.status_code == 200, res.text
+	return res
+
+
+def runClient(application, clientIdx):
+	"""
+		Sends a few requests using the same session, as a browser would do.
+	"""
+	cookies = {}
+	previousToken = None
+	for requestIdx in range(0, 5):
+		token = "client%s-request%s" % (clientIdx, requestIdx)
+		res = callApp(application, "/probe/%s" % token, cookies)
+		assert res.text == "|".join([str(previousToken), token, token, token, "''"])
+		# Nothing is left behind in this worker thread
+		assert request.current.get() is None
+		assert session.current.get("token") is None
+		for cookie in res.headers.getall("Set-Cookie"):
+			name, value = cookie.split(";")[0].split("=", 1)
+			cookies[name] = value
+		previousToken = token
+
+
+def test_concurrentRequestsStayIsolated(application):
+	with ThreadPoolExecutor(max_workers=16) as executor:
+		futures = [executor.submit(runClient, application, clientIdx) for clientIdx in range(0, 64)]
+		for future in futures:
+			future.result()
+	assert len([x for x in db.__client__.entities if x.kind == "viur-session"]) == 64
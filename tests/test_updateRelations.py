@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+	Tests for scheduling updateRelations after entries have been changed.
+"""
+from conftest import server
+from viur.core import db, skeleton
+from skeletons.testentry import testentrySkel
+
+
+def test_markersAreWrittenPerBatch(monkeypatch):
+	skels = []
+	for idx in range(0, 5):
+		skel = testentrySkel()
+		skel["name"] = "scheduled entry %s" % idx
+		skels.append(skel)
+	keys = testentrySkel.toDBMulti(skels)  # Added, there's nothing referencing them yet
+	scheduled = []
+	monkeypatch.setattr(skeleton, "updateRelations", lambda *args, **kwargs: scheduled.append(args))
+	transactions = []
+	transaction = db.__client__.transaction
+	monkeypatch.setattr(db.__client__, "transaction", lambda: transactions.append(1) or transaction())
+
+	for skel in skels:
+		skel["name"] += " (changed)"
+	testentrySkel.toDBMulti(skels)
+	assert len(transactions) == 2  # One writing the entries, one writing the markers
+	assert sorted([x[0] for x in scheduled]) == sorted([x.to_legacy_urlsafe().decode("ASCII") for x in keys])
+	assert all([x[2] == ["name"] for x in scheduled])
+
+	del scheduled[:]
+	testentrySkel.toDBMulti(skels)  # Changed again before the update ran; it's coalesced into that one
+	assert not scheduled
@@ -8,7 +8,7 @@ import string, random, base64
 from viur.core import conf
 import logging
 import google.auth
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import hashlib
 import hmac
 from quopri import decodestring
@@ -202,6 +202,70 @@ def getCurrentUser():
 	return user
 
 
+def conditionalRequest(validatorData: Any, lastModified: Union[None, datetime] = None) -> bool:
+	"""
+		Sets the ETag (and Last-Modified) header of the current response and checks if the client already
+		has that version of the response (If-None-Match / If-Modified-Since).
+
+		The ETag is derived from *validatorData*, the current path, request parameters, language, user and
+		application version. *validatorData* must therefore include everything else the response depends on,
+		f.e. the keys and changedates of the entries rendered.
+
+		:param validatorData: Any data with a stable string representation identifying the response
+		:param lastModified: The date of the last change to the data included in the response, if known
+		:returns: True if the client's copy is still valid. The response status has been set to 304 then and
+			the caller should return an empty body instead of rendering the response.
+	"""
+	from viur.core import request
+	currentRequest = request.current.get()
+	if not conf["viur.conditionalRequests"] or not currentRequest or currentRequest.internalRequest \
+			or currentRequest.isPostRequest or currentRequest.disableCache:
+		return False
+	user = getCurrentUser()
+	etag = hashlib.sha256(str([
+		validatorData,
+		currentRequest.request.path,
+		sorted(currentRequest.kwargs.items()),
+		currentRequest.language,
+		user["key"] if user else None,
+		os.environ.get("GAE_VERSION"),
+		conf["viur.version"]
+	]).encode("UTF-8")).hexdigest()
+	return answerConditionalRequest(etag, lastModified)
+
+
+def answerConditionalRequest(etag: str, lastModified: Union[None, datetime] = None) -> bool:
+	"""
+		Sets the given ETag (and Last-Modified) header of the current response and checks if the client already
+		has that version of the response. Used by :func:`conditionalRequest` and to answer requests served
+		from the cache with the validators stored along with the entry.
+
+		:param etag: The ETag of the response (without quotes)
+		:param lastModified: The date of the last change to the data included in the response, if known
+		:returns: True if the client's copy is still valid. The response status has been set to 304 then.
+	"""
+	from viur.core import request
+	currentRequest = request.current.get()
+	if not conf["viur.conditionalRequests"] or not currentRequest or currentRequest.internalRequest \
+			or currentRequest.isPostRequest or currentRequest.disableCache:
+		return False
+	currentRequest.response.etag = etag
+	if lastModified:
+		if lastModified.tzinfo is None:  # Naive dates stored by this application are in UTC
+			lastModified = lastModified.replace(tzinfo=timezone.utc)
+		currentRequest.response.last_modified = lastModified
+	if currentRequest.request.if_none_match:
+		isValid = etag in currentRequest.request.if_none_match
+	elif lastModified and currentRequest.request.if_modified_since:
+		# HTTP-Dates don't include microseconds
+		isValid = lastModified.replace(microsecond=0) <= currentRequest.request.if_modified_since
+	else:
+		isValid = False
+	if isValid:
+		currentRequest.response.status = 304
+	return isValid
+
+
 def markFileForDeletion(dlkey):
 	"""
 	Adds a marker to the data store that the file specified as *dlkey* can be deleted.